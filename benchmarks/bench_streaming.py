@@ -0,0 +1,174 @@
+"""
+Benchmark del streaming de archivos: generadores anteriores vs RangeFileResponse.
+
+Cada cliente simulado recibe la respuesta completa a través de un socketpair
+cuyo extremo lector se vacía en un hilo aparte, de modo que todos los modos
+pagan el mismo costo de socket. Se mide el throughput (Gbit/s) y el tiempo de
+CPU del proceso por Gbit enviado.
+
+`engine_sendfile` simula un servidor ASGI que anuncia la extensión
+`http.response.zerocopysend`. uvicorn no la anuncia, así que en producción
+rige `engine_pread`; ese modo es la referencia para comparar.
+
+Uso:
+    python -m benchmarks.bench_streaming --size-mb 256 --clients 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from starlette.responses import StreamingResponse  # noqa: E402
+
+from services.streaming import (  # noqa: E402
+    CHUNK_SIZE,
+    ZEROCOPY_EXTENSION,
+    RangeFileResponse,
+)
+
+
+# ============================
+# 🐢 GENERADORES ANTERIORES
+# ============================
+def legacy_aiofiles_response(file_path: str, file_size: int):
+    import aiofiles
+
+    async def iterfile(start=0, end=None):
+        async with aiofiles.open(file_path, "rb") as f:
+            await f.seek(start)
+            remaining = (end - start + 1) if end else (file_size - start)
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                yield chunk
+                remaining -= len(chunk)
+
+    return StreamingResponse(iterfile(), media_type="video/mp4")
+
+
+def legacy_sync_response(file_path: str, file_size: int):
+    def iterfile(start=0, end=None):
+        with open(file_path, "rb") as f:
+            f.seek(start)
+            remaining = (end - start + 1) if end else (file_size - start)
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                yield chunk
+                remaining -= len(chunk)
+
+    return StreamingResponse(iterfile(), media_type="audio/mpeg")
+
+
+def engine_response(file_path: str, file_size: int):
+    return RangeFileResponse(file_path, [(0, file_size - 1)], media_type="video/mp4")
+
+
+# ============================
+# 🔌 SERVIDOR ASGI SIMULADO
+# ============================
+def _drain(sock: socket.socket):
+    while sock.recv(1024 * 1024):
+        pass
+    sock.close()
+
+
+async def serve_one(response, zerocopy: bool) -> int:
+    loop = asyncio.get_running_loop()
+    writer, reader = socket.socketpair()
+    writer.setblocking(False)
+    drain = threading.Thread(target=_drain, args=(reader,), daemon=True)
+    drain.start()
+    sent = 0
+    done = asyncio.Event()
+
+    async def receive():
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal sent
+        if message["type"] == "http.response.body":
+            body = message.get("body", b"")
+            if body:
+                await loop.sock_sendall(writer, body)
+                sent += len(body)
+        elif message["type"] == ZEROCOPY_EXTENSION:
+            sent += await loop.sock_sendfile(
+                writer, message["file"], message["offset"], message["count"]
+            )
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "extensions": {ZEROCOPY_EXTENSION: {}} if zerocopy else {},
+    }
+    await response(scope, receive, send)
+    done.set()
+    writer.close()
+    await asyncio.get_running_loop().run_in_executor(None, drain.join)
+    return sent
+
+
+async def run_mode(factory, file_path, file_size, clients, zerocopy=False):
+    responses = [factory(file_path, file_size) for _ in range(clients)]
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    sent = await asyncio.gather(*(serve_one(r, zerocopy) for r in responses))
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    gbits = sum(sent) * 8 / 1e9
+    return {
+        "bytes": sum(sent),
+        "segundos": round(wall, 3),
+        "gbit_s": round(gbits / wall, 3),
+        "cpu_s_por_gbit": round(cpu / gbits, 4),
+    }
+
+
+MODES = {
+    "legacy_aiofiles": (legacy_aiofiles_response, False),
+    "legacy_sync": (legacy_sync_response, False),
+    "engine_pread": (engine_response, False),
+    "engine_sendfile": (engine_response, True),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=128)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--modes", nargs="*", default=list(MODES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, "sample.bin")
+        with open(file_path, "wb") as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(args.size_mb):
+                f.write(block)
+        file_size = os.path.getsize(file_path)
+
+        results = {}
+        for name in args.modes:
+            factory, zerocopy = MODES[name]
+            results[name] = asyncio.run(
+                run_mode(factory, file_path, file_size, args.clients, zerocopy)
+            )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
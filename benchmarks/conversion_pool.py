@@ -0,0 +1,151 @@
+"""
+Arnés del pool de conversiones usando el doble de ffmpeg (fake_ffmpeg.py).
+
+Encola una ráfaga de trabajos de varios propietarios sobre un directorio
+temporal y verifica que:
+  - nunca corren más procesos que `--workers`,
+  - los audios (prioridad alta) se despachan antes que los videos,
+  - los propietarios se turnan dentro de una misma prioridad,
+  - se pueden cancelar tareas en cola y en ejecución.
+
+Uso:
+    python -m benchmarks.conversion_pool --workers 2 --jobs 12
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def wait_all(manager, task_ids, timeout=60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        states = [manager.get_task(t)["estado"] for t in task_ids]
+        if all(s in ("listo", "error", "cancelado") for s in states):
+            return states
+        time.sleep(0.05)
+    raise TimeoutError("Las tareas no terminaron a tiempo")
+
+
+def owners_take_turns(manager, queued, positions):
+    """En cada prioridad, la primera ronda de la cola no repite propietario."""
+    by_priority = {}
+    still_queued = [t for t in queued if positions.get(t)]
+    for task_id in sorted(still_queued, key=lambda t: positions[t]):
+        task = manager.get_task(task_id)
+        by_priority.setdefault(task["prioridad"], []).append(task["propietario"])
+    for owners in by_priority.values():
+        first_round = owners[: len(set(owners))]
+        if len(set(first_round)) != len(first_round):
+            return False
+    return True
+
+
+def audio_before_video(manager, queued, positions):
+    """En la cola, ningún audio debe quedar detrás de un video."""
+    still_queued = [t for t in queued if positions.get(t)]
+    kinds = [
+        manager.get_task(t)["tipo"]
+        for t in sorted(still_queued, key=lambda t: positions[t])
+    ]
+    return "audio" not in kinds[kinds.index("video") :] if "video" in kinds else True
+
+
+def max_concurrency(records):
+    events = sorted(
+        [(r["start"], 1) for r in records] + [(r["end"], -1) for r in records]
+    )
+    running = peak = 0
+    for _, delta in events:
+        running += delta
+        peak = max(peak, running)
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--jobs", type=int, default=12)
+    parser.add_argument("--seconds", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp)
+        log_path = base / "ffmpeg.log"
+        os.environ["FFMPEG_BIN"] = (
+            f"{sys.executable} {ROOT / 'benchmarks' / 'fake_ffmpeg.py'}"
+        )
+        os.environ["FAKE_FFMPEG_SECONDS"] = str(args.seconds)
+        os.environ["FAKE_FFMPEG_LOG"] = str(log_path)
+
+        from sqlmodel import SQLModel, create_engine
+        from services.conversion_manager import ConversionManager
+
+        for sub in ("videos", "audios"):
+            (base / "content" / sub).mkdir(parents=True)
+        engine = create_engine(
+            f"sqlite:///{base / 'tasks.db'}", connect_args={"check_same_thread": False}
+        )
+        SQLModel.metadata.create_all(engine)
+        manager = ConversionManager(base, max_workers=args.workers, engine=engine)
+
+        task_ids = []
+        for i in range(args.jobs):
+            tipo = "video" if i % 2 == 0 else "audio"
+            owner = ("ana", "beto", "carla")[i % 3]
+            folder = "videos" if tipo == "video" else "audios"
+            name = f"job{i}.{'mp4' if tipo == 'video' else 'mp3'}"
+            (base / "content" / folder / name).write_bytes(os.urandom(1024))
+            fmt = "mov" if tipo == "video" else "wav"
+            task_id = manager.start_conversion(name, fmt, tipo, owner=owner)
+            task_ids.append(task_id)
+
+        queued = [t for t in task_ids if manager.get_task(t)["estado"] == "en_cola"]
+        positions = {t: manager.get_task(t).get("posicion_cola") for t in queued}
+        turns_ok = owners_take_turns(manager, queued, positions)
+        audio_first = audio_before_video(manager, queued, positions)
+        cancelled_queued = queued[-1] if queued else None
+        if cancelled_queued:
+            manager.cancel(cancelled_queued)
+
+        time.sleep(args.seconds / 4)
+        running = [t for t in task_ids if manager.get_task(t)["estado"] == "procesando"]
+        cancelled_running = running[0] if running else None
+        if cancelled_running:
+            manager.cancel(cancelled_running)
+
+        states = wait_all(manager, task_ids)
+        records = [json.loads(line) for line in log_path.read_text().splitlines()]
+
+    checks = {
+        "concurrencia_maxima": max_concurrency(records),
+        "concurrencia_ok": max_concurrency(records) <= args.workers,
+        "audios_primero_ok": audio_first,
+        "posiciones_cola": sorted(p for p in positions.values() if p),
+        "turnos_propietarios_ok": turns_ok,
+        "cancelada_en_cola_ok": (
+            cancelled_queued is None
+            or states[task_ids.index(cancelled_queued)] == "cancelado"
+        ),
+        "cancelada_en_ejecucion_ok": (
+            cancelled_running is None
+            or states[task_ids.index(cancelled_running)] == "cancelado"
+        ),
+        "estados": {s: states.count(s) for s in set(states)},
+    }
+    print(json.dumps(checks, indent=2))
+    ok = checks["concurrencia_ok"] and checks["audios_primero_ok"]
+    ok = ok and checks["turnos_propietarios_ok"]
+    ok = ok and checks["cancelada_en_cola_ok"] and checks["cancelada_en_ejecucion_ok"]
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
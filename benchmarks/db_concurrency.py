@@ -0,0 +1,161 @@
+"""
+Carga concurrente sobre /users y /auth/login con distintas configuraciones
+de SQLite.
+
+Levanta uvicorn una vez por configuración, con una base nueva con `--seed`
+usuarios, y durante `--seconds` segundos corre `--clients` clientes que
+mezclan altas (POST /users), logins y listados (GET /users) según `--mix`.
+Reporta peticiones por segundo, p50/p95 y errores (p. ej. 500 por
+"database is locked") por endpoint.
+
+Configuraciones:
+  - rollback: journal_mode=DELETE, synchronous=FULL (como antes de WAL)
+  - wal: la configuración por defecto de services.storage.db
+
+Uso:
+    python -m benchmarks.db_concurrency --clients 16 --seconds 10
+    python -m benchmarks.db_concurrency --modes wal --mix 10,80,10
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.suite import percentiles  # noqa: E402
+from benchmarks.upload_load import free_port, wait_ready  # noqa: E402
+
+MODES = {
+    "rollback": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL"},
+    "wal": {"SQLITE_JOURNAL_MODE": "WAL", "SQLITE_SYNCHRONOUS": "NORMAL"},
+}
+PASSWORD = "secreto"
+
+
+def seed_users(base_url: str, count: int):
+    with httpx.Client(base_url=base_url, timeout=30.0) as client:
+        for i in range(count):
+            client.post(
+                "/users", params={"email": f"seed{i}@bench.io", "password": PASSWORD}
+            )
+
+
+def load(base_url: str, args, weights):
+    stats = {name: {"ms": [], "errores": 0} for name in ("alta", "login", "listado")}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+    counter = iter(range(10**9))
+
+    def client_loop(worker: int):
+        rng = random.Random(worker)
+        local = {name: ([], 0) for name in stats}
+        with httpx.Client(base_url=base_url, timeout=60.0) as client:
+            while time.perf_counter() < deadline:
+                op = rng.choices(("alta", "login", "listado"), weights)[0]
+                started = time.perf_counter()
+                if op == "alta":
+                    email = f"w{worker}-{next(counter)}@bench.io"
+                    response = client.post(
+                        "/users", params={"email": email, "password": PASSWORD}
+                    )
+                    ok = response.status_code == 201
+                elif op == "login":
+                    email = f"seed{rng.randrange(args.seed)}@bench.io"
+                    response = client.post(
+                        "/auth/login", json={"email": email, "password": PASSWORD}
+                    )
+                    ok = response.status_code == 200
+                else:
+                    response = client.get("/users")
+                    ok = response.status_code == 200
+                ms = (time.perf_counter() - started) * 1000
+                samples, errors = local[op]
+                samples.append(ms)
+                local[op] = (samples, errors + (not ok))
+        with lock:
+            for name, (samples, errors) in local.items():
+                stats[name]["ms"] += samples
+                stats[name]["errores"] += errors
+
+    threads = [
+        threading.Thread(target=client_loop, args=(i,)) for i in range(args.clients)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    report = {}
+    for name, data in stats.items():
+        report[name] = {
+            "peticiones": len(data["ms"]),
+            "por_s": round(len(data["ms"]) / elapsed, 1),
+            "errores": data["errores"],
+            **percentiles(data["ms"]),
+        }
+    report["total_por_s"] = round(
+        sum(len(d["ms"]) for d in stats.values()) / elapsed, 1
+    )
+    return report
+
+
+def run_mode(mode: str, args, weights):
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{Path(tmp) / 'app.db'}",
+            MEDIA_BASE_DIR=tmp,
+            **MODES[mode],
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_ready(base_url)
+            seed_users(base_url, args.seed)
+            return load(base_url, args, weights)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=200, help="Usuarios iniciales")
+    parser.add_argument("--mix", default="20,70,10", help="Pesos de alta,login,listado")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+    weights = [float(w) for w in args.mix.split(",")]
+
+    report = {
+        "clientes": args.clients,
+        "segundos": args.seconds,
+        "mezcla": args.mix,
+        "modos": {mode: run_mode(mode, args, weights) for mode in args.modes},
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+Doble determinista de ffmpeg para pruebas y benchmarks sin ffmpeg instalado.
+
+Acepta la línea de comandos de ffmpeg, espera FAKE_FFMPEG_SECONDS (por defecto
+0.2 s) y escribe en la salida (último argumento) una copia de la entrada
+(que puede ser `pipe:0`, leída desde stdin).
+Si FAKE_FFMPEG_LOG está definido, agrega una línea JSON con pid, entrada,
+salida, inicio y fin de cada ejecución, útil para medir concurrencia.
+FAKE_FFMPEG_FAIL=1 simula un error de ffmpeg (código de salida 1);
+FAKE_FFMPEG_FAIL_COPY=1 solo lo simula en los remux (`-c copy`).
+Con `-f hls` escribe una lista maestra y, por cada variante de
+-var_stream_map, su lista y un segmento con la copia de la entrada.
+Con `-progress pipe:1` emite bloques de progreso en stdout como ffmpeg,
+suponiendo una duración de FAKE_MEDIA_DURATION segundos (por defecto 10).
+Con varias salidas (una sola ejecución para un lote) copia la entrada en
+cada una. Con `-movflags +faststart` la copia lleva la caja moov antes de
+mdat (sin corregir los offsets: solo sirve para probar la disposición).
+Con la salida `pipe:1` escribe la copia en stdout de a poco, repartida a lo
+largo de FAKE_FFMPEG_SECONDS, como una conversión en vivo.
+
+Uso:
+    FFMPEG_BIN="python benchmarks/fake_ffmpeg.py" uvicorn main:app
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+
+# Opciones de ffmpeg que no llevan valor
+FLAGS = {"-y", "-n", "-vn", "-an", "-sn", "-dn", "-nostats", "-nostdin"}
+
+
+def output_paths(argv):
+    """Rutas de salida: lo que no es opción ni valor después de la última -i."""
+    last_input = max((i for i, arg in enumerate(argv) if arg == "-i"), default=-2)
+    outputs, i = [], last_input + 2
+    while i < len(argv):
+        arg = argv[i]
+        if arg.startswith("-") and arg != "-":
+            i += 1 if arg in FLAGS else 2
+        else:
+            outputs.append(arg)
+            i += 1
+    return outputs
+
+
+def emit_progress(seconds, duration, steps=5):
+    for step in range(1, steps + 1):
+        time.sleep(seconds / steps)
+        out_time_us = int(duration * step / steps * 1_000_000)
+        speed = duration / seconds if seconds else 0
+        state = "end" if step == steps else "continue"
+        sys.stdout.write(
+            f"frame={step * 25}\nfps=25.0\nout_time_us={out_time_us}\n"
+            f"speed={speed:.2f}x\nprogress={state}\n"
+        )
+        sys.stdout.flush()
+
+
+def write_hls(argv, source):
+    """Imita la salida de -f hls con -var_stream_map y -master_pl_name."""
+    pattern = argv[-1]
+    out_dir = os.path.dirname(os.path.dirname(pattern))
+    names = [
+        dict(kv.split(":", 1) for kv in spec.split(",") if ":" in kv).get(
+            "name", str(i)
+        )
+        for i, spec in enumerate(argv[argv.index("-var_stream_map") + 1].split())
+    ]
+    master = ["#EXTM3U"]
+    for name in names:
+        variant_dir = os.path.join(out_dir, name)
+        os.makedirs(variant_dir, exist_ok=True)
+        shutil.copyfile(source, os.path.join(variant_dir, "seg_00000.ts"))
+        with open(os.path.join(variant_dir, "index.m3u8"), "w") as f:
+            f.write("#EXTM3U\n#EXTINF:6.0,\nseg_00000.ts\n#EXT-X-ENDLIST\n")
+        if name == "audio":
+            master.insert(
+                1,
+                f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="group_aud",URI="{name}/index.m3u8"',
+            )
+        else:
+            master += ["#EXT-X-STREAM-INF:BANDWIDTH=1000000", f"{name}/index.m3u8"]
+    with open(os.path.join(out_dir, "master.m3u8"), "w") as f:
+        f.write("\n".join(master) + "\n")
+
+
+def copy_faststart(source, dest):
+    """Copia `source` moviendo la caja moov de primer nivel al frente."""
+    with open(source, "rb") as f:
+        data = f.read()
+    boxes, offset = [], 0
+    while offset + 8 <= len(data):
+        size = int.from_bytes(data[offset : offset + 4], "big")
+        if size == 1:
+            size = int.from_bytes(data[offset + 8 : offset + 16], "big")
+        elif size == 0:
+            size = len(data) - offset
+        if size < 8:
+            break
+        boxes.append(data[offset : offset + size])
+        offset += size
+    moov = [box for box in boxes if box[4:8] == b"moov"]
+    rest = [box for box in boxes if box[4:8] != b"moov"]
+    # ftyp (si está) queda primero
+    head = rest[:1] if rest and rest[0][4:8] == b"ftyp" else []
+    with open(dest, "wb") as f:
+        f.write(b"".join(head + moov + rest[len(head) :]) + data[offset:])
+
+
+def write_stdout(source, seconds, steps=10):
+    """Copia `source` a stdout en `steps` bloques a lo largo de `seconds`."""
+    size = os.path.getsize(source)
+    block = max(1, -(-size // steps))
+    with open(source, "rb") as f:
+        while chunk := f.read(block):
+            sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            time.sleep(seconds / steps)
+
+
+def main(argv):
+    inputs = [argv[i + 1] for i, arg in enumerate(argv[:-1]) if arg == "-i"]
+    output = argv[-1] if argv else None
+    started = time.time()
+
+    copying = "-c" in argv and argv[argv.index("-c") + 1] == "copy"
+    if os.getenv("FAKE_FFMPEG_FAIL") == "1" or (
+        copying and os.getenv("FAKE_FFMPEG_FAIL_COPY") == "1"
+    ):
+        print("fake ffmpeg: error simulado", file=sys.stderr)
+        return 1
+
+    seconds = float(os.getenv("FAKE_FFMPEG_SECONDS", "0.2"))
+    if output == "pipe:1" and inputs and os.path.exists(inputs[0]):
+        write_stdout(inputs[0], seconds)
+    elif "-progress" in argv and argv[argv.index("-progress") + 1] == "pipe:1":
+        emit_progress(seconds, float(os.getenv("FAKE_MEDIA_DURATION", "10")))
+    else:
+        time.sleep(seconds)
+    if "hls" in argv and inputs and os.path.exists(inputs[0]):
+        write_hls(argv, inputs[0])
+    elif (
+        output not in (None, "-", "pipe:1") and inputs and inputs[0] in ("-", "pipe:0")
+    ):
+        with open(output, "wb") as f:
+            shutil.copyfileobj(sys.stdin.buffer, f)
+    elif output not in (None, "-", "pipe:1") and inputs and os.path.exists(inputs[0]):
+        for path in output_paths(argv):
+            if "+faststart" in argv:
+                copy_faststart(inputs[0], path)
+            else:
+                shutil.copyfile(inputs[0], path)
+
+    log_path = os.getenv("FAKE_FFMPEG_LOG")
+    if log_path:
+        record = {
+            "pid": os.getpid(),
+            "input": inputs[0] if inputs else None,
+            "output": output,
+            "outputs": output_paths(argv),
+            "start": started,
+            "end": time.time(),
+        }
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
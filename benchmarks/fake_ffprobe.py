@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Doble de ffprobe para pruebas sin ffmpeg instalado: imprime la duración
+FAKE_MEDIA_DURATION (por defecto 10 s) como `-show_entries format=duration`.
+Con `-of json` devuelve además un video de FAKE_MEDIA_WIDTH x FAKE_MEDIA_HEIGHT
+(1280x720 a 29.97 fps, códec FAKE_MEDIA_VCODEC=h264) y, salvo
+FAKE_MEDIA_AUDIO=0, una pista de audio estéreo (FAKE_MEDIA_ACODEC=aac).
+
+Uso:
+    FFPROBE_BIN="python benchmarks/fake_ffprobe.py" uvicorn main:app
+"""
+
+import json
+import os
+import sys
+
+
+def main(argv):
+    if argv and argv[-1] == "pipe:0":
+        sys.stdin.buffer.read()
+    elif not argv or not os.path.exists(argv[-1]):
+        print(f"{argv[-1] if argv else ''}: No such file or directory", file=sys.stderr)
+        return 1
+    duration = os.getenv("FAKE_MEDIA_DURATION", "10")
+    if "json" not in argv:
+        print(duration)
+        return 0
+
+    streams = [
+        {
+            "codec_type": "video",
+            "codec_name": os.getenv("FAKE_MEDIA_VCODEC", "h264"),
+            "width": int(os.getenv("FAKE_MEDIA_WIDTH", "1280")),
+            "height": int(os.getenv("FAKE_MEDIA_HEIGHT", "720")),
+            "avg_frame_rate": "30000/1001",
+        }
+    ]
+    if os.getenv("FAKE_MEDIA_AUDIO", "1") != "0":
+        streams.append(
+            {
+                "codec_type": "audio",
+                "codec_name": os.getenv("FAKE_MEDIA_ACODEC", "aac"),
+                "channels": 2,
+                "sample_rate": "48000",
+            }
+        )
+    fmt = {"duration": duration, "bit_rate": "2500000", "format_name": "mov,mp4"}
+    print(json.dumps({"streams": streams, "format": fmt}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
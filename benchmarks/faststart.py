@@ -0,0 +1,216 @@
+"""
+Tiempo hasta el primer cuadro de un MP4 con el índice (moov) al final, con y
+sin el reordenamiento faststart posterior a la subida.
+
+Por cada modo levanta uvicorn con el doble de ffmpeg, sube por /media/upload
+un MP4 sintético (ftyp, mdat de `--size-mb` MB, moov de `--moov-kb` KB) y
+espera a que /videos/{nombre}/info informe la disposición final. Después
+simula `--plays` veces un reproductor progresivo. El reproductor pide el
+archivo desde el byte 0 y recorre las cajas. Si encuentra mdat antes que
+moov, corta y pide el final del archivo para leer moov, y luego vuelve al
+inicio de mdat. El primer cuadro son los primeros `--frame-kb` KB de mdat.
+
+Reporta peticiones, bytes y ms medidos hasta el primer cuadro. En localhost
+la red no pesa, así que también estima el tiempo con `--rtt-ms` de latencia
+por petición y `--mbps` de ancho de banda.
+
+Modos:
+  - original: FASTSTART_ENABLED=0 (el archivo queda como se subió)
+  - faststart: el servicio reescribe el archivo con +faststart
+
+Uso:
+    python -m benchmarks.faststart --size-mb 64 --rtt-ms 80 --mbps 10
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.suite import SEED, percentiles  # noqa: E402
+from benchmarks.upload_load import free_port, wait_ready  # noqa: E402
+from services.media_probe import box_header  # noqa: E402
+
+MODES = {
+    "original": {"FASTSTART_ENABLED": "0"},
+    "faststart": {"FASTSTART_ENABLED": "1"},
+}
+NAME = "faststart.mp4"
+
+
+def box(kind: bytes, payload: bytes) -> bytes:
+    return (8 + len(payload)).to_bytes(4, "big") + kind + payload
+
+
+def make_mp4(size_mb: int, moov_kb: int) -> bytes:
+    """MP4 sintético con moov después de mdat (como lo deja un encoder)."""
+    rng = random.Random(SEED)
+    ftyp = box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2avc1mp41")
+    mdat = box(b"mdat", rng.randbytes(size_mb * 1024 * 1024))
+    moov = box(b"moov", rng.randbytes(moov_kb * 1024))
+    return ftyp + mdat + moov
+
+
+class Progressive:
+    """Lectura secuencial de una respuesta `Range: bytes=start-`."""
+
+    def __init__(self, client: httpx.Client, url: str, start: int, counters: dict):
+        self.counters = counters
+        self.pos = start
+        self.buf = b""
+        counters["peticiones"] += 1
+        self._cm = client.stream("GET", url, headers={"Range": f"bytes={start}-"})
+        self._chunks = self._cm.__enter__().iter_raw(64 * 1024)
+
+    def peek(self, size: int) -> bytes:
+        while len(self.buf) < size:
+            chunk = next(self._chunks, b"")
+            if not chunk:
+                break
+            self.counters["bytes"] += len(chunk)
+            self.buf += chunk
+        return self.buf[:size]
+
+    def read(self, size: int) -> bytes:
+        data = self.peek(size)
+        self.buf = self.buf[len(data) :]
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        self._cm.__exit__(None, None, None)
+
+
+def first_frame(client: httpx.Client, url: str, frame_bytes: int) -> dict:
+    counters = {"peticiones": 0, "bytes": 0}
+    started = time.perf_counter()
+    stream = Progressive(client, url, 0, counters)
+    moov, mdat_start = False, None
+    try:
+        while True:
+            header = box_header(stream.peek(16))
+            if header is None:
+                raise ValueError(f"Caja inválida en el byte {stream.pos}")
+            kind, size, length = header
+            if kind == "mdat" and moov:
+                stream.read(length + frame_bytes)
+                break
+            if kind == "mdat":
+                # Sin índice no se puede decodificar: saltar al final
+                mdat_start = stream.pos
+                stream.close()
+                stream = Progressive(client, url, mdat_start + size, counters)
+            elif kind == "moov":
+                stream.read(size)
+                moov = True
+                if mdat_start is not None:
+                    stream.close()
+                    stream = Progressive(client, url, mdat_start, counters)
+            else:
+                stream.read(size)
+    finally:
+        stream.close()
+    counters["ms"] = (time.perf_counter() - started) * 1000
+    return counters
+
+
+def wait_layout(client: httpx.Client, expected: str, timeout: float = 120.0) -> str:
+    deadline = time.time() + timeout
+    layout = None
+    while time.time() < deadline:
+        r = client.get(f"/videos/{NAME}/info")
+        if r.status_code == 200:
+            layout = r.json().get("disposicion")
+            if layout == expected:
+                return layout
+        time.sleep(0.1)
+    raise TimeoutError(f"disposicion={layout}, se esperaba {expected}")
+
+
+def run_mode(mode: str, payload: bytes, args) -> dict:
+    fakes = ROOT / "benchmarks"
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        env = dict(
+            os.environ,
+            MEDIA_BASE_DIR=tmp,
+            DATABASE_URL=f"sqlite:///{Path(tmp) / 'app.db'}",
+            FFMPEG_BIN=f"{sys.executable} {fakes / 'fake_ffmpeg.py'}",
+            FFPROBE_BIN=f"{sys.executable} {fakes / 'fake_ffprobe.py'}",
+            FAKE_FFMPEG_SECONDS="0",
+            **MODES[mode],
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_ready(base_url)
+            with httpx.Client(base_url=base_url, timeout=120.0) as client:
+                started = time.perf_counter()
+                r = client.post(
+                    "/media/upload", files={"file": (NAME, payload, "video/mp4")}
+                )
+                r.raise_for_status()
+                expected = "faststart" if mode == "faststart" else "moov_al_final"
+                layout = wait_layout(client, expected)
+                ready = time.perf_counter() - started
+
+                plays = [
+                    first_frame(client, f"/videos/{NAME}", args.frame_kb * 1024)
+                    for _ in range(args.plays)
+                ]
+        finally:
+            server.terminate()
+            server.wait()
+
+    requests = plays[0]["peticiones"]
+    transferred = round(sum(p["bytes"] for p in plays) / len(plays))
+    estimated = requests * args.rtt_ms + transferred * 8 / (args.mbps * 1000)
+    return {
+        "disposicion": layout,
+        "listo_s": round(ready, 3),
+        "peticiones": requests,
+        "bytes_primer_cuadro": transferred,
+        **percentiles([p["ms"] for p in plays]),
+        "ms_estimado": round(estimated, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=32)
+    parser.add_argument("--moov-kb", type=int, default=256)
+    parser.add_argument("--frame-kb", type=int, default=64)
+    parser.add_argument("--plays", type=int, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=50.0)
+    parser.add_argument("--mbps", type=float, default=20.0)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    payload = make_mp4(args.size_mb, args.moov_kb)
+    report = {
+        "tamaño_MB": args.size_mb,
+        "rtt_ms": args.rtt_ms,
+        "mbps": args.mbps,
+        "modos": {mode: run_mode(mode, payload, args) for mode in args.modes},
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Benchmark del registro de propietarios con 100k entradas.
+
+Compara el antiguo registro JSON (que reescribía todo el archivo en cada
+alta) con la tabla `media_file`:
+  - alta individual (la que hace cada subida) con el registro ya lleno,
+  - carga por lotes (register_many) y migración desde el JSON,
+  - búsquedas por nombre (get_owner) y por propietario (files_by_owner),
+  - varios procesos escribiendo a la vez sobre la misma base SQLite.
+
+Uso:
+    python -m benchmarks.file_registry --entries 100000
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+OWNERS = [f"user{i}" for i in range(100)]
+
+
+def make_engine(db_path: Path):
+    from sqlmodel import SQLModel
+
+    from services.storage.db import make_engine as db_engine
+
+    engine = db_engine(f"sqlite:///{db_path}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def per_call_ms(fn, calls):
+    samples = []
+    for args in calls:
+        started = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def legacy_register(path: Path, filename: str, owner: str):
+    """Lo que hacía FileRegistry.register con el JSON."""
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    data[filename] = {"owner": owner}
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def legacy_get_owner(path: Path, filename: str):
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f).get(filename, {}).get("owner", "unknown")
+
+
+def writer(db_path: str, worker: int, count: int):
+    from services.file_registry import FileRegistry
+
+    registry = FileRegistry(Path(db_path).parent, engine=make_engine(Path(db_path)))
+    for i in range(count):
+        registry.register(f"w{worker}_{i}.mp4", f"user{worker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--writes-per-process", type=int, default=250)
+    args = parser.parse_args()
+
+    from services.file_registry import FileRegistry
+
+    names = [f"video_{i:06d}.mp4" for i in range(args.entries)]
+    items = [(name, random.choice(OWNERS)) for name in names]
+    report = {"entradas": args.entries}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp)
+        (base / "content").mkdir()
+        json_path = base / "content" / "file_metadata.json"
+        json_path.write_text(
+            json.dumps({n: {"owner": o} for n, o in items}, indent=2), encoding="utf-8"
+        )
+
+        calls = [(f"nuevo_{i}.mp4", "ana") for i in range(min(args.calls, 20))]
+        report["json_alta"] = per_call_ms(
+            lambda n, o: legacy_register(json_path, n, o), calls
+        )
+        lookups = [(random.choice(names),) for _ in range(min(args.calls, 20))]
+        report["json_get_owner"] = per_call_ms(
+            lambda n: legacy_get_owner(json_path, n), lookups
+        )
+
+        registry = FileRegistry(base, engine=make_engine(base / "registry.db"))
+        started = time.perf_counter()
+        migrated = registry.migrate_json()
+        report["migracion_json"] = {
+            "filas": migrated,
+            "segundos": round(time.perf_counter() - started, 3),
+        }
+
+        calls = [(f"alta_{i}.mp4", "ana") for i in range(args.calls)]
+        report["db_alta"] = per_call_ms(registry.register, calls)
+        lookups = [(random.choice(names),) for _ in range(args.calls)]
+        report["db_get_owner"] = per_call_ms(registry.get_owner, lookups)
+        report["db_files_by_owner"] = per_call_ms(
+            lambda o: registry.files_by_owner(o, limit=100),
+            [(random.choice(OWNERS),) for _ in range(args.calls)],
+        )
+        started = time.perf_counter()
+        rows = len(registry.all())
+        report["db_all"] = {
+            "filas": rows,
+            "segundos": round(time.perf_counter() - started, 3),
+        }
+
+        started = time.perf_counter()
+        registry.register_many((f"lote_{i}.mp4", "beto") for i in range(args.entries))
+        report["db_register_many"] = {
+            "filas": args.entries,
+            "segundos": round(time.perf_counter() - started, 3),
+        }
+
+        db_path = base / "concurrente.db"
+        make_engine(db_path)
+        procs = [
+            multiprocessing.Process(
+                target=writer, args=(str(db_path), w, args.writes_per_process)
+            )
+            for w in range(args.processes)
+        ]
+        started = time.perf_counter()
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        concurrent = FileRegistry(base, engine=make_engine(db_path))
+        expected = args.processes * args.writes_per_process
+        stored = len(concurrent.all())
+        report["multiproceso"] = {
+            "procesos": args.processes,
+            "esperadas": expected,
+            "guardadas": stored,
+            "segundos": round(time.perf_counter() - started, 3),
+        }
+
+    print(json.dumps(report, indent=2))
+    ok = migrated == args.entries + min(args.calls, 20) and stored == expected
+    ok = ok and all(p.exitcode == 0 for p in procs)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Costo por petición de MetricsMiddleware.
+
+Llama directamente (sin servidor ni sockets) a una aplicación ASGI mínima que
+responde con un cuerpo corto, con y sin el middleware, y reporta la
+diferencia en microsegundos por petición. También mide cuánto tarda en
+armarse el texto de /metrics.
+
+Uso:
+    python -m benchmarks.metrics_overhead --requests 200000
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+class _Route:
+    path_format = "/videos/{filename}"
+
+
+async def app(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def run(target, requests: int) -> float:
+    started = time.perf_counter()
+    for i in range(requests):
+        scope = {"type": "http", "method": "GET", "path": f"/videos/{i % 50}.mp4"}
+        await target(scope, receive, send)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--max-overhead-us", type=float, default=5.0)
+    args = parser.parse_args()
+
+    from services.telemetry import MetricsMiddleware, registry
+
+    instrumented = MetricsMiddleware(app)
+    # Calentar y tomar la mejor de tres corridas de cada una
+    base = min(asyncio.run(run(app, args.requests)) for _ in range(3))
+    timed = min(asyncio.run(run(instrumented, args.requests)) for _ in range(3))
+    overhead_us = (timed - base) / args.requests * 1e6
+
+    started = time.perf_counter()
+    text = registry.render()
+    render_ms = (time.perf_counter() - started) * 1000
+
+    report = {
+        "peticiones": args.requests,
+        "sin_middleware_us": round(base / args.requests * 1e6, 3),
+        "con_middleware_us": round(timed / args.requests * 1e6, 3),
+        "costo_us": round(overhead_us, 3),
+        "render_ms": round(render_ms, 3),
+        "lineas_metrics": text.count("\n"),
+    }
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if overhead_us <= args.max_overhead_us else 1)
+
+
+if __name__ == "__main__":
+    main()
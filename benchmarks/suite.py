@@ -0,0 +1,428 @@
+"""
+Suite de benchmarks reproducible: streaming, listados, subidas y conversiones.
+
+Genera un árbol de medios sintético (con `--files` archivos por tamaño de
+catálogo, p. ej. 1000 10000 100000), levanta la aplicación con uvicorn
+apuntando a él (MEDIA_BASE_DIR) y con el doble de ffmpeg/ffprobe, y mide:
+  - listado: latencia de /videos/ por orden y paginando con cursor,
+  - rango: latencia de peticiones Range aleatorias sobre un archivo grande,
+  - streaming: throughput total con `--clients` descargas simultáneas,
+  - subida: throughput de /media/upload con subidas concurrentes,
+  - conversion: conversiones por segundo con ffmpeg simulado.
+
+La semilla es fija, así que dos corridas generan los mismos datos. El
+resultado es JSON; `compare` marca como regresión toda métrica que empeore
+más que `--umbral` por ciento (las `_ms` deben bajar, las `_MBps` y `_por_s`
+subir).
+
+Uso:
+    python -m benchmarks.suite run --files 1000 10000 --out base.json
+    python -m benchmarks.suite run --files 1000 10000 --out nuevo.json
+    python -m benchmarks.suite compare base.json nuevo.json --umbral 10
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.upload_load import free_port, wait_ready  # noqa: E402
+
+SEED = 1234
+VIDEO_EXTS = (".mp4", ".mkv", ".mov")
+AUDIO_EXTS = (".mp3", ".flac", ".m4a")
+STREAM_FILE = "stream_grande.mp4"
+
+
+# ============================
+# 🧪 DATOS SINTÉTICOS
+# ============================
+def generate_tree(base: Path, files: int, stream_mb: int, rng: random.Random):
+    """
+    `files` archivos (90% videos, 10% audios) con tamaños y fechas variados.
+    Son archivos dispersos (truncate): crear 100k tarda segundos y casi no
+    ocupa disco. El archivo de streaming sí tiene contenido real.
+    """
+    videos = base / "content" / "videos"
+    audios = base / "content" / "audios"
+    videos.mkdir(parents=True, exist_ok=True)
+    audios.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    for i in range(files):
+        if i % 10 == 9:
+            path = audios / f"audio_{i:06d}{rng.choice(AUDIO_EXTS)}"
+        else:
+            path = videos / f"video_{i:06d}{rng.choice(VIDEO_EXTS)}"
+        with path.open("wb") as f:
+            f.truncate(rng.randint(1, 50_000_000))
+        mtime = now - rng.uniform(0, 365 * 86400)
+        os.utime(path, (mtime, mtime))
+
+    block = rng.randbytes(1024 * 1024)
+    with (videos / STREAM_FILE).open("wb") as f:
+        for _ in range(stream_mb):
+            f.write(block)
+
+
+# ============================
+# 📏 MEDICIONES
+# ============================
+def percentiles(samples_ms):
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {}
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def timed_get(client: httpx.Client, url: str, **kwargs):
+    started = time.perf_counter()
+    response = client.get(url, **kwargs)
+    return response, (time.perf_counter() - started) * 1000
+
+
+def bench_listing(base_url: str, pages: int, rounds: int):
+    """Primera página y `pages` páginas siguientes por cada orden."""
+    results = {}
+    with httpx.Client(base_url=base_url, timeout=60.0) as client:
+        for orden in ("nombre", "tamaño", "fecha"):
+            first, following = [], []
+            for _ in range(rounds):
+                params = {"limite": 100, "orden": orden, "direccion": "desc"}
+                response, ms = timed_get(client, "/videos/", params=params)
+                first.append(ms)
+                cursor = response.json()["siguiente_cursor"]
+                for _ in range(pages):
+                    if not cursor:
+                        break
+                    response, ms = timed_get(
+                        client, "/videos/", params={**params, "cursor": cursor}
+                    )
+                    following.append(ms)
+                    cursor = response.json()["siguiente_cursor"]
+            results[f"primera_pagina_{orden}"] = percentiles(first)
+            results[f"paginas_siguientes_{orden}"] = percentiles(following)
+
+        filtered = []
+        for _ in range(rounds):
+            _, ms = timed_get(
+                client, "/videos/", params={"limite": 100, "extension": "mkv"}
+            )
+            filtered.append(ms)
+        results["filtro_extension"] = percentiles(filtered)
+    return results
+
+
+def bench_range(base_url: str, size: int, requests: int, rng: random.Random):
+    """Saltos aleatorios (como al mover la barra de un reproductor)."""
+    span = 64 * 1024
+    samples = []
+    with httpx.Client(base_url=base_url, timeout=60.0) as client:
+        for _ in range(requests):
+            start = rng.randrange(0, size - span)
+            headers = {"Range": f"bytes={start}-{start + span - 1}"}
+            response, ms = timed_get(client, f"/videos/{STREAM_FILE}", headers=headers)
+            if response.status_code != 206 or len(response.content) != span:
+                raise RuntimeError(
+                    f"Respuesta de rango inesperada: {response.status_code}"
+                )
+            samples.append(ms)
+    return {"peticiones": requests, "bloque_KB": span // 1024, **percentiles(samples)}
+
+
+def bench_streaming(base_url: str, clients: int, size: int):
+    received = [0] * clients
+
+    def download(i):
+        with httpx.Client(base_url=base_url, timeout=120.0) as client:
+            with client.stream("GET", f"/videos/{STREAM_FILE}") as response:
+                for chunk in response.iter_raw(1024 * 1024):
+                    received[i] += len(chunk)
+
+    threads = [threading.Thread(target=download, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    if any(r != size for r in received):
+        raise RuntimeError("Alguna descarga quedó incompleta")
+    return {
+        "clientes": clients,
+        "MB_por_cliente": size // (1024 * 1024),
+        "throughput_MBps": round(sum(received) / elapsed / (1024 * 1024), 2),
+        "segundos": round(elapsed, 3),
+    }
+
+
+def bench_upload(base_url: str, uploads: int, concurrency: int, size_mb: int):
+    payload = random.Random(SEED).randbytes(size_mb * 1024 * 1024)
+    pending = list(range(uploads))
+    lock = threading.Lock()
+    errors = []
+
+    def worker():
+        with httpx.Client(base_url=base_url, timeout=120.0) as client:
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    i = pending.pop()
+                response = client.post(
+                    "/media/upload",
+                    files={"file": (f"subida_{i}.mp4", payload, "video/mp4")},
+                    data={"owner": "bench"},
+                )
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise RuntimeError(f"Subidas fallidas: {errors}")
+    return {
+        "subidas": uploads,
+        "concurrencia": concurrency,
+        "MB_por_subida": size_mb,
+        "throughput_MBps": round(uploads * size_mb / elapsed, 2),
+        "segundos": round(elapsed, 3),
+    }
+
+
+def bench_conversion(base_url: str, base: Path, jobs: int):
+    """`jobs` conversiones de entradas distintas (sin aciertos de caché)."""
+    videos = base / "content" / "videos"
+    names = []
+    for i in range(jobs):
+        name = f"conv_{i:04d}.mp4"
+        (videos / name).write_bytes(random.Random(i).randbytes(256 * 1024))
+        names.append(name)
+
+    with httpx.Client(base_url=base_url, timeout=60.0) as client:
+        started = time.perf_counter()
+        task_ids = [
+            client.post(
+                "/convert/video", params={"filename": name, "formato": "mov"}
+            ).json()["task_id"]
+            for name in names
+        ]
+        pending = set(task_ids)
+        failed = 0
+        while pending:
+            for task_id in list(pending):
+                estado = client.get(f"/convert/status/{task_id}").json()["estado"]
+                if estado in ("listo", "error", "cancelado"):
+                    pending.discard(task_id)
+                    failed += estado != "listo"
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+    if failed:
+        raise RuntimeError(f"{failed} conversiones fallaron")
+    return {
+        "conversiones": jobs,
+        "conversiones_por_s": round(jobs / elapsed, 3),
+        "segundos": round(elapsed, 3),
+    }
+
+
+# ============================
+# 🚀 CORRIDA
+# ============================
+def start_server(base: Path, args) -> tuple:
+    port = free_port()
+    fakes = ROOT / "benchmarks"
+    env = dict(
+        os.environ,
+        MEDIA_BASE_DIR=str(base),
+        DATABASE_URL=f"sqlite:///{base / 'app.db'}",
+        FFMPEG_BIN=f"{sys.executable} {fakes / 'fake_ffmpeg.py'}",
+        FFPROBE_BIN=f"{sys.executable} {fakes / 'fake_ffprobe.py'}",
+        FAKE_FFMPEG_SECONDS=str(args.ffmpeg_seconds),
+        CONVERSION_WORKERS=str(args.conversion_workers),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        # Con 100k archivos el catálogo tarda en construirse al arrancar
+        wait_ready(base_url, timeout=300.0)
+    except Exception:
+        server.terminate()
+        raise
+    return server, base_url
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "desconocido"
+
+
+def run(args):
+    results = {}
+    for index, files in enumerate(args.files):
+        rng = random.Random(SEED)
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp)
+            started = time.perf_counter()
+            generate_tree(base, files, args.stream_mb, rng)
+            generated = time.perf_counter() - started
+            server, base_url = start_server(base, args)
+            try:
+                print(f"[{files} archivos] listado", file=sys.stderr)
+                listing = bench_listing(base_url, args.pages, args.rounds)
+                listing["archivos"] = files
+                listing["generacion_segundos"] = round(generated, 3)
+                results[f"listado_{files}"] = listing
+                # El resto no depende del tamaño del catálogo: una sola vez
+                if index == 0:
+                    size = args.stream_mb * 1024 * 1024
+                    print("rango / streaming / subida / conversión", file=sys.stderr)
+                    results["rango"] = bench_range(base_url, size, args.seeks, rng)
+                    results["streaming"] = bench_streaming(base_url, args.clients, size)
+                    results["subida"] = bench_upload(
+                        base_url, args.uploads, args.upload_concurrency, args.upload_mb
+                    )
+                    results["conversion"] = bench_conversion(
+                        base_url, base, args.conversions
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "parametros": {
+                k: v for k, v in vars(args).items() if k not in ("func", "out")
+            },
+        },
+        "resultados": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+# ============================
+# ⚖️ COMPARACIÓN
+# ============================
+def flatten(data, prefix=""):
+    for key, value in data.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, name)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def direction(metric: str):
+    """-1 si menor es mejor, 1 si mayor es mejor, None si no se compara."""
+    leaf = metric.rsplit(".", 1)[-1]
+    if leaf.endswith("_ms"):
+        return -1
+    if leaf.endswith(("_MBps", "_por_s")):
+        return 1
+    return None
+
+
+def compare(args):
+    before = dict(flatten(json.loads(Path(args.base).read_text())["resultados"]))
+    after = dict(flatten(json.loads(Path(args.nuevo).read_text())["resultados"]))
+    rows, regressions = [], 0
+    for metric in sorted(before.keys() & after.keys()):
+        sign = direction(metric)
+        if sign is None or not before[metric]:
+            continue
+        change = (after[metric] - before[metric]) / before[metric] * 100
+        regression = change * sign < -args.umbral
+        regressions += regression
+        rows.append(
+            {
+                "metrica": metric,
+                "antes": before[metric],
+                "despues": after[metric],
+                "cambio_%": round(change, 1),
+                "regresion": regression,
+            }
+        )
+    print(
+        json.dumps(
+            {"umbral_%": args.umbral, "regresiones": regressions, "metricas": rows},
+            indent=2,
+            ensure_ascii=False,
+        )
+    )
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="comando", required=True)
+
+    run_parser = commands.add_parser("run", help="Corre la suite")
+    run_parser.add_argument("--files", type=int, nargs="+", default=[1000, 10000])
+    run_parser.add_argument("--out", help="Archivo JSON de salida")
+    run_parser.add_argument("--rounds", type=int, default=20)
+    run_parser.add_argument("--pages", type=int, default=5)
+    run_parser.add_argument("--seeks", type=int, default=300)
+    run_parser.add_argument("--stream-mb", type=int, default=64)
+    run_parser.add_argument("--clients", type=int, default=8)
+    run_parser.add_argument("--uploads", type=int, default=16)
+    run_parser.add_argument("--upload-concurrency", type=int, default=4)
+    run_parser.add_argument("--upload-mb", type=int, default=8)
+    run_parser.add_argument("--conversions", type=int, default=12)
+    run_parser.add_argument("--conversion-workers", type=int, default=2)
+    run_parser.add_argument("--ffmpeg-seconds", type=float, default=0.2)
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compara dos corridas")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("nuevo")
+    compare_parser.add_argument("--umbral", type=float, default=10.0)
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
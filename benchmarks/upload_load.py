@@ -0,0 +1,166 @@
+"""
+Prueba de carga de /convert/upload/video: mide la latencia de otras peticiones
+mientras corren conversiones por subida.
+
+Levanta uvicorn con el doble de ffmpeg (cada conversión tarda `--seconds`),
+mide la latencia de GET / en reposo y luego durante `--uploads` conversiones
+simultáneas. Con el endpoint bloqueante, el event loop quedaba detenido todo
+lo que duraba ffmpeg; ahora el p95 durante la carga debe seguir por debajo
+de `--max-p95-ms`.
+
+Uso:
+    python -m benchmarks.upload_load --uploads 4 --seconds 2 --size-mb 16
+    python -m benchmarks.upload_load --stream   # cuerpo crudo por stdin de ffmpeg
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(base_url: str, timeout: float = 20.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(base_url + "/", timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise TimeoutError("El servidor no arrancó a tiempo")
+
+
+def probe(base_url: str, stop: threading.Event, interval: float = 0.02):
+    latencies = []
+    with httpx.Client(base_url=base_url, timeout=30.0) as client:
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get("/")
+            latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(interval)
+    return latencies
+
+
+def summary(latencies):
+    ordered = sorted(latencies)
+    return {
+        "muestras": len(ordered),
+        "p50_ms": round(statistics.median(ordered), 2),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1], 2),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+def upload(base_url: str, payload: bytes, stream: bool, results: list):
+    started = time.perf_counter()
+    with httpx.Client(base_url=base_url, timeout=120.0) as client:
+        if stream:
+            r = client.post(
+                "/convert/upload/video/stream",
+                params={"nombre": "carga.mkv", "formato": "mp4", "modo": "directo"},
+                content=payload,
+            )
+        else:
+            r = client.post(
+                "/convert/upload/video",
+                files={"file": ("carga.mkv", payload, "video/x-matroska")},
+                data={"formato": "mp4", "modo": "directo"},
+            )
+    results.append(
+        {
+            "status": r.status_code,
+            "bytes": len(r.content),
+            "segundos": round(time.perf_counter() - started, 2),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--size-mb", type=int, default=16)
+    parser.add_argument("--baseline", type=float, default=1.0)
+    parser.add_argument("--max-p95-ms", type=float, default=100.0)
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            FFMPEG_BIN=f"{sys.executable} {ROOT / 'benchmarks' / 'fake_ffmpeg.py'}",
+            FAKE_FFMPEG_SECONDS=str(args.seconds),
+            DATABASE_URL=f"sqlite:///{Path(tmp) / 'app.db'}",
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_ready(base_url)
+
+            stop = threading.Event()
+            timer = threading.Timer(args.baseline, stop.set)
+            timer.start()
+            baseline = probe(base_url, stop)
+
+            payload = os.urandom(args.size_mb * 1024 * 1024)
+            results = []
+            uploads = [
+                threading.Thread(
+                    target=upload, args=(base_url, payload, args.stream, results)
+                )
+                for _ in range(args.uploads)
+            ]
+            stop = threading.Event()
+            during = []
+            prober = threading.Thread(
+                target=lambda: during.extend(probe(base_url, stop))
+            )
+            prober.start()
+            for t in uploads:
+                t.start()
+            for t in uploads:
+                t.join()
+            stop.set()
+            prober.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "subidas": results,
+        "reposo": summary(baseline),
+        "durante_conversiones": summary(during),
+    }
+    ok = all(r["status"] == 200 and r["bytes"] == len(payload) for r in results)
+    ok = ok and report["durante_conversiones"]["p95_ms"] <= args.max_p95_ms
+    report["ok"] = ok
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,17 @@
 from fastapi.middleware.cors import CORSMiddleware
-from routers import videos, audios, conversion, upload, media_upload, dashboard
+from routers import videos, audios, conversion, upload, media_upload, dashboard, metrics
 from fastapi import FastAPI, Depends, HTTPException, status
 from sqlmodel import select, Session
-from services.storage.db import init_db, get_session
+from services.storage.db import dispose_async_engine, init_db, get_session
 from services.storage.model import User
 from services.storage.model import LoginIn
+from services.faststart import faststart
+from services.file_registry import registry
+from services.media_catalog import catalog
+from services.media_metadata import metadata
+from services.segment_cache import segment_cache
+from services.system_metrics import metrics_sampler
+from services.telemetry import MetricsMiddleware
 
 app = FastAPI(title="Distributed Multimedia Platform")
 
@@ -16,6 +23,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Latencia, estados y bytes por ruta para /metrics
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(videos.router, prefix="/videos", tags=["Videos"])
 app.include_router(audios.router, prefix="/audios", tags=["Audios"])
@@ -23,11 +32,36 @@ app.include_router(conversion.router, prefix="/convert", tags=["Conversiones"])
 app.include_router(upload.router, prefix="/convert", tags=["Conversión por Upload"])
 app.include_router(media_upload.router, prefix="/media", tags=["Media Upload"])
 app.include_router(dashboard.router, prefix="/dashboard", tags=["Dashboard"])
+app.include_router(metrics.router, tags=["Métricas"])
 
 
 @app.on_event("startup")
 def on_startup():
     init_db()
+    registry.migrate_json()
+    conversion.manager.start()
+    catalog.start()
+    metadata.start()
+    faststart.start()
+    segment_cache.start()
+    metrics_sampler.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    conversion.manager.stop()
+    conversion.live.stop()
+    catalog.stop()
+    metadata.stop()
+    faststart.stop()
+    segment_cache.stop()
+    metrics_sampler.stop()
+
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    # Cierra el pool del motor asíncrono si algún endpoint llegó a crearlo
+    await dispose_async_engine()
 
 
 @app.get("/")
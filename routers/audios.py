@@ -1,60 +1,128 @@
-from fastapi import APIRouter, HTTPException, Request, Path
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from fastapi import APIRouter, HTTPException, Request, Path, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from datetime import datetime
+import asyncio
 import os
 import mimetypes
+from pathlib import Path as FilePath
+from urllib.parse import quote
+from services.clips import ClipError, clips
+from services.http_cache import (
+    CACHE_CONTROL,
+    CACHE_CONTROL_IMMUTABLE,
+    CACHE_CONTROL_LISTING,
+    http_date,
+    is_not_modified,
+    listing_etag,
+    not_modified,
+    version_token,
+)
+from services.media_catalog import catalog
+from services.media_metadata import METADATA_TIMEOUT, MediaInfoResponse, metadata
+from services.paths import BASE_DIR
+from services.streaming import stream_file
+from services.waveform import WaveformError, pick_level, waveforms
 
 router = APIRouter()
-AUDIO_DIR = os.path.join(os.path.dirname(__file__), "..", "content", "audios")
-CHUNK_SIZE = 1024 * 256  # 256KB - Óptimo para streaming
+AUDIO_DIR = os.path.join(BASE_DIR, "content", "audios")
 
 
 class AudioItem(BaseModel):
     nombre: str
     tipo: str
     tamaño_MB: float
+    propietario: str = "unknown"
+    ultima_modificacion: Optional[str] = None
+    url: Optional[str] = None
+    duracion: Optional[float] = None
+    codec_audio: Optional[str] = None
+    bitrate: Optional[int] = None
+    canales: Optional[int] = None
+    sample_rate: Optional[int] = None
 
 
 class AudioListResponse(BaseModel):
     audios: List[AudioItem]
+    siguiente_cursor: Optional[str] = None
 
 
 class ErrorResponse(BaseModel):
     detail: str
 
 
+def _listing_meta(meta: Optional[dict]) -> dict:
+    """Campos de ffprobe que se agregan a cada audio del listado."""
+    if not meta or meta["error"]:
+        return {}
+    return {
+        "duracion": meta["duracion"],
+        "codec_audio": meta["codec_audio"],
+        "bitrate": meta["bitrate"],
+        "canales": meta["canales"],
+        "sample_rate": meta["sample_rate"],
+    }
+
+
 @router.get(
     "/",
     response_model=AudioListResponse,
     summary="Lista todos los audios disponibles",
-    description="Devuelve todos los audios disponibles en el servidor con nombre, tipo MIME y tamaño (MB).",
+    description="Devuelve todos los audios disponibles en el servidor con nombre, tipo MIME y tamaño (MB). Admite paginación por cursor, filtros y orden.",
 )
-def listar_audios():
-    try:
-        if not os.path.exists(AUDIO_DIR):
-            raise HTTPException(
-                status_code=404, detail="Carpeta de audios no encontrada"
-            )
-
-        files = []
-        for f in os.listdir(AUDIO_DIR):
-            if f.lower().endswith((".mp3", ".wav", ".flac", ".ogg", ".m4a")):
-                file_path = os.path.join(AUDIO_DIR, f)
-                media_type, _ = mimetypes.guess_type(file_path)
-                size_mb = round(os.path.getsize(file_path) / (1024 * 1024), 2)
-                files.append(
-                    {
-                        "nombre": f,
-                        "tipo": media_type or "audio/mpeg",
-                        "tamaño_MB": size_mb,
-                    }
-                )
-
-        return {"audios": files}
+def listar_audios(
+    limite: int = Query(100, ge=1, le=1000, description="Máximo de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página anterior"),
+    extension: Optional[str] = Query(None, description="Filtrar por extensión"),
+    min_MB: Optional[float] = Query(None, ge=0, description="Tamaño mínimo (MB)"),
+    max_MB: Optional[float] = Query(None, ge=0, description="Tamaño máximo (MB)"),
+    propietario: Optional[str] = Query(None, description="Filtrar por propietario"),
+    orden: str = Query("nombre", description="Ordenar por nombre, tamaño o fecha"),
+    direccion: str = Query("asc", description="asc o desc"),
+    request: Request = None,
+    response: Response = None,
+):
+    # El ETag del listado depende solo de la versión del catálogo y los filtros
+    etag = listing_etag("audio", catalog.version, request.url.query)
+    cache_headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(catalog.updated_at),
+        "Cache-Control": CACHE_CONTROL_LISTING,
+    }
+    if is_not_modified(request.headers, etag, catalog.updated_at):
+        return not_modified(cache_headers)
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    try:
+        entries, siguiente = catalog.query(
+            "audio",
+            limit=limite,
+            cursor=cursor,
+            ext=extension,
+            min_size=int(min_MB * 1024 * 1024) if min_MB is not None else None,
+            max_size=int(max_MB * 1024 * 1024) if max_MB is not None else None,
+            owner=propietario,
+            sort=orden,
+            order=direccion,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    files = [
+        {
+            "nombre": e.nombre,
+            "tipo": e.tipo or "audio/mpeg",
+            "tamaño_MB": round(e.size / (1024 * 1024), 2),
+            "propietario": e.owner,
+            "ultima_modificacion": datetime.fromtimestamp(e.mtime).isoformat(),
+            "url": f"/audios/{quote(e.nombre)}?v={e.token}",
+            **_listing_meta(e.meta),
+        }
+        for e in entries
+    ]
+    response.headers.update(cache_headers)
+    return {"audios": files, "siguiente_cursor": siguiente}
 
 
 @router.get(
@@ -63,6 +131,7 @@ def listar_audios():
         200: {"description": "Streaming de audio"},
         206: {"description": "Contenido parcial (streaming progresivo)"},
         404: {"model": ErrorResponse},
+        416: {"model": ErrorResponse, "description": "Rango no satisfacible"},
     },
     summary="Reproduce un audio específico por streaming",
     description="Permite escuchar un audio directamente desde el navegador sin descargarlo completamente.",
@@ -71,90 +140,46 @@ async def stream_audio(
     filename: str = Path(..., description="Nombre del audio"), request: Request = None
 ):
     file_path = os.path.join(AUDIO_DIR, filename)
+    return stream_file(request, file_path, "audio/mpeg")
 
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Archivo no encontrado")
-
-    file_size = os.path.getsize(file_path)
-    range_header = request.headers.get("range")
-    media_type, _ = mimetypes.guess_type(file_path)
-    media_type = media_type or "audio/mpeg"
-
-    def iterfile(start=0, end=None):
-        with open(file_path, "rb") as f:
-            f.seek(start)
-            remaining = (end - start + 1) if end else (file_size - start)
-
-            while remaining > 0:
-                chunk_size = min(CHUNK_SIZE, remaining)
-                chunk = f.read(chunk_size)
-
-                if not chunk:
-                    break
-
-                yield chunk
-                remaining -= len(chunk)
-
-    if range_header:
-        try:
-            # Parsear el header Range
-            range_header = range_header.strip().lower()
-            if not range_header.startswith("bytes="):
-                raise HTTPException(status_code=400, detail="Formato de Range inválido")
-
-            range_value = range_header.replace("bytes=", "")
-
-            # Manejar múltiples rangos (tomar solo el primero)
-            if "," in range_value:
-                range_value = range_value.split(",")[0]
-
-            start_str, end_str = range_value.split("-")
-
-            # Calcular start y end
-            start = int(start_str) if start_str else 0
-            end = int(end_str) if end_str else file_size - 1
-
-            # Validar rangos
-            if start < 0 or start >= file_size:
-                raise HTTPException(
-                    status_code=416, detail="Rango solicitado fuera de límites"
-                )
-
-            # Asegurar que end no exceda el tamaño del archivo
-            end = min(end, file_size - 1)
-
-            # Calcular el tamaño del contenido a enviar
-            content_length = end - start + 1
-
-        except (ValueError, IndexError):
-            raise HTTPException(status_code=400, detail="Encabezado Range mal formado")
-
-        headers = {
-            "Content-Range": f"bytes {start}-{end}/{file_size}",
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(content_length),
-            "Cache-Control": "public, max-age=3600",
-            "Connection": "keep-alive",
-        }
 
-        return StreamingResponse(
-            iterfile(start, end),
-            status_code=206,
-            headers=headers,
-            media_type=media_type,
+@router.get(
+    "/{filename}/info",
+    response_model=MediaInfoResponse,
+    responses={404: {"model": ErrorResponse}, 504: {"model": ErrorResponse}},
+    summary="Metadatos técnicos de un audio",
+    description="Duración, bitrate, contenedor, códec, canales y frecuencia de muestreo obtenidos con ffprobe, y en M4A si el índice (moov) va al principio (`disposicion`). Se analiza una sola vez por versión del archivo y el resultado queda guardado en la base de datos.",
+)
+async def info_audio(
+    filename: str = Path(..., description="Nombre del audio"),
+    request: Request = None,
+    response: Response = None,
+):
+    future = metadata.schedule("audio", filename)
+    if future is None:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    try:
+        # El análisis se espera sin ocupar un hilo del servidor; shield evita
+        # que un cliente que corta cancele el análisis compartido
+        data = await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(future)), METADATA_TIMEOUT
         )
-
-    # Respuesta completa sin Range
-    headers = {
-        "Accept-Ranges": "bytes",
-        "Content-Length": str(file_size),
-        "Cache-Control": "public, max-age=3600",
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="ffprobe no respondió a tiempo")
+
+    # Los metadatos solo cambian si cambia el archivo
+    etag = f'"{data["token"]}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL_LISTING}
+    if is_not_modified(request.headers, etag):
+        return not_modified(headers)
+    response.headers.update(headers)
+    return {
+        **data,
+        "nombre": filename,
+        "tamaño_bytes": data["size"],
+        "analizado": datetime.fromtimestamp(data["analizado"]).isoformat(),
     }
 
-    return StreamingResponse(
-        iterfile(), media_type=media_type, headers=headers, status_code=200
-    )
-
 
 @router.get(
     "/download/{filename}",
@@ -167,18 +192,139 @@ async def stream_audio(
 )
 async def descargar_audio(
     filename: str = Path(..., description="Nombre del audio a descargar"),
+    request: Request = None,
 ):
     file_path = os.path.join(AUDIO_DIR, filename)
+    return stream_file(
+        request,
+        file_path,
+        "audio/mpeg",
+        extra_headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
 
-    if not os.path.exists(file_path):
+# ============================
+# ✂️ CLIPS
+# ============================
+@router.get(
+    "/{filename}/clip",
+    responses={
+        200: {"description": "Clip del audio"},
+        206: {"description": "Contenido parcial del clip"},
+        400: {"model": ErrorResponse, "description": "Rango inválido"},
+        404: {"model": ErrorResponse},
+        500: {"model": ErrorResponse, "description": "ffmpeg no pudo generar el clip"},
+    },
+    summary="Fragmento de un audio sin recodificar",
+    description="""
+Extrae el tramo entre `start` y `end` (segundos) copiando los streams, sin recodificar: el clip
+empieza en el keyframe anterior a `start`. Con `exacto=true` se recodifica (con `preset`) para
+cortar en el cuadro justo. El clip se guarda en caché por versión del archivo y rango, y se sirve
+con soporte de rangos; con `?v=` igual a la versión actual la respuesta es inmutable.
+""",
+)
+async def clip_audio(
+    filename: str = Path(..., description="Nombre del audio"),
+    start: float = Query(..., ge=0, description="Inicio en segundos"),
+    end: float = Query(..., gt=0, description="Fin en segundos"),
+    exacto: bool = Query(
+        False, description="Recodificar para cortar en el cuadro exacto"
+    ),
+    preset: Optional[str] = Query(
+        None, description="Preset si exacto: rapido, equilibrado o calidad"
+    ),
+    request: Request = None,
+):
+    input_path = FilePath(AUDIO_DIR) / filename
+    try:
+        # El análisis (ffprobe) y ffmpeg se esperan sin ocupar hilos del
+        # servidor; shield evita que un cliente que corta cancele la
+        # generación compartida
+        analysis = metadata.schedule("audio", filename)
+        if analysis is not None:
+            await asyncio.shield(asyncio.wrap_future(analysis))
+        future = await run_in_threadpool(
+            clips.schedule, input_path, start, end, exacto, preset
+        )
+        target = await asyncio.shield(asyncio.wrap_future(future))
+        st = os.stat(input_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ClipError as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo generar el clip: {e}")
+
+    immutable = request.query_params.get("v") == version_token(st)
+    clip_name = f"{input_path.stem}_{start:g}-{end:g}{input_path.suffix}"
+    return stream_file(
+        request,
+        str(target),
+        mimetypes.guess_type(filename)[0] or "audio/mpeg",
+        extra_headers={
+            "Cache-Control": CACHE_CONTROL_IMMUTABLE if immutable else CACHE_CONTROL,
+            "Content-Disposition": f"inline; filename*=UTF-8''{quote(clip_name)}",
+        },
+    )
 
-    media_type, _ = mimetypes.guess_type(file_path)
-    media_type = media_type or "audio/mpeg"
 
-    return FileResponse(
-        path=file_path,
-        filename=filename,
-        media_type=media_type,
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
+# ============================
+# 〰️ FORMA DE ONDA
+# ============================
+@router.get(
+    "/{filename}/peaks",
+    responses={
+        200: {"description": "Picos de la forma de onda (binario)"},
+        404: {"model": ErrorResponse},
+        500: {
+            "model": ErrorResponse,
+            "description": "ffmpeg no pudo decodificar el audio",
+        },
+    },
+    summary="Picos precalculados de la forma de onda de un audio",
+    description="""
+Mínimos y máximos de la forma de onda para dibujarla sin descargar el audio. Se calculan una sola
+vez por versión del archivo y se guardan en varios niveles de detalle; `resolution` es la cantidad
+de picos que necesita el cliente (p. ej. el ancho en píxeles) y se devuelve el nivel más liviano
+que la alcanza. Formato (little-endian): "WFPK", versión (u16), bits (u16), frecuencia de muestreo
+(u32), muestras por pico (u32) y cantidad de picos (u32), seguidos de un par mínimo/máximo int8 por
+pico. Con `?v=` igual a la versión actual la respuesta es inmutable.
+""",
+)
+async def peaks_audio(
+    filename: str = Path(..., description="Nombre del audio"),
+    resolution: int = Query(
+        1000, ge=1, le=1_000_000, description="Cantidad mínima de picos"
+    ),
+    request: Request = None,
+):
+    input_path = FilePath(AUDIO_DIR) / filename
+    try:
+        for retry in (True, False):
+            levels = await asyncio.shield(
+                asyncio.wrap_future(waveforms.schedule(input_path))
+            )
+            try:
+                target = pick_level(levels, resolution)
+                break
+            except FileNotFoundError:
+                # Una versión nueva del audio borró los niveles: pedir los suyos
+                if not retry:
+                    raise
+        st = os.stat(input_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    except WaveformError as e:
+        raise HTTPException(
+            status_code=500, detail=f"No se pudo calcular la forma de onda: {e}"
+        )
+
+    immutable = request.query_params.get("v") == version_token(st)
+    return stream_file(
+        request,
+        str(target),
+        "application/octet-stream",
+        extra_headers={
+            "Cache-Control": CACHE_CONTROL_IMMUTABLE if immutable else CACHE_CONTROL,
+        },
     )
@@ -1,13 +1,23 @@
-from fastapi import APIRouter, HTTPException, Query, Path
-from fastapi.responses import FileResponse, JSONResponse
+import asyncio
+import json
+import mimetypes
+
+from fastapi import APIRouter, HTTPException, Query, Path, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from pathlib import Path as FilePath
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
-from services.conversion_manager import ConversionManager
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+from typing import Optional, Dict, Any, List
+from services.conversion_manager import ConversionManager, ESTADOS_FINALES
+from services.live_transcode import LiveCapacityError, LiveStream, LiveTranscoder
+from services.media_metadata import metadata
+from services.paths import BASE_DIR
+from services.streaming import CHUNK_SIZE, stream_file
 
 router = APIRouter()
-BASE_DIR = FilePath(__file__).resolve().parent.parent
-manager = ConversionManager(BASE_DIR)
+manager = ConversionManager(BASE_DIR, prober=metadata.probe_path)
+live = LiveTranscoder(manager)
 
 # =========================
 # 🧱 MODELOS PARA SWAGGER
@@ -16,8 +26,8 @@ manager = ConversionManager(BASE_DIR)
 
 class ConversionStartResponse(BaseModel):
     task_id: str
-    estado: str = "preparando"
-    descripcion: str = "Conversión iniciada correctamente"
+    estado: str = "en_cola"
+    descripcion: str = "Conversión encolada correctamente"
 
 
 class ConversionStatusResponse(BaseModel):
@@ -28,6 +38,69 @@ class ConversionStatusResponse(BaseModel):
     estado: str
     output: Optional[str] = None
     error: Optional[str] = None
+    propietario: Optional[str] = None
+    prioridad: Optional[int] = None
+    posicion_cola: Optional[int] = None
+    cache: Optional[str] = None
+    duracion: Optional[float] = None
+    progreso: Optional[float] = None
+    eta_segundos: Optional[float] = None
+    fps: Optional[float] = None
+    velocidad: Optional[float] = None
+    preset: Optional[str] = None
+    modo: Optional[str] = None
+    lote: Optional[str] = None
+
+
+# Máximo de archivos y de formatos por archivo en un lote
+MAX_BATCH_FILES = 100
+MAX_BATCH_FORMATS = 10
+
+
+class BatchItem(BaseModel):
+    filename: str = Field(..., description="Nombre del archivo existente")
+    formatos: List[str] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BATCH_FORMATS,
+        description="Formatos destino (mp4, mov, mp3...)",
+    )
+
+
+class BatchRequest(BaseModel):
+    archivos: List[BatchItem] = Field(..., min_length=1, max_length=MAX_BATCH_FILES)
+    owner: str = "unknown"
+    prioridad: Optional[int] = Field(
+        None, ge=0, le=2, description="0 alta, 1 normal, 2 baja"
+    )
+    preset: Optional[str] = Field(
+        None, description="Preset si hay que recodificar: rapido, equilibrado o calidad"
+    )
+
+
+class BatchOutput(BaseModel):
+    archivo: str
+    formato: str
+    task_id: str
+    origen: str = Field(..., description="hit (caché), en_curso o miss")
+
+
+class BatchStartResponse(BaseModel):
+    lote: str
+    salidas: List[BatchOutput]
+
+
+class BatchStatusResponse(BaseModel):
+    lote: str
+    total: int
+    terminadas: int
+    estados: Dict[str, int]
+    tareas: List[ConversionStatusResponse]
+
+
+# Segundos sin cambios tras los que se envía un comentario para mantener viva
+# la conexión (proxies y balanceadores cortan las conexiones inactivas)
+SSE_KEEPALIVE = 15.0
 
 
 class ErrorResponse(BaseModel):
@@ -47,7 +120,12 @@ class ErrorResponse(BaseModel):
     },
     summary="Inicia la conversión de un archivo",
     description="""
-Crea una nueva tarea de conversión (audio o video).  
+Crea una nueva tarea de conversión (audio o video) y la encola en el pool de conversiones.  
+Si el mismo archivo ya se convirtió al mismo formato, la tarea se devuelve terminada (`cache: hit`);
+si hay una conversión idéntica en curso, se devuelve el `task_id` de esa tarea.  
+Los audios y archivos pequeños se atienden primero y los trabajos se reparten por turnos entre propietarios.  
+Si el formato destino admite los códecs del original, los streams se copian sin recodificar (`modo: copia`);
+si no, se recodifica con el `preset` indicado (`rapido`, `equilibrado` o `calidad`).  
 Devuelve un **task_id** que puedes usar para consultar el estado o descargar el archivo convertido.
 """,
 )
@@ -55,6 +133,16 @@ def iniciar_conversion(
     tipo: str = Path(..., description="Tipo de archivo: 'video' o 'audio'"),
     filename: str = Query(..., description="Nombre del archivo existente"),
     formato: str = Query(..., description="Formato destino (mp3, mp4, mov)"),
+    owner: str = Query("unknown", description="Propietario de la tarea"),
+    prioridad: Optional[int] = Query(
+        None,
+        ge=0,
+        le=2,
+        description="0 alta, 1 normal, 2 baja (por defecto según tipo y tamaño)",
+    ),
+    preset: Optional[str] = Query(
+        None, description="Preset si hay que recodificar: rapido, equilibrado o calidad"
+    ),
 ):
     if tipo not in ["video", "audio"]:
         raise HTTPException(
@@ -62,14 +150,96 @@ def iniciar_conversion(
         )
 
     try:
-        task_id = manager.start_conversion(filename, formato, tipo)
+        task_id = manager.start_conversion(
+            filename, formato, tipo, owner=owner, priority=prioridad, preset=preset
+        )
         return ConversionStartResponse(task_id=task_id)
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# =========================================
+# 📦 Conversión por lotes
+# =========================================
+@router.post(
+    "/batch/{tipo}",
+    response_model=BatchStartResponse,
+    responses={
+        400: {"model": ErrorResponse, "description": "Parámetros inválidos"},
+        404: {"model": ErrorResponse, "description": "Archivo no encontrado"},
+    },
+    summary="Convierte varios archivos a varios formatos",
+    description="""
+Recibe pares (archivo, formatos) y crea una tarea por salida. Las salidas de un mismo archivo
+se agendan como una unidad y se generan con **una sola ejecución de ffmpeg**: la entrada se
+decodifica una vez y cada formato tiene su propia codificación o copia de streams.  
+Cada salida indica su `origen`: `hit` si ya estaba en caché, `en_curso` si se comparte una
+conversión idéntica de otro pedido, o `miss` si se convierte en este lote.  
+El avance de cada salida se consulta con `/convert/status/{task_id}` o, para todo el lote,
+con `/convert/batch/status/{lote}`.
+""",
+)
+def iniciar_lote(
+    data: BatchRequest,
+    tipo: str = Path(..., description="Tipo de archivo: 'video' o 'audio'"),
+):
+    if tipo not in ["video", "audio"]:
+        raise HTTPException(
+            status_code=400, detail="Tipo inválido. Usa 'video' o 'audio'."
+        )
+    input_dir = manager.video_dir if tipo == "video" else manager.audio_dir
+    items = []
+    for item in data.archivos:
+        input_path = input_dir / item.filename
+        if not input_path.is_file():
+            raise HTTPException(
+                status_code=404, detail=f"Archivo {item.filename} no encontrado"
+            )
+        items.append((input_path, item.formatos))
+
+    try:
+        return manager.submit_batch(
+            items,
+            tipo,
+            owner=data.owner,
+            priority=data.prioridad,
+            preset=data.preset,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get(
+    "/batch/status/{lote_id}",
+    response_model=BatchStatusResponse,
+    responses={404: {"model": ErrorResponse, "description": "Lote no encontrado"}},
+    summary="Consulta el estado de un lote de conversiones",
+    description="Estado de cada salida creada por el lote y cuántas hay en cada estado. Las salidas con `origen: en_curso` pertenecen a otra tarea y se consultan por su `task_id`.",
+)
+def estado_lote(
+    lote_id: str = Path(..., description="ID del lote"),
+):
+    tareas, total = manager.list_tasks(
+        lote=lote_id, limit=MAX_BATCH_FILES * MAX_BATCH_FORMATS
+    )
+    if not total:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    estados: Dict[str, int] = {}
+    for tarea in tareas:
+        estados[tarea["estado"]] = estados.get(tarea["estado"], 0) + 1
+    return {
+        "lote": lote_id,
+        "total": total,
+        "terminadas": sum(n for e, n in estados.items() if e in ESTADOS_FINALES),
+        "estados": estados,
+        "tareas": tareas,
+    }
+
+
 # =========================================
 # 🔍 Ver estado de una tarea
 # =========================================
@@ -80,7 +250,7 @@ def iniciar_conversion(
         404: {"model": ErrorResponse, "description": "Tarea no encontrada"},
     },
     summary="Consulta el estado de una conversión",
-    description="Devuelve información sobre una tarea específica (estado, archivo, formato, etc.).",
+    description="Devuelve información sobre una tarea específica (estado, archivo, formato, posición en la cola, etc.).",
 )
 def obtener_estado(
     task_id: str = Path(..., description="ID único de la tarea de conversión"),
@@ -91,17 +261,125 @@ def obtener_estado(
     return task
 
 
+# =========================================
+# 📡 Progreso en vivo (Server-Sent Events)
+# =========================================
+@router.get(
+    "/events/{task_id}",
+    responses={
+        200: {
+            "content": {"text/event-stream": {}},
+            "description": "Flujo de eventos con el estado de la tarea",
+        },
+        404: {"model": ErrorResponse, "description": "Tarea no encontrada"},
+    },
+    summary="Sigue el progreso de una conversión en vivo",
+    description="""
+Flujo **text/event-stream**: cada evento lleva el nombre del estado y, en `data`, la tarea en JSON
+(con `progreso` en %, `eta_segundos`, `fps` y `velocidad`). Si llegan varios cambios mientras el
+cliente está ocupado, solo se envía el más reciente. El flujo termina al llegar a un estado final.
+""",
+)
+async def eventos_tarea(
+    task_id: str = Path(..., description="ID único de la tarea de conversión"),
+):
+    task = await run_in_threadpool(manager.get_task, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    return StreamingResponse(
+        _task_events(task_id, task),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _task_events(task_id: str, task: Dict[str, Any]):
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    latest = {"task": task}
+
+    def on_change(snapshot: Dict[str, Any]):
+        # Llega desde el hilo de la conversión: solo se guarda el último
+        def apply():
+            latest["task"] = snapshot
+            changed.set()
+
+        loop.call_soon_threadsafe(apply)
+
+    unsubscribe = manager.subscribe(task_id, on_change)
+    try:
+        # Se relee tras suscribirse para no perder un cambio intermedio
+        current = await run_in_threadpool(manager.get_task, task_id) or task
+        yield _sse_event(current)
+        while current["estado"] not in ESTADOS_FINALES:
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            changed.clear()
+            current = latest["task"]
+            yield _sse_event(current)
+    finally:
+        unsubscribe()
+
+
+def _sse_event(task: Dict[str, Any]) -> str:
+    fields = ConversionStatusResponse.model_fields
+    data = {k: v for k, v in task.items() if k in fields}
+    return f"event: {task['estado']}\ndata: {json.dumps(data)}\n\n"
+
+
+# =========================================
+# 🛑 Cancelar una tarea
+# =========================================
+@router.delete(
+    "/tasks/{task_id}",
+    responses={
+        404: {"model": ErrorResponse, "description": "Tarea no encontrada"},
+        409: {"model": ErrorResponse, "description": "La tarea ya finalizó"},
+    },
+    summary="Cancela una conversión en cola o en ejecución",
+    description="Quita la tarea de la cola o detiene el proceso de ffmpeg si ya estaba convirtiendo.",
+)
+def cancelar_tarea(
+    task_id: str = Path(..., description="ID único de la tarea de conversión"),
+):
+    if not manager.get_task(task_id):
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    if not manager.cancel(task_id):
+        raise HTTPException(status_code=409, detail="La tarea ya finalizó")
+    return {"id": task_id, "estado": "cancelado"}
+
+
 # =========================================
 # 📋 Listar todas las tareas
 # =========================================
 @router.get(
     "/tasks",
     response_model=Dict[str, Any],
-    summary="Lista todas las tareas de conversión activas o completadas",
-    description="Muestra todas las tareas registradas en el ConversionManager, con su estado actual.",
+    summary="Lista las tareas de conversión activas o completadas",
+    description="Consulta paginada (más recientes primero) de las tareas guardadas, filtrable por estado, tipo y propietario.",
 )
-def listar_tareas():
-    return manager.list_tasks()
+def listar_tareas(
+    estado: Optional[str] = Query(
+        None, description="en_cola, procesando, listo, error o cancelado"
+    ),
+    tipo: Optional[str] = Query(None, description="'video' o 'audio'"),
+    propietario: Optional[str] = Query(None, description="Propietario de la tarea"),
+    lote: Optional[str] = Query(None, description="ID del lote que creó la tarea"),
+    limite: int = Query(50, ge=1, le=500, description="Máximo de resultados"),
+    offset: int = Query(0, ge=0, description="Cantidad de tareas a saltar"),
+):
+    tareas, total = manager.list_tasks(
+        estado=estado,
+        tipo=tipo,
+        propietario=propietario,
+        lote=lote,
+        limit=limite,
+        offset=offset,
+    )
+    return {"total": total, "limite": limite, "offset": offset, "tareas": tareas}
 
 
 # =========================================
@@ -129,12 +407,147 @@ def descargar_resultado(
     if task["estado"] != "listo":
         raise HTTPException(status_code=400, detail="La tarea aún no ha finalizado")
 
-    output_path = Path(task["output"])
+    output_path = FilePath(task["output"])
     if not output_path.exists():
         raise HTTPException(status_code=404, detail="Archivo convertido no encontrado")
 
+    # En caché el archivo se llama por su clave; se descarga con un nombre legible
+    download_name = f"{FilePath(task['archivo']).stem}_converted.{task['formato']}"
     return FileResponse(
         path=output_path,
-        filename=output_path.name,
+        filename=download_name,
         media_type="application/octet-stream",
     )
+
+
+# =========================================
+# 📺 Conversión en vivo
+# =========================================
+# Espera máxima por los primeros bytes antes de enviar los encabezados: si
+# ffmpeg falla de entrada todavía se puede responder con un error
+LIVE_FIRST_BYTE_TIMEOUT = 30.0
+
+
+@router.get(
+    "/live/{tipo}",
+    responses={
+        200: {"description": "Salida de la conversión a medida que se genera"},
+        400: {"model": ErrorResponse, "description": "Parámetros inválidos"},
+        404: {"model": ErrorResponse, "description": "Archivo no encontrado"},
+        500: {"model": ErrorResponse, "description": "ffmpeg falló al iniciar"},
+        503: {
+            "model": ErrorResponse,
+            "description": "Sin capacidad para otra conversión en vivo",
+        },
+    },
+    summary="Transmite una conversión mientras se genera",
+    description="""
+Convierte el archivo y envía la salida a medida que ffmpeg la produce, sin esperar a que termine
+(MP4/MOV/M4A salen como MP4 fragmentado; también `mkv`, `webm`, `mp3`, `ogg` y `flac`).  
+Otros pedidos del mismo archivo, formato y preset se unen a la conversión en curso desde el inicio
+(`X-Conversion-Cache: join`). El resultado queda en la caché de conversiones: cuando ya está completo
+se sirve desde el disco con soporte de rangos (`X-Conversion-Cache: hit`).
+""",
+)
+async def conversion_en_vivo(
+    request: Request,
+    tipo: str = Path(..., description="Tipo de archivo: 'video' o 'audio'"),
+    filename: str = Query(..., description="Nombre del archivo existente"),
+    formato: str = Query(..., description="Formato destino (mp4, mkv, webm, mp3...)"),
+    preset: Optional[str] = Query(
+        None, description="Preset si hay que recodificar: rapido, equilibrado o calidad"
+    ),
+):
+    if tipo not in ["video", "audio"]:
+        raise HTTPException(
+            status_code=400, detail="Tipo inválido. Usa 'video' o 'audio'."
+        )
+    input_dir = manager.video_dir if tipo == "video" else manager.audio_dir
+    input_path = input_dir / filename
+    if not input_path.is_file():
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    try:
+        cached, stream = await run_in_threadpool(live.open, input_path, formato, preset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LiveCapacityError as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": "10"}
+        )
+
+    media_type = mimetypes.guess_type(f"x.{formato}")[0] or "application/octet-stream"
+    if cached is not None:
+        return stream_file(
+            request,
+            str(cached),
+            media_type,
+            extra_headers={"X-Conversion-Cache": "hit"},
+        )
+
+    error = await _first_bytes(stream)
+    if error is not None:
+        stream.close()
+        raise HTTPException(status_code=500, detail=f"Error en la conversión: {error}")
+    return StreamingResponse(
+        _live_body(stream),
+        media_type=media_type,
+        headers={
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",
+            "X-Conversion-Cache": "join" if stream.joined else "live",
+            "X-Conversion-Mode": stream.job.modo or "",
+        },
+        # Por si el cliente se va antes de que empiece el cuerpo
+        background=BackgroundTask(stream.close),
+    )
+
+
+def _watch(job):
+    """Evento que se activa (en este loop) cada vez que el trabajo avanza."""
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    unsubscribe = job.subscribe(lambda: loop.call_soon_threadsafe(changed.set))
+    return changed, unsubscribe
+
+
+async def _first_bytes(stream: LiveStream) -> Optional[str]:
+    """Espera el primer bloque; devuelve el error si ffmpeg falló sin escribir nada."""
+    changed, unsubscribe = _watch(stream.job)
+    try:
+        while True:
+            changed.clear()
+            size, done, error = stream.job.snapshot()
+            if size or done:
+                return error if not size else None
+            await asyncio.wait_for(changed.wait(), timeout=LIVE_FIRST_BYTE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        unsubscribe()
+
+
+async def _live_body(stream: LiveStream):
+    changed, unsubscribe = _watch(stream.job)
+    offset = 0
+    try:
+        while True:
+            changed.clear()
+            size, done, error = stream.job.snapshot()
+            if offset < size:
+                chunk = await run_in_threadpool(
+                    stream.read, min(size - offset, CHUNK_SIZE)
+                )
+                offset += len(chunk)
+                yield chunk
+                continue
+            if done:
+                if error is not None:
+                    # Cortar la conexión: el cliente no debe tomar como
+                    # completa una salida truncada
+                    raise RuntimeError(f"La conversión en vivo falló: {error}")
+                return
+            await changed.wait()
+    finally:
+        unsubscribe()
+        stream.close()
@@ -1,14 +1,15 @@
 # routers/dashboard.py
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 from fastapi.responses import JSONResponse
 import os
-import psutil
-import mimetypes
 from datetime import datetime
+from services.media_catalog import catalog
+from services.paths import BASE_DIR
+from services.segment_cache import segment_cache
+from services.system_metrics import metrics_sampler
 
 router = APIRouter()
 
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 VIDEO_DIR = os.path.join(BASE_DIR, "content", "videos")
 AUDIO_DIR = os.path.join(BASE_DIR, "content", "audios")
 
@@ -16,67 +17,51 @@ os.makedirs(VIDEO_DIR, exist_ok=True)
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
 
-def scan_directory_stats(directory: str, valid_exts: tuple):
-    """Escanea una carpeta y devuelve archivos + estadísticas básicas."""
-    files = []
-    total_size = 0
-    count = 0
-
-    if not os.path.exists(directory):
-        return {"count": 0, "total_size_mb": 0, "files": []}
-
-    for f in os.listdir(directory):
-        if f.lower().endswith(valid_exts):
-            path = os.path.join(directory, f)
-            size = os.path.getsize(path)
-            total_size += size
-            count += 1
-            files.append(
-                {
-                    "nombre": f,
-                    "tipo": mimetypes.guess_type(path)[0] or "desconocido",
-                    "tamaño_MB": round(size / (1024 * 1024), 2),
-                    "ultima_modificacion": datetime.fromtimestamp(
-                        os.path.getmtime(path)
-                    ).isoformat(),
-                }
-            )
-
-    return {
-        "count": count,
-        "total_size_mb": round(total_size / (1024 * 1024), 2),
-        "files": sorted(files, key=lambda x: x["ultima_modificacion"], reverse=True)[
-            :5
-        ],  # top 5 recientes
-    }
+def directory_stats(kind: str):
+    """Estadísticas de una carpeta de medios, tomadas del catálogo en memoria."""
+    stats = catalog.stats(kind)
+    stats["files"] = [
+        {
+            "nombre": e.nombre,
+            "tipo": e.tipo or "desconocido",
+            "tamaño_MB": round(e.size / (1024 * 1024), 2),
+            "ultima_modificacion": datetime.fromtimestamp(e.mtime).isoformat(),
+        }
+        for e in stats["files"]
+    ]  # top 5 recientes
+    return stats
 
 
 @router.get(
     "/metrics",
     summary="📊 Muestra estadísticas en tiempo real del sistema y archivos",
-    description="Devuelve información sobre almacenamiento, rendimiento y contenido multimedia del servidor.",
+    description="Devuelve información sobre almacenamiento, rendimiento y contenido multimedia del servidor. Los datos del sistema salen de la última muestra del muestreador en segundo plano.",
 )
 def get_dashboard_metrics():
-    # Estadísticas del sistema
-    cpu_percent = psutil.cpu_percent(interval=0.5)
-    memory = psutil.virtual_memory()
-    disk = psutil.disk_usage("/")
+    # Estadísticas del sistema: última muestra, sin esperar a psutil
+    sample = metrics_sampler.latest()
 
-    # Escanear carpetas de videos y audios
-    video_stats = scan_directory_stats(VIDEO_DIR, (".mp4", ".mov", ".mkv", ".avi"))
-    audio_stats = scan_directory_stats(
-        AUDIO_DIR, (".mp3", ".wav", ".flac", ".ogg", ".m4a")
-    )
+    # Contenido de videos y audios desde el catálogo
+    video_stats = directory_stats("video")
+    audio_stats = directory_stats("audio")
 
     response = {
         "sistema": {
-            "cpu_uso_porcentaje": cpu_percent,
-            "memoria_uso_porcentaje": memory.percent,
+            "cpu_uso_porcentaje": sample["cpu_porcentaje"],
+            "memoria_uso_porcentaje": sample["memoria_porcentaje"],
             "almacenamiento": {
-                "usado_GB": round(disk.used / (1024**3), 2),
-                "total_GB": round(disk.total / (1024**3), 2),
-                "porcentaje": disk.percent,
+                "usado_GB": sample["disco_usado_GB"],
+                "total_GB": sample["disco_total_GB"],
+                "porcentaje": sample["disco_porcentaje"],
+                "lectura_KBps": sample["disco_lectura_KBps"],
+                "escritura_KBps": sample["disco_escritura_KBps"],
+            },
+            "red": {
+                "envio_KBps": sample["red_envio_KBps"],
+                "recepcion_KBps": sample["red_recepcion_KBps"],
             },
+            "proceso": sample["proceso"],
+            "muestra": datetime.fromtimestamp(sample["timestamp"]).isoformat(),
         },
         "contenido": {
             "videos": video_stats,
@@ -90,3 +75,31 @@ def get_dashboard_metrics():
     }
 
     return JSONResponse(content=response)
+
+
+@router.get(
+    "/metrics/series",
+    summary="📈 Serie de tiempo de las métricas del sistema",
+    description="Devuelve las muestras de CPU, memoria, disco, red y proceso de los últimos minutos, promediadas en como máximo `puntos` puntos.",
+)
+def get_metrics_series(
+    minutos: float = Query(15, gt=0, le=24 * 60, description="Ventana de tiempo"),
+    puntos: int = Query(60, ge=1, le=1000, description="Máximo de puntos"),
+):
+    series = metrics_sampler.series(minutos * 60, puntos)
+    return JSONResponse(
+        content={
+            "intervalo_segundos": metrics_sampler.interval,
+            "minutos": minutos,
+            "puntos": series,
+        }
+    )
+
+
+@router.get(
+    "/cache",
+    summary="🧊 Estadísticas de la caché de segmentos de streaming",
+    description="Devuelve aciertos, fallos, expulsiones y memoria usada por la caché de bloques calientes.",
+)
+def get_cache_stats():
+    return JSONResponse(content=segment_cache.stats())
@@ -1,13 +1,37 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import (
+    APIRouter,
+    UploadFile,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    Path as PathParam,
+    Query,
+    Request,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from pathlib import Path
+import os
+import re
 import shutil
+import uuid
 import mimetypes
-from services.file_registry import FileRegistry
+from services.faststart import faststart
+from services.file_registry import registry
+from services.media_catalog import catalog
+from services.media_metadata import metadata
+from services.paths import BASE_DIR, replace_lock
+from services.segment_cache import segment_cache
+from services.upload_sessions import (
+    MAX_CHUNK_BYTES,
+    ByteBudget,
+    UploadError,
+    UploadSessionManager,
+)
 
 router = APIRouter()
 
-BASE_DIR = Path(__file__).resolve().parent.parent
 CONTENT_DIR = BASE_DIR / "content"
 VIDEO_DIR = CONTENT_DIR / "videos"
 AUDIO_DIR = CONTENT_DIR / "audios"
@@ -15,7 +39,72 @@ AUDIO_DIR = CONTENT_DIR / "audios"
 VIDEO_DIR.mkdir(parents=True, exist_ok=True)
 AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 
-registry = FileRegistry(BASE_DIR)
+sessions = UploadSessionManager(CONTENT_DIR / "uploads" / "sessions")
+budget = ByteBudget()
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+# ============================
+# 🔧 FUNCIONES AUXILIARES
+# ============================
+def detect_kind(filename: str):
+    """Devuelve (carpeta, tipo) según el MIME o la extensión del archivo."""
+    # Detectar tipo MIME
+    mime_type, _ = mimetypes.guess_type(filename)
+    mime_type = mime_type or ""
+
+    # Verificar si es audio o video
+    if mime_type.startswith("video/"):
+        return VIDEO_DIR, "video"
+    if mime_type.startswith("audio/"):
+        return AUDIO_DIR, "audio"
+
+    # Si no se puede detectar por MIME, usamos la extensión
+    ext = filename.lower().split(".")[-1]
+    if ext in ["mp4", "mov", "avi", "mkv"]:
+        return VIDEO_DIR, "video"
+    if ext in ["mp3", "wav", "flac", "m4a", "ogg"]:
+        return AUDIO_DIR, "audio"
+    raise HTTPException(status_code=400, detail="Formato de archivo no soportado")
+
+
+def _save_upload(source, dest_path: Path):
+    # Guardar en un archivo temporal y reemplazar de forma atómica, para que
+    # los streams en curso sigan leyendo el archivo anterior por su descriptor
+    tmp_path = dest_path.with_name(f".{dest_path.name}.{uuid.uuid4().hex}.part")
+    try:
+        with tmp_path.open("wb") as buffer:
+            shutil.copyfileobj(source, buffer)
+        with replace_lock(dest_path):
+            os.replace(tmp_path, dest_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _publish(dest_path: Path, filename: str, tipo: str, owner: str):
+    """Deja visible un archivo recién colocado en su carpeta definitiva."""
+    # Descartar bloques en caché de una versión anterior del archivo
+    segment_cache.invalidate(str(dest_path))
+
+    # Registrar en metadatos (opcional)
+    registry.register(filename, owner)
+    catalog.upsert(tipo, filename, owner)
+
+    # Analizar con ffprobe en segundo plano (pool acotado)
+    metadata.schedule(tipo, filename)
+
+    # MP4/MOV con el índice al final: reescribirlo con +faststart en segundo
+    # plano para que la reproducción progresiva arranque de inmediato
+    faststart.schedule(tipo, filename)
+
+
+def _session_headers(session) -> dict:
+    return {
+        "Upload-Offset": str(session.offset),
+        "Upload-Length": str(session.length),
+        "Cache-Control": "no-store",
+    }
 
 
 @router.post(
@@ -30,40 +119,14 @@ async def upload_media(
     ),
 ):
     try:
-        # Detectar tipo MIME
-        mime_type, _ = mimetypes.guess_type(file.filename)
-        mime_type = mime_type or ""
-
-        # Verificar si es audio o video
-        if mime_type.startswith("video/"):
-            folder = VIDEO_DIR
-            tipo = "video"
-        elif mime_type.startswith("audio/"):
-            folder = AUDIO_DIR
-            tipo = "audio"
-        else:
-            # Si no se puede detectar por MIME, usamos la extensión
-            ext = file.filename.lower().split(".")[-1]
-            if ext in ["mp4", "mov", "avi", "mkv"]:
-                folder = VIDEO_DIR
-                tipo = "video"
-            elif ext in ["mp3", "wav", "flac", "m4a", "ogg"]:
-                folder = AUDIO_DIR
-                tipo = "audio"
-            else:
-                raise HTTPException(
-                    status_code=400, detail="Formato de archivo no soportado"
-                )
+        folder, tipo = detect_kind(file.filename)
 
         # Ruta final
         dest_path = folder / file.filename
 
-        # Guardar archivo en disco
-        with dest_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Registrar en metadatos (opcional)
-        registry.register(file.filename, owner)
+        # El disco se usa fuera del event loop
+        await run_in_threadpool(_save_upload, file.file, dest_path)
+        await run_in_threadpool(_publish, dest_path, file.filename, tipo, owner)
 
         return JSONResponse(
             {
@@ -79,3 +142,184 @@ async def upload_media(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al subir archivo: {e}")
+
+
+# ============================
+# ⏯️ SUBIDAS REANUDABLES
+# ============================
+@router.post(
+    "/uploads",
+    status_code=201,
+    summary="Crea una sesión de subida reanudable",
+    description="""
+Reserva una subida de `size` bytes y devuelve su `id` (también en `Location`).  
+Los fragmentos se envían luego con **PATCH** (`Upload-Offset`) o **PUT** (`Content-Range`), en paralelo
+y en cualquier orden; **HEAD** devuelve el offset confirmado para reanudar tras un corte, y
+`POST /media/uploads/{id}/complete` mueve el archivo a su carpeta y lo registra.
+""",
+)
+async def crear_subida(
+    filename: str = Query(..., description="Nombre final del archivo"),
+    size: int = Query(..., ge=0, description="Tamaño total en bytes"),
+    owner: str = Query("unknown", description="Propietario del archivo"),
+):
+    filename = Path(filename).name
+    if not filename or filename.startswith("."):
+        raise HTTPException(status_code=400, detail="Nombre de archivo inválido")
+    _, tipo = detect_kind(filename)
+    session = await run_in_threadpool(sessions.create, filename, tipo, owner, size)
+    return JSONResponse(
+        status_code=201,
+        content=session.to_dict(),
+        headers={
+            "Location": f"/media/uploads/{session.id}",
+            **_session_headers(session),
+        },
+    )
+
+
+async def _get_session(upload_id: str):
+    session = await run_in_threadpool(sessions.get, upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Sesión de subida no encontrada")
+    return session
+
+
+@router.head(
+    "/uploads/{upload_id}",
+    summary="Offset confirmado de una subida",
+    description="Devuelve en `Upload-Offset` cuántos bytes contiguos desde el inicio ya están guardados.",
+)
+async def offset_subida(upload_id: str = PathParam(..., description="ID de la subida")):
+    session = await _get_session(upload_id)
+    return Response(status_code=200, headers=_session_headers(session))
+
+
+@router.get(
+    "/uploads/{upload_id}",
+    summary="Estado de una subida reanudable",
+    description="Incluye los intervalos ya recibidos (`ranges`), útil para reenviar solo los que faltan.",
+)
+async def estado_subida(upload_id: str = PathParam(..., description="ID de la subida")):
+    session = await _get_session(upload_id)
+    return JSONResponse(session.to_dict(), headers=_session_headers(session))
+
+
+async def _receive_chunk(request: Request, upload_id: str, start: int) -> Response:
+    length = request.headers.get("content-length")
+    if length is None or not length.isdigit():
+        raise HTTPException(status_code=411, detail="Falta Content-Length")
+    length = int(length)
+    if length > MAX_CHUNK_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Fragmento demasiado grande (máximo {MAX_CHUNK_BYTES} bytes)",
+        )
+    session = await _get_session(upload_id)
+    if start + length > session.length:
+        raise HTTPException(
+            status_code=416, detail="El fragmento excede el tamaño declarado"
+        )
+
+    # Se reserva el presupuesto antes de leer el cuerpo: con muchas subidas en
+    # paralelo, las peticiones esperan en lugar de acumular memoria
+    await budget.acquire(length)
+    try:
+        body = bytearray()
+        async for piece in request.stream():
+            body += piece
+            if len(body) > length:
+                break
+        if len(body) != length:
+            raise HTTPException(
+                status_code=400, detail="El cuerpo no coincide con Content-Length"
+            )
+        session = await run_in_threadpool(sessions.write_chunk, upload_id, start, body)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    finally:
+        await budget.release(length)
+    return Response(status_code=204, headers=_session_headers(session))
+
+
+@router.patch(
+    "/uploads/{upload_id}",
+    status_code=204,
+    summary="Envía un fragmento por offset",
+    description="El cuerpo se escribe a partir de `Upload-Offset`. Se aceptan fragmentos fuera de orden.",
+)
+async def enviar_fragmento(
+    request: Request,
+    upload_id: str = PathParam(..., description="ID de la subida"),
+    upload_offset: int = Header(..., ge=0, description="Posición del fragmento"),
+):
+    return await _receive_chunk(request, upload_id, upload_offset)
+
+
+@router.put(
+    "/uploads/{upload_id}",
+    status_code=204,
+    summary="Envía un fragmento por Content-Range",
+    description="Alternativa a PATCH: el cuerpo va en la posición indicada por `Content-Range: bytes a-b/total`.",
+)
+async def enviar_fragmento_rango(
+    request: Request,
+    upload_id: str = PathParam(..., description="ID de la subida"),
+    content_range: str = Header(..., description="bytes inicio-fin/total"),
+):
+    match = CONTENT_RANGE_RE.match(content_range.strip())
+    if not match:
+        raise HTTPException(status_code=400, detail="Content-Range inválido")
+    start, end, _ = (int(g) for g in match.groups())
+    if end < start or request.headers.get("content-length") != str(end - start + 1):
+        raise HTTPException(
+            status_code=400, detail="Content-Range no coincide con Content-Length"
+        )
+    return await _receive_chunk(request, upload_id, start)
+
+
+@router.post(
+    "/uploads/{upload_id}/complete",
+    summary="Finaliza una subida reanudable",
+    description="Mueve el archivo completo a su carpeta con un rename atómico, lo registra y lo publica en el catálogo.",
+)
+async def finalizar_subida(
+    upload_id: str = PathParam(..., description="ID de la subida"),
+):
+    session = await _get_session(upload_id)
+    folder, _ = detect_kind(session.filename)
+    dest_path = folder / session.filename
+    try:
+        await run_in_threadpool(sessions.finalize, upload_id, dest_path)
+    except UploadError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers=_session_headers(session),
+        )
+    await run_in_threadpool(
+        _publish, dest_path, session.filename, session.tipo, session.owner
+    )
+    return JSONResponse(
+        {
+            "mensaje": "Archivo subido correctamente ✅",
+            "archivo": session.filename,
+            "tipo": session.tipo,
+            "propietario": session.owner,
+            "ruta": str(dest_path),
+        }
+    )
+
+
+@router.delete(
+    "/uploads/{upload_id}",
+    status_code=204,
+    summary="Cancela una subida reanudable",
+    description="Descarta los fragmentos recibidos y la sesión.",
+)
+async def cancelar_subida(
+    upload_id: str = PathParam(..., description="ID de la subida"),
+):
+    if not await run_in_threadpool(sessions.abort, upload_id):
+        raise HTTPException(status_code=404, detail="Sesión de subida no encontrada")
+    return Response(status_code=204)
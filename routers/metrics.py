@@ -0,0 +1,116 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from routers.conversion import live, manager
+from services.faststart import faststart
+from services.segment_cache import segment_cache
+from services.telemetry import registry
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def conversion_samples():
+    stats = manager.queue_stats()
+    yield (
+        "conversion_queue_depth",
+        "gauge",
+        "Conversiones esperando un worker, por prioridad",
+        [({"prioridad": str(p)}, n) for p, n in sorted(stats["en_cola"].items())],
+    )
+    yield (
+        "conversion_running",
+        "gauge",
+        "Conversiones en ejecución",
+        [({}, stats["procesando"])],
+    )
+    yield (
+        "conversion_workers",
+        "gauge",
+        "Workers de conversión",
+        [({}, stats["workers"])],
+    )
+
+    jobs = live.active_jobs()
+    yield (
+        "live_transcodes_active",
+        "gauge",
+        "Conversiones en vivo en curso",
+        [({}, len(jobs))],
+    )
+    yield (
+        "live_transcode_clients",
+        "gauge",
+        "Clientes recibiendo conversiones en vivo",
+        [({}, sum(job["clientes"] for job in jobs))],
+    )
+
+
+def segment_cache_samples():
+    stats = segment_cache.stats()
+    yield (
+        "segment_cache_lookups_total",
+        "counter",
+        "Búsquedas en la caché de segmentos",
+        [
+            ({"resultado": "hit"}, stats["hits"]),
+            ({"resultado": "miss"}, stats["misses"]),
+        ],
+    )
+    yield (
+        "segment_cache_evictions_total",
+        "counter",
+        "Bloques expulsados de la caché de segmentos",
+        [({}, stats["evictions"])],
+    )
+    yield (
+        "segment_cache_bytes",
+        "gauge",
+        "Memoria usada por la caché de segmentos",
+        [({}, stats["used_MB"] * 1024 * 1024)],
+    )
+
+
+def faststart_samples():
+    stats = faststart.stats()
+    yield (
+        "faststart_checks_total",
+        "counter",
+        "MP4/MOV subidos revisados, según si se reescribieron con +faststart",
+        [
+            ({"resultado": "reordenado"}, stats["reordenados"]),
+            ({"resultado": "sin_cambios"}, stats["sin_cambios"]),
+            ({"resultado": "descartado"}, stats["descartados"]),
+            ({"resultado": "error"}, stats["errores"]),
+        ],
+    )
+    yield (
+        "faststart_bytes_total",
+        "counter",
+        "Bytes reescritos por el reordenamiento faststart",
+        [({}, stats["bytes"])],
+    )
+    yield (
+        "faststart_seconds_total",
+        "counter",
+        "Tiempo total de ffmpeg en los reordenamientos faststart",
+        [({}, round(stats["segundos"], 3))],
+    )
+
+
+registry.add_collector(conversion_samples)
+registry.add_collector(segment_cache_samples)
+registry.add_collector(faststart_samples)
+
+
+# ============================
+# 📈 MÉTRICAS PARA PROMETHEUS
+# ============================
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    summary="Métricas en formato Prometheus",
+    description="Latencia por ruta, códigos de estado, bytes enviados, streams de rangos activos, tiempo al primer byte y cola de conversiones, en el formato de texto de Prometheus.",
+)
+def prometheus_metrics():
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
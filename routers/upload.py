@@ -1,25 +1,298 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse, JSONResponse
+from starlette.background import BackgroundTask
 from pathlib import Path
+from typing import AsyncIterator, Optional
+import asyncio
+import os
 import subprocess
-import shutil
 import uuid
 
+from routers.conversion import manager
+from services.conversion_manager import FFMPEG_CMD
+from services.encoding import PRESETS, plan_encoding
+from services.media_probe import parse_probe, probe_cmd, probe_media
+from services.paths import BASE_DIR
+
 router = APIRouter()
-BASE_DIR = Path(__file__).resolve().parent.parent
 UPLOAD_DIR = BASE_DIR / "content" / "uploads"
 OUTPUT_DIR = BASE_DIR / "content" / "converted"
 
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+FORMATOS = ("mp4", "mov")
+MODOS = ("auto", "directo", "tarea")
+UPLOAD_CHUNK = 1024 * 1024  # 1MB
+
+# En modo "auto", las subidas más grandes que esto se convierten como tarea
+# en segundo plano (202) en lugar de mantener la petición abierta
+SYNC_MAX_BYTES = int(os.getenv("UPLOAD_SYNC_MAX_MB", "64")) * 1024 * 1024
+
+# Contenedores que ffmpeg puede leer de forma secuencial desde una tubería.
+# MP4/MOV suelen llevar el índice (moov) al final y necesitan buscar en el
+# archivo, así que se guardan primero en disco.
+PIPE_INPUT_EXTS = (".mkv", ".webm", ".ts", ".mpg", ".mpeg", ".flv")
+# Bytes iniciales que se analizan con ffprobe antes de pasar la tubería
+PROBE_BYTES = 2 * 1024 * 1024
+
+
+# ============================
+# 🔧 FUNCIONES AUXILIARES
+# ============================
+async def _upload_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def _save_chunks(chunks: AsyncIterator[bytes], path: Path):
+    """Escribe el flujo en disco sin bloquear el event loop."""
+    f = await run_in_threadpool(path.open, "wb")
+    try:
+        async for chunk in chunks:
+            await run_in_threadpool(f.write, chunk)
+    finally:
+        await run_in_threadpool(f.close)
+
+
+async def _once(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+async def _run_process(cmd, chunks: Optional[AsyncIterator[bytes]] = None):
+    """
+    Ejecuta `cmd` como subproceso asíncrono; con `chunks`, los pasa por stdin
+    a medida que llegan. Devuelve (código de salida, stdout, stderr).
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if chunks else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    # stdout y stderr se leen en paralelo para que el proceso nunca se bloquee
+    output = asyncio.ensure_future(
+        asyncio.gather(proc.stdout.read(), proc.stderr.read())
+    )
+    try:
+        if chunks:
+            try:
+                async for chunk in chunks:
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # el proceso terminó antes; el código de salida dice por qué
+            finally:
+                proc.stdin.close()
+        stdout, stderr = await output
+        return await proc.wait(), stdout, stderr
+    except BaseException:
+        # Error o cliente desconectado: no dejar el proceso huérfano
+        output.cancel()
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+
+
+async def _probe_prefix(chunks: AsyncIterator[bytes]):
+    """
+    Analiza con ffprobe los primeros PROBE_BYTES del flujo. Devuelve los datos
+    del archivo y un flujo equivalente al original (desde el byte 0).
+    """
+    prefix = bytearray()
+    async for chunk in chunks:
+        prefix += chunk
+        if len(prefix) >= PROBE_BYTES:
+            break
+    try:
+        _, stdout, _ = await _run_process(probe_cmd("pipe:0"), _once(bytes(prefix)))
+        media = parse_probe(stdout.decode("utf-8", "replace"))
+    except OSError:
+        media = {}
+
+    async def replay():
+        yield bytes(prefix)
+        async for chunk in chunks:
+            yield chunk
+
+    return media, replay()
+
+
+async def _ffmpeg_from_stream(
+    chunks: AsyncIterator[bytes],
+    extension: str,
+    output_path: Path,
+    formato: str,
+    preset: Optional[str] = None,
+) -> str:
+    """
+    Convierte el flujo `chunks` a `output_path` con un subproceso asíncrono y
+    devuelve el modo usado (copia o recodificación). Si el contenedor lo
+    permite, la entrada se pasa a ffmpeg por stdin a medida que llega; si no,
+    se guarda en un temporal que se borra siempre al final.
+    """
+    piped = extension in PIPE_INPUT_EXTS
+    input_path = None
+    if not piped:
+        input_path = UPLOAD_DIR / f".{uuid.uuid4().hex}{extension}"
+
+    try:
+        if piped:
+            media, chunks = await _probe_prefix(chunks)
+            # La tubería no se puede releer: no hay segundo intento
+            plans = plan_encoding(formato, media, preset)[:1]
+        else:
+            await _save_chunks(chunks, input_path)
+            media = await run_in_threadpool(probe_media, input_path)
+            plans = plan_encoding(formato, media, preset)
+
+        source = "pipe:0" if piped else str(input_path)
+        for attempt, (modo, args) in enumerate(plans, start=1):
+            cmd = FFMPEG_CMD + ["-y", "-nostats", "-loglevel", "error", "-i", source]
+            cmd += args + [str(output_path)]
+            returncode, _, stderr = await _run_process(cmd, chunks if piped else None)
+            if returncode == 0:
+                return modo
+            # Si falla el remux se intenta recodificar
+            output_path.unlink(missing_ok=True)
+            if attempt == len(plans):
+                raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    finally:
+        if input_path is not None:
+            input_path.unlink(missing_ok=True)
+
+
+def _validate(formato: str, modo: str, preset: Optional[str] = None):
+    if formato not in FORMATOS:
+        raise HTTPException(
+            status_code=400, detail="Formato de salida no soportado (usa mp4 o mov)"
+        )
+    if modo not in MODOS:
+        raise HTTPException(
+            status_code=400, detail="Modo inválido. Usa 'auto', 'directo' o 'tarea'"
+        )
+    if preset is not None and preset not in PRESETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Preset inválido. Usa uno de: {', '.join(PRESETS)}",
+        )
+
+
+def _task_mode(modo: str, size: Optional[int]) -> bool:
+    if modo == "auto":
+        return size is not None and size > SYNC_MAX_BYTES
+    return modo == "tarea"
+
+
+async def _convert_response(
+    chunks: AsyncIterator[bytes],
+    filename: str,
+    formato: str,
+    preset: Optional[str] = None,
+) -> FileResponse:
+    """
+    Conversión en la misma petición: devuelve el archivo y luego lo borra.
+    Ocupa uno de los lugares de ffmpeg del gestor de conversiones (503 si no
+    hay ninguno libre), igual que las tareas en cola y las conversiones en vivo.
+    """
+    if not manager.acquire_slot():
+        raise HTTPException(
+            status_code=503,
+            detail="Demasiadas conversiones en curso; intenta de nuevo más tarde",
+            headers={"Retry-After": "10"},
+        )
+    output_path = OUTPUT_DIR / f".{uuid.uuid4().hex}.{formato}"
+    try:
+        modo = await _ffmpeg_from_stream(
+            chunks, Path(filename).suffix.lower(), output_path, formato, preset
+        )
+    except BaseException:
+        output_path.unlink(missing_ok=True)
+        raise
+    finally:
+        manager.release_slot()
+
+    output_name = f"{Path(filename).stem}_converted.{formato}"
+    return FileResponse(
+        path=output_path,
+        filename=output_name,
+        media_type="application/octet-stream",
+        headers={"X-Conversion-Mode": modo},
+        background=BackgroundTask(output_path.unlink, missing_ok=True),
+    )
+
+
+async def _enqueue_task(
+    chunks: AsyncIterator[bytes],
+    filename: str,
+    formato: str,
+    owner: str,
+    preset: Optional[str] = None,
+) -> JSONResponse:
+    """Guarda la subida y la entrega al pool de conversiones (202 Accepted)."""
+    input_path = UPLOAD_DIR / f"{uuid.uuid4().hex}{Path(filename).suffix.lower()}"
+    try:
+        await _save_chunks(chunks, input_path)
+        task_id = await run_in_threadpool(
+            manager.submit_file,
+            input_path,
+            formato,
+            "video",
+            owner=owner,
+            archivo=filename,
+            temporary=True,
+            preset=preset,
+        )
+    except BaseException:
+        input_path.unlink(missing_ok=True)
+        raise
+
+    return JSONResponse(
+        status_code=202,
+        headers={"Location": f"/convert/status/{task_id}"},
+        content={
+            "task_id": task_id,
+            "estado": "en_cola",
+            "descripcion": "Conversión encolada; consulta el estado o sigue los eventos",
+            "estado_url": f"/convert/status/{task_id}",
+            "eventos_url": f"/convert/events/{task_id}",
+            "descarga_url": f"/convert/download/{task_id}",
+        },
+    )
+
+
+def _ffmpeg_error(e: subprocess.CalledProcessError) -> HTTPException:
+    detail = (e.stderr or b"").decode("utf-8", "replace")
+    return HTTPException(status_code=500, detail=f"Error en FFmpeg: {detail}")
+
 
+# ============================
+# 📤 SUBIR Y CONVERTIR
+# ============================
 @router.post(
     "/upload/video",
+    responses={
+        202: {"description": "Subida grande: la conversión continúa como tarea"},
+        400: {"description": "Formato o modo inválido"},
+        503: {"description": "Todos los lugares de ffmpeg están ocupados"},
+    },
     summary="Sube y convierte un video directamente",
     description="""
-Permite subir un archivo de video y convertirlo inmediatamente a otro formato (por ejemplo .mp4 → .mov).
-Devuelve el archivo convertido para descarga directa.
+Permite subir un archivo de video y convertirlo a otro formato (por ejemplo .mkv → .mp4).
+En modo **directo** devuelve el archivo convertido en la misma respuesta. En modo **tarea** responde
+`202 Accepted` con un `task_id` para seguir la conversión en `/convert/status`, `/convert/events` y
+descargarla en `/convert/download`. El modo **auto** usa tarea para archivos de más de `UPLOAD_SYNC_MAX_MB`.
+El archivo multipart se recibe completo antes de empezar a convertir; para que ffmpeg convierta
+mientras llegan los bytes usa `/upload/video/stream`. La conversión corre en un subproceso
+asíncrono, sin bloquear el resto de peticiones, y en modo directo ocupa uno de los lugares de
+ffmpeg del servidor (`503` si están todos ocupados).  
+Si el formato destino admite los códecs del video, los streams se copian sin recodificar
+(encabezado `X-Conversion-Mode: copia`); si no, se recodifica con el `preset` indicado.
 """,
 )
 async def convertir_video_subido(
@@ -27,43 +300,64 @@ async def convertir_video_subido(
         ..., description="Archivo de video a convertir (.mp4, .mov, etc.)"
     ),
     formato: str = Form(..., description="Formato de salida (mp4 o mov)"),
+    modo: str = Form("auto", description="auto, directo o tarea"),
+    owner: str = Form("unknown", description="Propietario de la tarea (modo tarea)"),
+    preset: Optional[str] = Form(
+        None, description="Preset si hay que recodificar: rapido, equilibrado o calidad"
+    ),
 ):
+    _validate(formato, modo, preset)
     try:
-        # Verificar formato
-        if formato not in ["mp4", "mov"]:
-            raise HTTPException(
-                status_code=400, detail="Formato de salida no soportado (usa mp4 o mov)"
+        if _task_mode(modo, file.size):
+            return await _enqueue_task(
+                _upload_chunks(file), file.filename, formato, owner, preset
             )
-
-        # Guardar archivo temporalmente
-        temp_name = f"{uuid.uuid4()}_{file.filename}"
-        input_path = UPLOAD_DIR / temp_name
-
-        with input_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Crear nombre de salida
-        output_name = f"{input_path.stem}_converted.{formato}"
-        output_path = OUTPUT_DIR / output_name
-
-        # Ejecutar FFmpeg
-        cmd = ["ffmpeg", "-y", "-i", str(input_path), str(output_path)]
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        # Eliminar el archivo temporal
-        input_path.unlink(missing_ok=True)
-
-        # Devolver el archivo convertido directamente
-        return FileResponse(
-            path=output_path,
-            filename=output_name,
-            media_type="application/octet-stream",
-            headers={"Content-Disposition": f"attachment; filename={output_name}"},
+        return await _convert_response(
+            _upload_chunks(file), file.filename, formato, preset
         )
+    except HTTPException:
+        raise
+    except subprocess.CalledProcessError as e:
+        raise _ffmpeg_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post(
+    "/upload/video/stream",
+    responses={
+        202: {"description": "Subida grande: la conversión continúa como tarea"},
+        400: {"description": "Formato o modo inválido"},
+        503: {"description": "Todos los lugares de ffmpeg están ocupados"},
+    },
+    summary="Convierte un video enviado como cuerpo binario",
+    description="""
+Igual que `/upload/video`, pero el video se envía como cuerpo crudo de la petición (sin multipart).
+Con contenedores secuenciales (mkv, webm, ts, mpeg, flv) ffmpeg empieza a convertir mientras el cuerpo
+aún se está recibiendo, sin escribir la entrada en disco. En modo directo ocupa uno de los lugares de
+ffmpeg del servidor (`503` si están todos ocupados).
+""",
+)
+async def convertir_video_stream(
+    request: Request,
+    nombre: str = Query(..., description="Nombre original del archivo (con extensión)"),
+    formato: str = Query(..., description="Formato de salida (mp4 o mov)"),
+    modo: str = Query("auto", description="auto, directo o tarea"),
+    owner: str = Query("unknown", description="Propietario de la tarea (modo tarea)"),
+    preset: Optional[str] = Query(
+        None, description="Preset si hay que recodificar: rapido, equilibrado o calidad"
+    ),
+):
+    _validate(formato, modo, preset)
+    length = request.headers.get("content-length")
+    size = int(length) if length and length.isdigit() else None
+    try:
+        if _task_mode(modo, size):
+            return await _enqueue_task(request.stream(), nombre, formato, owner, preset)
+        return await _convert_response(request.stream(), nombre, formato, preset)
+    except HTTPException:
+        raise
     except subprocess.CalledProcessError as e:
-        raise HTTPException(
-            status_code=500, detail=f"Error en FFmpeg: {e.stderr.decode('utf-8')}"
-        )
+        raise _ffmpeg_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
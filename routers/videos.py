@@ -1,16 +1,38 @@
-from fastapi import APIRouter, HTTPException, Request, Path
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from fastapi import APIRouter, HTTPException, Request, Path, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from typing import List
-import aiofiles
+from typing import List, Optional
+from datetime import datetime
+import asyncio
 import mimetypes
 import os
+import re
+from pathlib import Path as FilePath
+from urllib.parse import quote
+from routers.conversion import manager
+from services.clips import ClipError, clips
+from services.http_cache import (
+    CACHE_CONTROL,
+    CACHE_CONTROL_IMMUTABLE,
+    CACHE_CONTROL_LISTING,
+    http_date,
+    is_not_modified,
+    listing_etag,
+    not_modified,
+    version_token,
+)
+from services.media_catalog import catalog
+from services.media_metadata import METADATA_TIMEOUT, MediaInfoResponse, metadata
+from services.packaging import HLS_MEDIA_TYPES, rewrite_master
+from services.paths import BASE_DIR
+from services.previews import PreviewError, previews
+from services.streaming import stream_file
 
 router = APIRouter()
 
 # 📂 Directorio base de videos
-VIDEO_DIR = os.path.join(os.path.dirname(__file__), "..", "content", "videos")
-CHUNK_SIZE = 1024 * 256  # 256KB - Óptimo para streaming progresivo
+VIDEO_DIR = os.path.join(BASE_DIR, "content", "videos")
 
 
 # ============================
@@ -20,16 +42,41 @@ class VideoItem(BaseModel):
     nombre: str
     tipo: str
     tamaño_MB: float
+    propietario: str = "unknown"
+    ultima_modificacion: Optional[str] = None
+    url: Optional[str] = None
+    poster_url: Optional[str] = None
+    vista_previa_url: Optional[str] = None
+    duracion: Optional[float] = None
+    resolucion: Optional[str] = None
+    codec_video: Optional[str] = None
+    codec_audio: Optional[str] = None
+    bitrate: Optional[int] = None
 
 
 class VideoListResponse(BaseModel):
     videos: List[VideoItem]
+    siguiente_cursor: Optional[str] = None
 
 
 class ErrorResponse(BaseModel):
     detail: str
 
 
+def _listing_meta(meta: Optional[dict]) -> dict:
+    """Campos de ffprobe que se agregan a cada video del listado."""
+    if not meta or meta["error"]:
+        return {}
+    resolucion = f"{meta['ancho']}x{meta['alto']}" if meta["ancho"] else None
+    return {
+        "duracion": meta["duracion"],
+        "resolucion": resolucion,
+        "codec_video": meta["codec_video"],
+        "codec_audio": meta["codec_audio"],
+        "bitrate": meta["bitrate"],
+    }
+
+
 # ============================
 # 🎞️ LISTAR VIDEOS DISPONIBLES
 # ============================
@@ -37,32 +84,61 @@ class ErrorResponse(BaseModel):
     "/",
     response_model=VideoListResponse,
     summary="Lista todos los videos disponibles",
-    description="Devuelve los videos almacenados en el servidor, con nombre, tipo MIME y tamaño (MB).",
+    description="Devuelve los videos almacenados en el servidor, con nombre, tipo MIME y tamaño (MB). Admite paginación por cursor, filtros y orden.",
 )
-async def listar_videos():
-    try:
-        if not os.path.exists(VIDEO_DIR):
-            raise HTTPException(
-                status_code=404, detail="Carpeta de videos no encontrada"
-            )
-
-        files = []
-        for f in os.listdir(VIDEO_DIR):
-            if f.lower().endswith((".mp4", ".mkv", ".mov", ".avi")):
-                path = os.path.join(VIDEO_DIR, f)
-                tipo, _ = mimetypes.guess_type(path)
-                size_mb = round(os.path.getsize(path) / (1024 * 1024), 2)
-                files.append(
-                    {
-                        "nombre": f,
-                        "tipo": tipo or "video/mp4",
-                        "tamaño_MB": size_mb,
-                    }
-                )
+async def listar_videos(
+    limite: int = Query(100, ge=1, le=1000, description="Máximo de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página anterior"),
+    extension: Optional[str] = Query(None, description="Filtrar por extensión"),
+    min_MB: Optional[float] = Query(None, ge=0, description="Tamaño mínimo (MB)"),
+    max_MB: Optional[float] = Query(None, ge=0, description="Tamaño máximo (MB)"),
+    propietario: Optional[str] = Query(None, description="Filtrar por propietario"),
+    orden: str = Query("nombre", description="Ordenar por nombre, tamaño o fecha"),
+    direccion: str = Query("asc", description="asc o desc"),
+    request: Request = None,
+    response: Response = None,
+):
+    # El ETag del listado depende solo de la versión del catálogo y los filtros
+    etag = listing_etag("video", catalog.version, request.url.query)
+    cache_headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(catalog.updated_at),
+        "Cache-Control": CACHE_CONTROL_LISTING,
+    }
+    if is_not_modified(request.headers, etag, catalog.updated_at):
+        return not_modified(cache_headers)
 
-        return {"videos": files}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    try:
+        entries, siguiente = catalog.query(
+            "video",
+            limit=limite,
+            cursor=cursor,
+            ext=extension,
+            min_size=int(min_MB * 1024 * 1024) if min_MB is not None else None,
+            max_size=int(max_MB * 1024 * 1024) if max_MB is not None else None,
+            owner=propietario,
+            sort=orden,
+            order=direccion,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    files = [
+        {
+            "nombre": e.nombre,
+            "tipo": e.tipo or "video/mp4",
+            "tamaño_MB": round(e.size / (1024 * 1024), 2),
+            "propietario": e.owner,
+            "ultima_modificacion": datetime.fromtimestamp(e.mtime).isoformat(),
+            "url": f"/videos/{quote(e.nombre)}?v={e.token}",
+            "poster_url": f"/videos/{quote(e.nombre)}/poster.jpg?v={e.token}",
+            "vista_previa_url": f"/videos/{quote(e.nombre)}/preview.vtt?v={e.token}",
+            **_listing_meta(e.meta),
+        }
+        for e in entries
+    ]
+    response.headers.update(cache_headers)
+    return {"videos": files, "siguiente_cursor": siguiente}
 
 
 # ============================
@@ -74,6 +150,7 @@ async def listar_videos():
         200: {"description": "Streaming de video"},
         206: {"description": "Contenido parcial (streaming progresivo)"},
         404: {"model": ErrorResponse},
+        416: {"model": ErrorResponse, "description": "Rango no satisfacible"},
     },
     summary="Reproduce un video específico por streaming",
     description="Permite reproducir un video directamente en el navegador con soporte de carga progresiva optimizada.",
@@ -83,90 +160,319 @@ async def stream_video(
     request: Request = None,
 ):
     file_path = os.path.join(VIDEO_DIR, filename)
-    if not os.path.exists(file_path):
+    return stream_file(request, file_path, "video/mp4")
+
+
+# ============================
+# 🔬 METADATOS (FFPROBE)
+# ============================
+@router.get(
+    "/{filename}/info",
+    response_model=MediaInfoResponse,
+    responses={404: {"model": ErrorResponse}, 504: {"model": ErrorResponse}},
+    summary="Metadatos técnicos de un video",
+    description="Duración, bitrate, contenedor, resolución y códecs obtenidos con ffprobe, y en MP4/MOV si el índice (moov) va al principio (`disposicion`). Se analiza una sola vez por versión del archivo y el resultado queda guardado en la base de datos.",
+)
+async def info_video(
+    filename: str = Path(..., description="Nombre del video"),
+    request: Request = None,
+    response: Response = None,
+):
+    future = metadata.schedule("video", filename)
+    if future is None:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    try:
+        # El análisis se espera sin ocupar un hilo del servidor; shield evita
+        # que un cliente que corta cancele el análisis compartido
+        data = await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(future)), METADATA_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="ffprobe no respondió a tiempo")
+
+    # Los metadatos solo cambian si cambia el archivo
+    etag = f'"{data["token"]}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL_LISTING}
+    if is_not_modified(request.headers, etag):
+        return not_modified(headers)
+    response.headers.update(headers)
+    return {
+        **data,
+        "nombre": filename,
+        "tamaño_bytes": data["size"],
+        "analizado": datetime.fromtimestamp(data["analizado"]).isoformat(),
+    }
 
-    file_size = os.path.getsize(file_path)
-    media_type, _ = mimetypes.guess_type(file_path)
-    media_type = media_type or "video/mp4"
-    range_header = request.headers.get("range")
-
-    # 🧠 Función generadora de chunks (asíncrona y optimizada)
-    async def iterfile(start=0, end=None):
-        async with aiofiles.open(file_path, "rb") as f:
-            await f.seek(start)
-            remaining = (end - start + 1) if end else (file_size - start)
-
-            while remaining > 0:
-                chunk_size = min(CHUNK_SIZE, remaining)
-                chunk = await f.read(chunk_size)
-
-                if not chunk:
-                    break
-
-                yield chunk
-                remaining -= len(chunk)
-
-    # 🔍 Soporte para Range Requests (carga progresiva)
-    if range_header:
-        try:
-            # Parsear el header Range
-            range_header = range_header.strip().lower()
-            if not range_header.startswith("bytes="):
-                raise HTTPException(status_code=400, detail="Formato de Range inválido")
-
-            range_value = range_header.replace("bytes=", "")
-
-            # Manejar múltiples rangos (tomar solo el primero)
-            if "," in range_value:
-                range_value = range_value.split(",")[0]
-
-            start_str, end_str = range_value.split("-")
-
-            # Calcular start y end
-            start = int(start_str) if start_str else 0
-            end = int(end_str) if end_str else file_size - 1
-
-            # Validar rangos
-            if start < 0 or start >= file_size:
-                raise HTTPException(
-                    status_code=416, detail="Rango solicitado fuera de límites"
-                )
-
-            # Asegurar que end no exceda el tamaño del archivo
-            end = min(end, file_size - 1)
-
-            # Calcular el tamaño del contenido a enviar
-            content_length = end - start + 1
-
-        except (ValueError, IndexError):
-            raise HTTPException(status_code=400, detail="Encabezado Range mal formado")
-
-        # Headers optimizados para streaming parcial
-        headers = {
-            "Content-Range": f"bytes {start}-{end}/{file_size}",
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(content_length),
-            "Cache-Control": "public, max-age=3600",
-            "Connection": "keep-alive",
-        }
 
-        return StreamingResponse(
-            iterfile(start, end),
-            status_code=206,
-            headers=headers,
-            media_type=media_type,
+# ============================
+# 🖼️ PÓSTER Y VISTA PREVIA DE BÚSQUEDA
+# ============================
+async def _serve_preview(
+    request: Request, filename: str, schedule, pick, media_type: str
+):
+    """
+    Genera (o toma de la caché) una vista previa y la sirve. Con `?v=` igual
+    a la versión actual del video la respuesta es inmutable.
+    """
+    input_path = FilePath(VIDEO_DIR) / filename
+    try:
+        # Se espera la generación sin ocupar un hilo del servidor; shield
+        # evita que un cliente que corta cancele la generación compartida
+        future = schedule(input_path)
+        target = pick(await asyncio.shield(asyncio.wrap_future(future)))
+        st = os.stat(input_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    except PreviewError as e:
+        raise HTTPException(
+            status_code=500, detail=f"No se pudo generar la vista previa: {e}"
         )
+    immutable = request.query_params.get("v") == version_token(st)
+    cache_control = CACHE_CONTROL_IMMUTABLE if immutable else CACHE_CONTROL
+    return stream_file(
+        request, str(target), media_type, extra_headers={"Cache-Control": cache_control}
+    )
 
-    # 📦 Respuesta completa (sin Range) - Primera solicitud
-    headers = {
-        "Accept-Ranges": "bytes",
-        "Content-Length": str(file_size),
-        "Cache-Control": "public, max-age=3600",
-    }
 
-    return StreamingResponse(
-        iterfile(), media_type=media_type, headers=headers, status_code=200
+@router.get(
+    "/{filename}/poster.jpg",
+    responses={
+        200: {"content": {"image/jpeg": {}}, "description": "Póster del video"},
+        404: {"model": ErrorResponse},
+    },
+    summary="Póster de un video",
+    description="Imagen JPEG de un keyframe cercano al inicio. Se genera la primera vez que se pide y se reutiliza mientras el video no cambie.",
+)
+async def poster_video(
+    filename: str = Path(..., description="Nombre del video"),
+    request: Request = None,
+):
+    return await _serve_preview(
+        request, filename, previews.schedule_poster, lambda target: target, "image/jpeg"
+    )
+
+
+@router.get(
+    "/{filename}/preview.vtt",
+    responses={
+        200: {"content": {"text/vtt": {}}, "description": "Pistas WebVTT"},
+        404: {"model": ErrorResponse},
+    },
+    summary="Vista previa de la barra de búsqueda (WebVTT)",
+    description="""
+Pista WebVTT con una miniatura por intervalo: cada cue apunta a su recuadro dentro de
+`sprite.jpg` (`#xywh=x,y,ancho,alto`). Las miniaturas salen solo de keyframes y se generan
+la primera vez que se piden.
+""",
+)
+async def preview_vtt(
+    filename: str = Path(..., description="Nombre del video"),
+    request: Request = None,
+):
+    return await _serve_preview(
+        request,
+        filename,
+        previews.schedule_seek_preview,
+        lambda paths: paths[0],
+        "text/vtt",
+    )
+
+
+@router.get(
+    "/{filename}/sprite.jpg",
+    responses={
+        200: {"content": {"image/jpeg": {}}, "description": "Hoja de miniaturas"},
+        404: {"model": ErrorResponse},
+    },
+    summary="Hoja de miniaturas de la vista previa",
+    description="Imagen con todas las miniaturas de `preview.vtt` en una grilla.",
+)
+async def preview_sprite(
+    filename: str = Path(..., description="Nombre del video"),
+    request: Request = None,
+):
+    return await _serve_preview(
+        request,
+        filename,
+        previews.schedule_seek_preview,
+        lambda paths: paths[1],
+        "image/jpeg",
+    )
+
+
+# ============================
+# ✂️ CLIPS
+# ============================
+@router.get(
+    "/{filename}/clip",
+    responses={
+        200: {"description": "Clip del video"},
+        206: {"description": "Contenido parcial del clip"},
+        400: {"model": ErrorResponse, "description": "Rango inválido"},
+        404: {"model": ErrorResponse},
+        500: {"model": ErrorResponse, "description": "ffmpeg no pudo generar el clip"},
+    },
+    summary="Fragmento de un video sin recodificar",
+    description="""
+Extrae el tramo entre `start` y `end` (segundos) copiando los streams, sin recodificar: el clip
+empieza en el keyframe anterior a `start`. Con `exacto=true` se recodifica (con `preset`) para
+cortar en el cuadro justo. El clip se guarda en caché por versión del archivo y rango, y se sirve
+con soporte de rangos; con `?v=` igual a la versión actual la respuesta es inmutable.
+""",
+)
+async def clip_video(
+    filename: str = Path(..., description="Nombre del video"),
+    start: float = Query(..., ge=0, description="Inicio en segundos"),
+    end: float = Query(..., gt=0, description="Fin en segundos"),
+    exacto: bool = Query(
+        False, description="Recodificar para cortar en el cuadro exacto"
+    ),
+    preset: Optional[str] = Query(
+        None, description="Preset si exacto: rapido, equilibrado o calidad"
+    ),
+    request: Request = None,
+):
+    input_path = FilePath(VIDEO_DIR) / filename
+    try:
+        # El análisis (ffprobe) y ffmpeg se esperan sin ocupar hilos del
+        # servidor; shield evita que un cliente que corta cancele la
+        # generación compartida
+        analysis = metadata.schedule("video", filename)
+        if analysis is not None:
+            await asyncio.shield(asyncio.wrap_future(analysis))
+        future = await run_in_threadpool(
+            clips.schedule, input_path, start, end, exacto, preset
+        )
+        target = await asyncio.shield(asyncio.wrap_future(future))
+        st = os.stat(input_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ClipError as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo generar el clip: {e}")
+
+    immutable = request.query_params.get("v") == version_token(st)
+    clip_name = f"{input_path.stem}_{start:g}-{end:g}{input_path.suffix}"
+    return stream_file(
+        request,
+        str(target),
+        mimetypes.guess_type(filename)[0] or "video/mp4",
+        extra_headers={
+            "Cache-Control": CACHE_CONTROL_IMMUTABLE if immutable else CACHE_CONTROL,
+            "Content-Disposition": f"inline; filename*=UTF-8''{quote(clip_name)}",
+        },
+    )
+
+
+# ============================
+# 📶 STREAMING ADAPTATIVO (HLS)
+# ============================
+@router.get(
+    "/{filename}/hls/master.m3u8",
+    responses={
+        200: {
+            "content": {"application/vnd.apple.mpegurl": {}},
+            "description": "Lista maestra HLS",
+        },
+        202: {"description": "El paquete HLS se está generando"},
+        404: {"model": ErrorResponse},
+        422: {
+            "model": ErrorResponse,
+            "description": "El empaquetado de esta versión del video falló",
+        },
+    },
+    summary="Lista maestra HLS de un video",
+    description="""
+Devuelve la lista maestra con las variantes 1080p/720p/480p (las que no superan la resolución
+original) y una pista solo de audio. El paquete se genera la primera vez que se pide: mientras
+tanto responde **202** con el `task_id` (seguible en `/convert/events/{task_id}`) y `Retry-After`.
+Si el empaquetado falló responde **422** con el error, sin reintentar hasta que cambie el video.
+Las variantes y segmentos se sirven bajo una ruta versionada, cacheable como inmutable.
+""",
+)
+def hls_master(
+    filename: str = Path(..., description="Nombre del video"),
+    request: Request = None,
+):
+    input_path = FilePath(VIDEO_DIR) / filename
+    if not input_path.is_file():
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    package = manager.cached_output(input_path, "hls", perfil="hls")
+    if package is None:
+        # Si esta versión del video ya falló no se vuelve a empaquetar: un
+        # cliente que reintenta no debe lanzar un ffmpeg por cada consulta
+        last = manager.last_task_for(input_path, "hls", perfil="hls")
+        if last and last["estado"] == "error":
+            raise HTTPException(
+                status_code=422,
+                detail=f"No se pudo empaquetar el video: {last.get('error')}",
+            )
+        entry = catalog.get("video", filename)
+        task_id = manager.submit_file(
+            input_path,
+            "hls",
+            "video",
+            owner=entry.owner if entry else "unknown",
+            perfil="hls",
+        )
+        task = manager.get_task(task_id) or {}
+        if task.get("estado") != "listo":
+            return JSONResponse(
+                status_code=202,
+                headers={"Retry-After": "5", "Cache-Control": "no-store"},
+                content={
+                    "task_id": task_id,
+                    "estado": task.get("estado"),
+                    "progreso": task.get("progreso"),
+                    "error": task.get("error"),
+                    "eventos_url": f"/convert/events/{task_id}",
+                },
+            )
+        package = FilePath(task["output"])
+
+    # El nombre de la carpeta es la clave de caché: cambia si cambia el video
+    key = package.name.split(".")[0]
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL_LISTING}
+    if is_not_modified(request.headers, etag):
+        return not_modified(headers)
+    master = (package / "master.m3u8").read_text(encoding="utf-8")
+    return Response(
+        content=rewrite_master(master, f"{key}/"),
+        media_type=HLS_MEDIA_TYPES[".m3u8"],
+        headers=headers,
+    )
+
+
+@router.get(
+    "/{filename}/hls/{key}/{ruta:path}",
+    responses={
+        200: {"description": "Lista de variante o segmento HLS"},
+        404: {"model": ErrorResponse},
+    },
+    summary="Variantes y segmentos HLS",
+    description="Sirve las listas de cada variante y sus segmentos. La ruta incluye la versión del paquete, así que se cachean por un año.",
+)
+async def hls_segment(
+    filename: str = Path(..., description="Nombre del video"),
+    key: str = Path(..., description="Versión del paquete HLS"),
+    ruta: str = Path(..., description="Variante y archivo (p. ej. 720p/seg_00001.ts)"),
+    request: Request = None,
+):
+    if not re.fullmatch(r"[0-9a-f]{64}", key):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    package = (manager.cache_dir / f"{key}.hls").resolve()
+    file_path = (package / ruta).resolve()
+    if package not in file_path.parents:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    return stream_file(
+        request,
+        str(file_path),
+        HLS_MEDIA_TYPES.get(file_path.suffix, "application/octet-stream"),
+        extra_headers={"Cache-Control": CACHE_CONTROL_IMMUTABLE},
     )
 
 
@@ -184,17 +490,12 @@ async def stream_video(
 )
 async def descargar_video(
     filename: str = Path(..., description="Nombre del video a descargar"),
+    request: Request = None,
 ):
     file_path = os.path.join(VIDEO_DIR, filename)
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Archivo no encontrado")
-
-    media_type, _ = mimetypes.guess_type(file_path)
-    media_type = media_type or "video/mp4"
-
-    return FileResponse(
-        path=file_path,
-        filename=filename,
-        media_type=media_type,
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    return stream_file(
+        request,
+        file_path,
+        "video/mp4",
+        extra_headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
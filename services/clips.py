@@ -0,0 +1,134 @@
+"""
+Fragmentos (clips) de videos y audios sin recodificar.
+
+ffmpeg salta con `-ss` antes de `-i` al keyframe anterior al inicio pedido y
+copia los streams (`-c copy`) hasta el final: el clip cuesta lo que leer ese
+tramo del archivo. Solo con `exacto` se recodifica para cortar en el cuadro
+justo. Los clips se guardan en content/converted/clips con una clave derivada
+de (archivo, tamaño, mtime, inicio, fin, modo), así que el mismo pedido se
+sirve del disco; los de versiones anteriores del archivo se borran al generar
+uno nuevo y la carpeta se recorta por LRU cuando supera `budget` bytes.
+"""
+
+import os
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from services.derived_cache import DerivedCache
+from services.encoding import DEFAULT_PRESET, PRESETS, encode_args
+from services.media_metadata import metadata
+from services.media_probe import probe_media
+from services.paths import BASE_DIR
+
+CLIP_WORKERS = int(os.getenv("CLIP_WORKERS", "2"))
+CLIP_MAX_SECONDS = float(os.getenv("CLIP_MAX_SECONDS", "600"))
+CLIP_CACHE_BYTES = int(os.getenv("CLIP_CACHE_MB", "2048")) * 1024 * 1024
+
+
+class ClipError(Exception):
+    """ffmpeg no pudo generar el clip."""
+
+
+class ClipExtractor(DerivedCache):
+    error_class = ClipError
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        workers: int = CLIP_WORKERS,
+        prober: Callable[[Path], Dict[str, Any]] = probe_media,
+        budget: int = CLIP_CACHE_BYTES,
+    ):
+        super().__init__(cache_dir, workers, "clip", budget=budget)
+        self.prober = prober
+
+    def clip(
+        self,
+        path: Path,
+        start: float,
+        end: float,
+        exact: bool = False,
+        preset: Optional[str] = None,
+    ) -> Path:
+        """
+        Clip de `path` entre `start` y `end` segundos (lo genera si hace
+        falta). Lanza FileNotFoundError si el archivo no existe, ValueError
+        con un rango o preset inválido y ClipError si ffmpeg falla.
+        """
+        return self.schedule(path, start, end, exact, preset).result()
+
+    def schedule(
+        self,
+        path: Path,
+        start: float,
+        end: float,
+        exact: bool = False,
+        preset: Optional[str] = None,
+    ) -> Future:
+        """
+        Igual que `clip`, pero sin esperar a ffmpeg: devuelve un Future con
+        la ruta del clip (ya resuelto si estaba en caché). Los errores de
+        validación se lanzan en el acto; los de ffmpeg, desde el Future.
+        """
+        st = self._stat(path)
+        preset = preset or DEFAULT_PRESET
+        if exact and preset not in PRESETS:
+            raise ValueError(f"Preset inválido. Usa uno de: {', '.join(PRESETS)}")
+        start, end = round(start, 3), round(end, 3)
+        if start < 0 or end <= start:
+            raise ValueError("El rango debe cumplir 0 <= start < end")
+        duration = self.prober(path).get("duracion")
+        if duration:
+            if start >= duration:
+                raise ValueError(f"start supera la duración ({duration:.3f} s)")
+            end = min(end, round(duration, 3))
+        if end - start > CLIP_MAX_SECONDS:
+            raise ValueError(f"El clip no puede durar más de {CLIP_MAX_SECONDS:g} s")
+
+        mode = f"exacto-{preset}" if exact else "copia"
+        prefix = self._prefix(path, st)
+        variant = f"{start:.3f}-{end:.3f}-{mode}"
+        target = self.cache_dir / f"{prefix}-{variant}{path.suffix}"
+        if target.exists():
+            # Marcar como usado recientemente (LRU)
+            os.utime(target)
+        return self._schedule(
+            path,
+            prefix,
+            variant,
+            target.exists,
+            lambda: self._build(path, target, start, end, exact, preset),
+            target,
+        )
+
+    def _build(
+        self,
+        path: Path,
+        target: Path,
+        start: float,
+        end: float,
+        exact: bool,
+        preset: str,
+    ):
+        formato = path.suffix.lstrip(".").lower()
+        if exact:
+            output_args = encode_args(formato, preset)
+        else:
+            # make_zero: el clip empieza en 0 aunque arranque antes del inicio
+            # pedido (en el keyframe anterior)
+            output_args = ["-map", "0:v?", "-map", "0:a?", "-c", "copy"]
+            output_args += ["-avoid_negative_ts", "make_zero"]
+            if formato in ("mp4", "mov", "m4a"):
+                output_args += ["-movflags", "+faststart"]
+        self._run_ffmpeg(
+            ["-ss", f"{start:.3f}", "-i", str(path), "-t", f"{end - start:.3f}"],
+            output_args,
+            target,
+        )
+
+
+clips = ClipExtractor(
+    BASE_DIR / "content" / "converted" / "clips",
+    prober=metadata.probe_path,
+)
@@ -1,82 +1,1129 @@
+import hashlib
+import os
+import shlex
+import shutil
 import threading
 import subprocess
+import tempfile
+import time
 import uuid
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import Dict, Any
+from typing import Callable, Deque, Dict, Any, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from services.encoding import DEFAULT_PRESET, PRESETS, plan_encoding
+from services.media_probe import parse_float, probe_media
+from services.packaging import hls_args
+from services.storage.db import engine as default_engine
+from services.storage.model import ConversionTask
+from services.telemetry import conversion_run, conversion_wait
+
+# Comando de ffmpeg (se puede reemplazar por un doble de pruebas, p. ej.
+# FFMPEG_BIN="python benchmarks/fake_ffmpeg.py")
+FFMPEG_CMD = shlex.split(os.getenv("FFMPEG_BIN", "ffmpeg"))
+
+# ffmpeg ya usa varios hilos por proceso: la mitad de los núcleos basta
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# Prioridades: menor número = se atiende antes
+PRIORIDAD_ALTA = 0
+PRIORIDAD_NORMAL = 1
+PRIORIDAD_BAJA = 2
+ARCHIVO_GRANDE = 500 * 1024 * 1024  # 500MB
+
+ESTADOS_FINALES = ("listo", "error", "cancelado")
+ESTADOS_ACTIVOS = ("en_cola", "procesando")
+
+# Tiempo que se conservan las tareas terminadas (y sus archivos convertidos)
+TASK_TTL_SECONDS = float(os.getenv("CONVERSION_TASK_TTL_HOURS", "24")) * 3600
+
+# Caché de resultados: presupuesto de disco y cómo se identifica la entrada
+# ("fast" = tamaño + mtime + inodo; "content" = sha256 del contenido)
+CACHE_BUDGET_BYTES = int(os.getenv("CONVERSION_CACHE_MB", "10240")) * 1024 * 1024
+CACHE_KEY_MODE = os.getenv("CONVERSION_CACHE_KEY", "fast")
+# Hashes de contenido recordados (uno por ruta, el de su última versión)
+CONTENT_HASH_ENTRIES = int(os.getenv("CONVERSION_HASH_ENTRIES", "4096"))
 
 
 class ConversionManager:
-    def __init__(self, base_dir: Path):
+    """
+    Administra las conversiones con ffmpeg mediante un pool acotado de hilos.
+
+    Las tareas esperan en una cola por prioridad (audios y archivos pequeños
+    primero); dentro de cada prioridad se reparte por turnos entre
+    propietarios, para que uno que encola cien trabajos no bloquee a los demás.
+
+    Cada tarea se guarda en la tabla `conversion_task`. En memoria solo quedan
+    las activas; las terminadas se consultan en la base de datos y sus filas
+    se eliminan al cumplir `task_ttl` segundos. Los archivos convertidos no
+    dependen de las tareas (son compartidos por clave y se sirven como
+    inmutables): solo los borra el recorte por LRU de la caché.
+
+    Los resultados se guardan en content/converted/cache con el nombre
+    `{clave}.{formato}`, donde la clave resume la entrada, el formato y las
+    opciones de ffmpeg: pedir dos veces lo mismo no vuelve a correr ffmpeg, y
+    una petición idéntica a una tarea en curso recibe esa misma tarea. La
+    caché se recorta por LRU cuando supera `cache_budget` bytes.
+
+    En un lote (`submit_batch`) las salidas de un mismo archivo se encolan
+    como una sola entrada y se generan con una única ejecución de ffmpeg; cada
+    salida sigue siendo una tarea con su propio estado.
+    """
+
+    def __init__(
+        self,
+        base_dir: Path,
+        max_workers: Optional[int] = None,
+        engine=None,
+        task_ttl: float = TASK_TTL_SECONDS,
+        cache_budget: int = CACHE_BUDGET_BYTES,
+        prober: Callable[[Path], Dict[str, Any]] = probe_media,
+    ):
         self.base_dir = base_dir
+        # Datos de ffprobe de una entrada (duración, resolución, códecs)
+        self.prober = prober
         self.video_dir = base_dir / "content" / "videos"
         self.audio_dir = base_dir / "content" / "audios"
         self.output_dir = base_dir / "content" / "converted"
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_dir = self.output_dir / "cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_budget = cache_budget
+        self.max_workers = max_workers or int(
+            os.getenv("CONVERSION_WORKERS", DEFAULT_WORKERS)
+        )
+
+        self.engine = engine or default_engine
+        self.task_ttl = task_ttl
 
         # Diccionario con tareas activas
         self.tasks: Dict[str, Dict[str, Any]] = {}
         self.lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._janitor: Optional[threading.Thread] = None
+        self._pending = threading.Condition(self.lock)
+
+        # prioridad -> propietario -> cola FIFO de task_id (turnos por propietario)
+        self._queues: Dict[int, "OrderedDict[str, Deque[str]]"] = {}
+        self._jobs: Dict[str, tuple] = {}
+        # entrada de la cola de un lote -> sus tareas, y tarea -> esa entrada
+        self._groups: Dict[str, List[str]] = {}
+        self._group_of: Dict[str, str] = {}
+        self._procs: Dict[str, subprocess.Popen] = {}
+        self._workers: List[threading.Thread] = []
+        # ffmpeg en ejecución (workers y conversiones en vivo): nunca más de
+        # max_workers entre todos
+        self._busy = 0
 
+        # clave de caché -> tarea en curso que la está generando
+        self._inflight: Dict[str, str] = {}
+        # task_id -> funciones notificadas en cada cambio (SSE)
+        self._subscribers: Dict[str, Set[Callable[[Dict[str, Any]], None]]] = {}
+        # ruta -> (tamaño, mtime, sha256) de su última versión, por LRU
+        self._content_hashes: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+
+    # ============================
+    # ⚙️ EJECUCIÓN
+    # ============================
     def _convert(self, task_id: str, input_path: Path, output_path: Path):
         try:
             self._update_status(task_id, "procesando")
 
-            cmd = ["ffmpeg", "-y", "-i", str(input_path), str(output_path)]
-            subprocess.run(
-                cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
+            media = self.prober(input_path)
+            duration = media.get("duracion")
+            with self.lock:
+                self.tasks[task_id]["duracion"] = duration
 
+            # ffmpeg escribe en un temporal que se renombra al terminar: la
+            # caché nunca contiene resultados a medias. El progreso llega por
+            # stdout en formato clave=valor (-progress pipe:1).
+            tmp_path = output_path.with_name(f".{task_id}.part{output_path.suffix}")
+            plans = self._plans(task_id, tmp_path, media)
+            for attempt, (modo, output_args) in enumerate(plans, start=1):
+                cmd = FFMPEG_CMD + [
+                    "-y",
+                    "-nostats",
+                    "-progress",
+                    "pipe:1",
+                    "-i",
+                    str(input_path),
+                ]
+                cmd += output_args
+                returncode, stderr = self._run_ffmpeg([task_id], cmd, duration)
+                if returncode is None or self._is_cancelled(task_id):
+                    _remove_path(tmp_path)
+                    return
+                if returncode == 0:
+                    with self.lock:
+                        self.tasks[task_id]["modo"] = modo
+                    break
+                # Si falla el remux se intenta el siguiente plan (recodificar)
+                _remove_path(tmp_path)
+                if attempt == len(plans):
+                    raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+
+            os.replace(tmp_path, output_path)
+            with self.lock:
+                self.tasks[task_id].update(
+                    output=str(output_path), progreso=100.0, eta_segundos=0.0
+                )
             self._update_status(task_id, "listo")
-            self.tasks[task_id]["output"] = str(output_path)
+            self.enforce_cache_budget()
 
         except subprocess.CalledProcessError as e:
             self._update_status(task_id, "error", str(e))
         except Exception as e:
             self._update_status(task_id, "error", str(e))
+        finally:
+            self._finish(task_id)
+
+    def _convert_group(self, jobs: List[Tuple[str, Path, Path]]):
+        """
+        Genera varias salidas de un mismo archivo con una sola ejecución de
+        ffmpeg: la entrada se lee y decodifica una vez y cada salida tiene su
+        propia codificación o remux. Si esa ejecución falla, cada salida se
+        reintenta por separado, con su respaldo de recodificación.
+        """
+        task_ids = [task_id for task_id, _, _ in jobs]
+        input_path = jobs[0][1]
+        pending = set(task_ids)
+        retry = []
+        try:
+            for task_id in task_ids:
+                self._update_status(task_id, "procesando")
+            media = self.prober(input_path)
+            duration = media.get("duracion")
+
+            cmd = FFMPEG_CMD + [
+                "-y",
+                "-nostats",
+                "-progress",
+                "pipe:1",
+                "-i",
+                str(input_path),
+            ]
+            outputs = []
+            with self.lock:
+                for task_id, _, output_path in jobs:
+                    task = self.tasks[task_id]
+                    task["duracion"] = duration
+                    # Las opciones antes de cada ruta aplican solo a esa salida
+                    modo, args = plan_encoding(
+                        task["formato"], media, task.get("preset")
+                    )[0]
+                    tmp_path = output_path.with_name(
+                        f".{task_id}.part{output_path.suffix}"
+                    )
+                    outputs.append((task_id, output_path, tmp_path, modo))
+                    cmd += args + [str(tmp_path)]
+
+            returncode, _ = self._run_ffmpeg(task_ids, cmd, duration)
+            for task_id, output_path, tmp_path, modo in outputs:
+                if returncode == 0 and not self._is_cancelled(task_id):
+                    os.replace(tmp_path, output_path)
+                    with self.lock:
+                        self.tasks[task_id].update(
+                            output=str(output_path),
+                            progreso=100.0,
+                            eta_segundos=0.0,
+                            modo=modo,
+                        )
+                    self._update_status(task_id, "listo")
+                else:
+                    _remove_path(tmp_path)
+                    if returncode not in (0, None) and not self._is_cancelled(task_id):
+                        retry.append(task_id)
+                        pending.discard(task_id)
+                        continue
+                self._finish(task_id)
+                pending.discard(task_id)
+            self.enforce_cache_budget()
+
+        except Exception as e:
+            for task_id in pending:
+                self._update_status(task_id, "error", str(e))
+                self._finish(task_id)
+            return
+
+        paths = {task_id: (i, o) for task_id, i, o in jobs}
+        for task_id in retry:
+            self._convert(task_id, *paths[task_id])
+
+    def _plans(self, task_id: str, tmp_path: Path, media: Dict[str, Any]):
+        """Intentos (modo, argumentos de salida) según el perfil de la tarea."""
+        with self.lock:
+            task = self.tasks[task_id]
+            perfil, formato, preset = (
+                task.get("perfil"),
+                task["formato"],
+                task.get("preset"),
+            )
+        if perfil == "hls":
+            # El paquete es una carpeta: se arma completa y se renombra
+            tmp_path.mkdir(parents=True, exist_ok=True)
+            return [("hls", hls_args(tmp_path, media))]
+        return [
+            (modo, args + [str(tmp_path)])
+            for modo, args in plan_encoding(formato, media, preset)
+        ]
+
+    def _run_ffmpeg(self, task_ids: List[str], cmd: List[str], duration):
+        """
+        Ejecuta ffmpeg para las tareas `task_ids` (varias si es un lote)
+        registrando el proceso (para poder cancelarlo) y su progreso. Devuelve
+        (código de salida, final de stderr), o (None, b"") si todas se
+        cancelaron antes de lanzarlo.
+        """
+        with tempfile.TemporaryFile() as stderr_file:
+            with self.lock:
+                # Se lanza con el lock tomado para que cancel() vea el proceso
+                if all(self.tasks[t]["estado"] == "cancelado" for t in task_ids):
+                    return None, b""
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+                for task_id in task_ids:
+                    self._procs[task_id] = proc
+            try:
+                self._read_progress(task_ids, proc, duration)
+                proc.wait()
+            finally:
+                with self.lock:
+                    for task_id in task_ids:
+                        self._procs.pop(task_id, None)
+            stderr_file.seek(0)
+            return proc.returncode, stderr_file.read()[-4000:]
+
+    def _read_progress(self, task_ids: List[str], proc: subprocess.Popen, duration):
+        """Lee los bloques de -progress y actualiza porcentaje, velocidad y ETA."""
+        started = time.monotonic()
+        block: Dict[str, str] = {}
+        for raw in proc.stdout:
+            key, _, value = raw.decode("utf-8", "replace").strip().partition("=")
+            block[key] = value
+            if key != "progress":
+                continue
+
+            out_time = parse_float(block.get("out_time_us")) or parse_float(
+                block.get("out_time_ms")
+            )
+            out_time = out_time / 1_000_000 if out_time else 0.0
+            speed = parse_float(block.get("speed", "").rstrip("x"))
+            progress = eta = None
+            if duration:
+                progress = round(min(out_time / duration * 100, 100.0), 1)
+                remaining = max(duration - out_time, 0.0)
+                if speed:
+                    eta = round(remaining / speed, 1)
+                elif out_time > 0:
+                    elapsed = time.monotonic() - started
+                    eta = round(elapsed * remaining / out_time, 1)
+
+            with self.lock:
+                for task_id in task_ids:
+                    task = self.tasks.get(task_id)
+                    if task is not None and task["estado"] != "cancelado":
+                        task.update(
+                            progreso=progress,
+                            eta_segundos=eta,
+                            fps=parse_float(block.get("fps")),
+                            velocidad=speed,
+                        )
+            for task_id in task_ids:
+                self._publish(task_id)
+            block = {}
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                entry = self._take_entry()
+                while entry is None:
+                    self._pending.wait()
+                    entry = self._take_entry()
+                # Un lote de un mismo archivo ocupa una sola entrada de la cola
+                jobs, waits = [], []
+                now = time.time()
+                for task_id in self._groups.pop(entry, [entry]):
+                    self._group_of.pop(task_id, None)
+                    job = self._jobs.pop(task_id, None)
+                    if job is None:
+                        # Salida del lote cancelada mientras esperaba
+                        continue
+                    task = self.tasks[task_id]
+                    task["iniciado"] = now
+                    jobs.append((task_id, *job))
+                    waits.append((now - task["creado"], task["formato"]))
+            for wait, formato in waits:
+                conversion_wait.observe(wait, (formato,))
+            try:
+                jobs = self._settle_keys(jobs)
+                if len(jobs) == 1:
+                    self._convert(*jobs[0])
+                elif jobs:
+                    self._convert_group(jobs)
+            finally:
+                self.release_slot()
+
+    def _take_entry(self) -> Optional[str]:
+        # Llamar con self.lock tomado: desencola solo si queda un lugar libre
+        if self._busy >= self.max_workers:
+            return None
+        entry = self._dequeue()
+        if entry is not None:
+            self._busy += 1
+        return entry
+
+    def acquire_slot(self) -> bool:
+        """
+        Reserva un lugar del límite de ffmpeg simultáneos para un trabajo que
+        no pasa por la cola (conversiones en vivo o directas de una subida).
+        False si no hay ninguno.
+        """
+        with self.lock:
+            if self._busy >= self.max_workers:
+                return False
+            self._busy += 1
+            return True
+
+    def release_slot(self):
+        with self.lock:
+            self._busy -= 1
+            self._pending.notify()
+
+    def _ensure_workers(self):
+        # Llamar con self.lock tomado
+        while len(self._workers) < self.max_workers:
+            t = threading.Thread(target=self._worker, daemon=True)
+            self._workers.append(t)
+            t.start()
 
     def _update_status(self, task_id: str, status: str, error: str = None):
         with self.lock:
             if task_id in self.tasks:
+                # Una tarea cancelada no vuelve a cambiar de estado
+                if self.tasks[task_id]["estado"] == "cancelado":
+                    return
                 self.tasks[task_id]["estado"] = status
                 if error:
                     self.tasks[task_id]["error"] = error
+                if status in ESTADOS_FINALES:
+                    self.tasks[task_id]["finalizado"] = time.time()
+        # Los estados finales se guardan en _finish
+        if status not in ESTADOS_FINALES:
+            self._persist(task_id)
+            self._publish(task_id)
+
+    def _finish(self, task_id: str):
+        """Guarda el estado final y libera la tarea de la memoria."""
+        self._persist(task_id)
+        self._publish(task_id)
+        with self.lock:
+            self._subscribers.pop(task_id, None)
+            task = self.tasks.pop(task_id, None)
+            key = task.get("cache_key") if task else None
+            if key and self._inflight.get(key) == task_id:
+                del self._inflight[key]
+        if task and task.get("iniciado"):
+            conversion_run.observe(
+                (task.get("finalizado") or time.time()) - task["iniciado"],
+                (task["formato"], task["estado"]),
+            )
+        if task and task.get("entrada_temporal"):
+            Path(task["input_path"]).unlink(missing_ok=True)
+
+    def _is_cancelled(self, task_id: str) -> bool:
+        with self.lock:
+            return self.tasks.get(task_id, {}).get("estado") == "cancelado"
+
+    # ============================
+    # 📥 COLA CON PRIORIDAD
+    # ============================
+    def _enqueue(self, task_id: str, priority: int, owner: str):
+        # Llamar con self.lock tomado
+        owners = self._queues.setdefault(priority, OrderedDict())
+        owners.setdefault(owner, deque()).append(task_id)
+        self._pending.notify()
+
+    def _dequeue(self) -> Optional[str]:
+        # Llamar con self.lock tomado
+        for priority in sorted(self._queues):
+            owners = self._queues[priority]
+            if not owners:
+                continue
+            # El propietario atendido pasa al final de la ronda
+            owner, jobs = owners.popitem(last=False)
+            task_id = jobs.popleft()
+            if jobs:
+                owners[owner] = jobs
+            return task_id
+        return None
+
+    def _dispatch_order(self) -> List[str]:
+        """Orden en el que se despacharían las tareas encoladas ahora mismo."""
+        order = []
+        for priority in sorted(self._queues):
+            rounds = [list(jobs) for jobs in self._queues[priority].values()]
+            depth = max((len(jobs) for jobs in rounds), default=0)
+            for i in range(depth):
+                order.extend(jobs[i] for jobs in rounds if i < len(jobs))
+        return order
 
-    def start_conversion(self, filename: str, formato: str, tipo: str) -> str:
+    @staticmethod
+    def default_priority(tipo: str, size: int) -> int:
+        priority = PRIORIDAD_ALTA if tipo == "audio" else PRIORIDAD_NORMAL
+        if size > ARCHIVO_GRANDE:
+            priority += 1
+        return min(priority, PRIORIDAD_BAJA)
+
+    def queue_stats(self) -> Dict[str, Any]:
+        """Tareas en cola por prioridad y en ejecución (para /metrics)."""
+        with self.lock:
+            queued = {
+                priority: sum(len(jobs) for jobs in owners.values())
+                for priority, owners in self._queues.items()
+            }
+            running = sum(1 for t in self.tasks.values() if t["estado"] == "procesando")
+        return {"en_cola": queued, "procesando": running, "workers": self.max_workers}
+
+    # ============================
+    # 🚀 API PÚBLICA
+    # ============================
+    def start_conversion(
+        self,
+        filename: str,
+        formato: str,
+        tipo: str,
+        owner: str = "unknown",
+        priority: Optional[int] = None,
+        preset: Optional[str] = None,
+    ) -> str:
         input_dir = self.video_dir if tipo == "video" else self.audio_dir
         input_path = input_dir / filename
 
         if not input_path.exists():
             raise FileNotFoundError(f"Archivo {filename} no encontrado en {input_dir}")
 
-        output_name = f"{input_path.stem}_converted.{formato}"
-        output_path = self.output_dir / output_name
+        return self.submit_file(
+            input_path, formato, tipo, owner=owner, priority=priority, preset=preset
+        )
 
-        # Crear ID único para la tarea
-        task_id = str(uuid.uuid4())
-        task_data = {
-            "id": task_id,
+    def submit_file(
+        self,
+        input_path: Path,
+        formato: str,
+        tipo: str,
+        owner: str = "unknown",
+        priority: Optional[int] = None,
+        archivo: Optional[str] = None,
+        temporary: bool = False,
+        perfil: Optional[str] = None,
+        preset: Optional[str] = None,
+    ) -> str:
+        """
+        Encola la conversión de un archivo arbitrario (p. ej. una subida ya
+        guardada en content/uploads). Con `temporary`, la entrada se borra
+        cuando la tarea termina, sea cual sea el resultado. `perfil` elige
+        otra salida en lugar de un archivo (p. ej. "hls" para empaquetar) y
+        `preset` cómo recodificar si no se pueden copiar los streams. Lanza
+        ValueError con un preset desconocido.
+        """
+        if perfil is None:
+            preset = _check_preset(preset)
+        if priority is None:
+            priority = self.default_priority(tipo, input_path.stat().st_size)
+
+        task_data = self._new_task(
+            input_path,
+            formato,
+            tipo,
+            owner,
+            priority,
+            archivo=archivo,
+            temporary=temporary,
+            perfil=perfil,
+            preset=preset,
+        )
+        task_id, origen = self._register(task_data)
+        if origen == "miss":
+            self._persist(task_id)
+            self._submit(task_data)
+        return task_id
+
+    def submit_batch(
+        self,
+        items: List[Tuple[Path, List[str]]],
+        tipo: str,
+        owner: str = "unknown",
+        priority: Optional[int] = None,
+        preset: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Encola un lote de (archivo, formatos). Por cada archivo, las salidas
+        que no están en caché ni en curso se agendan juntas como una unidad y
+        se generan con una sola ejecución de ffmpeg. Devuelve el id del lote
+        y, por salida, su tarea y su origen: "hit" (caché), "en_curso" (se
+        comparte una tarea idéntica de otro pedido) o "miss". Lanza
+        ValueError con un preset desconocido.
+        """
+        preset = _check_preset(preset)
+        lote = str(uuid.uuid4())
+        salidas = []
+        for input_path, formatos in items:
+            prioridad = priority
+            if prioridad is None:
+                prioridad = self.default_priority(tipo, input_path.stat().st_size)
+            pending = []
+            for formato in dict.fromkeys(formatos):
+                task_data = self._new_task(
+                    input_path,
+                    formato,
+                    tipo,
+                    owner,
+                    prioridad,
+                    preset=preset,
+                    lote=lote,
+                )
+                task_id, origen = self._register(task_data)
+                if origen == "miss":
+                    pending.append(task_data)
+                salidas.append(
+                    {
+                        "archivo": input_path.name,
+                        "formato": formato,
+                        "task_id": task_id,
+                        "origen": origen,
+                    }
+                )
+            for task_data in pending:
+                self._persist(task_data["id"])
+            if pending:
+                self._submit_group(pending)
+        return {"lote": lote, "salidas": salidas}
+
+    def _new_task(
+        self,
+        input_path: Path,
+        formato: str,
+        tipo: str,
+        owner: str,
+        priority: int,
+        archivo: Optional[str] = None,
+        temporary: bool = False,
+        perfil: Optional[str] = None,
+        preset: Optional[str] = None,
+        lote: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        key = self._cache_key(input_path, formato, _key_options(perfil, preset))
+        output_path = self.cache_dir / f"{key}.{formato}"
+        return {
+            "id": str(uuid.uuid4()),
             "tipo": tipo,
-            "archivo": filename,
+            "archivo": archivo or input_path.name,
             "formato": formato,
-            "estado": "preparando",
+            "estado": "en_cola",
             "output": None,
+            "propietario": owner,
+            "prioridad": priority,
+            "creado": time.time(),
+            "input_path": str(input_path),
+            "output_path": str(output_path),
+            "cache_key": key,
+            "cache": "miss",
+            "entrada_temporal": temporary,
+            "perfil": perfil,
+            "preset": preset,
+            "lote": lote,
         }
 
+    def _register(self, task_data: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Da de alta la tarea salvo que haya una idéntica en curso. Devuelve
+        (task_id, origen): "en_curso" con el id de la tarea existente, "hit"
+        si el resultado ya estaba en caché (la tarea queda terminada) o
+        "miss" si hay que encolarla.
+        """
+        task_id = task_data["id"]
+        key = task_data["cache_key"]
+        output_path = Path(task_data["output_path"])
         with self.lock:
+            # Petición idéntica en curso: se comparte la tarea existente
+            inflight = self._inflight.get(key)
+            if inflight in self.tasks:
+                if task_data["entrada_temporal"]:
+                    Path(task_data["input_path"]).unlink(missing_ok=True)
+                return inflight, "en_curso"
+
+            if output_path.exists():
+                task_data.update(
+                    estado="listo",
+                    output=str(output_path),
+                    cache="hit",
+                    finalizado=time.time(),
+                )
+            else:
+                self._inflight[key] = task_id
             self.tasks[task_id] = task_data
 
-        # Crear hilo para la conversión
-        t = threading.Thread(
-            target=self._convert, args=(task_id, input_path, output_path)
-        )
-        t.start()
+        if task_data["cache"] == "hit":
+            # Marcar la entrada como usada recientemente (LRU)
+            os.utime(output_path)
+            self._finish(task_id)
+        return task_id, task_data["cache"]
 
-        return task_id
+    def _submit(self, task: Dict[str, Any]):
+        self._submit_group([task])
+
+    def _submit_group(self, tasks: List[Dict[str, Any]]):
+        """Encola tareas de un mismo archivo como una sola entrada de la cola."""
+        entry = tasks[0]["id"] if len(tasks) == 1 else f"lote-{uuid.uuid4()}"
+        with self.lock:
+            for task in tasks:
+                if task.get("cache_key"):
+                    self._inflight[task["cache_key"]] = task["id"]
+                self._jobs[task["id"]] = (
+                    Path(task["input_path"]),
+                    Path(task["output_path"]),
+                )
+                if len(tasks) > 1:
+                    self._group_of[task["id"]] = entry
+            if len(tasks) > 1:
+                self._groups[entry] = [task["id"] for task in tasks]
+            self._enqueue(entry, tasks[0]["prioridad"], tasks[0]["propietario"])
+            self._ensure_workers()
+
+    def cancel(self, task_id: str) -> bool:
+        """
+        Cancela una tarea en cola o en ejecución. Devuelve False si no existe o
+        ya había terminado.
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task or task["estado"] in ESTADOS_FINALES:
+                return False
+            task["estado"] = "cancelado"
+            task["finalizado"] = time.time()
+
+            queued = task_id in self._jobs
+            if queued:
+                del self._jobs[task_id]
+                owners = self._queues.get(task["prioridad"], {})
+                jobs = owners.get(task["propietario"])
+                if jobs is not None and task_id in jobs:
+                    jobs.remove(task_id)
+                    if not jobs:
+                        del owners[task["propietario"]]
+
+            proc = self._procs.get(task_id)
+            # En un lote, ffmpeg sigue mientras otra salida lo necesite
+            if proc is not None and any(
+                p is proc and self.tasks.get(t, {}).get("estado") != "cancelado"
+                for t, p in self._procs.items()
+            ):
+                proc = None
+
+        if queued:
+            self._finish(task_id)
+        else:
+            # El hilo que la ejecuta la libera al terminar
+            self._persist(task_id)
+            self._publish(task_id)
+        if proc is not None:
+            proc.terminate()
+        return True
 
     def get_task(self, task_id: str) -> Dict[str, Any]:
         with self.lock:
-            return self.tasks.get(task_id, None)
+            task = self.tasks.get(task_id, None)
+            if task is not None:
+                task = dict(task)
+                if task["estado"] == "en_cola":
+                    order = self._dispatch_order()
+                    entry = self._group_of.get(task_id, task_id)
+                    task["posicion_cola"] = (
+                        order.index(entry) + 1 if entry in order else None
+                    )
+                return task
+
+        with Session(self.engine) as session:
+            row = session.get(ConversionTask, task_id)
+            return row.model_dump() if row else None
+
+    def list_tasks(
+        self,
+        estado: Optional[str] = None,
+        tipo: Optional[str] = None,
+        propietario: Optional[str] = None,
+        lote: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Página de tareas (más recientes primero) y total que cumple los filtros."""
+        query = select(ConversionTask)
+        count = select(func.count()).select_from(ConversionTask)
+        for column, value in (
+            (ConversionTask.estado, estado),
+            (ConversionTask.tipo, tipo),
+            (ConversionTask.propietario, propietario),
+            (ConversionTask.lote, lote),
+        ):
+            if value is not None:
+                query = query.where(column == value)
+                count = count.where(column == value)
+
+        query = query.order_by(ConversionTask.creado.desc()).offset(offset).limit(limit)
+        with Session(self.engine) as session:
+            rows = session.exec(query).all()
+            total = session.exec(count).one()
+
+        # Las tareas activas en memoria tienen el estado más reciente
+        with self.lock:
+            tasks = [dict(self.tasks.get(r.id) or r.model_dump()) for r in rows]
+        return tasks, total
+
+    # ============================
+    # 📡 SUSCRIPCIONES (SSE)
+    # ============================
+    def subscribe(
+        self, task_id: str, callback: Callable[[Dict[str, Any]], None]
+    ) -> Callable[[], None]:
+        """
+        Registra `callback`, que recibe una copia de la tarea en cada cambio de
+        estado o progreso. Se invoca desde el hilo de la conversión, así que
+        debe ser rápida. Devuelve la función para cancelar la suscripción.
+        """
+        with self.lock:
+            self._subscribers.setdefault(task_id, set()).add(callback)
+
+        def unsubscribe():
+            with self.lock:
+                callbacks = self._subscribers.get(task_id)
+                if callbacks is not None:
+                    callbacks.discard(callback)
+                    if not callbacks:
+                        del self._subscribers[task_id]
+
+        return unsubscribe
+
+    def _publish(self, task_id: str):
+        with self.lock:
+            callbacks = list(self._subscribers.get(task_id, ()))
+            task = self.tasks.get(task_id)
+            snapshot = dict(task) if task is not None else None
+        if snapshot is None:
+            return
+        for callback in callbacks:
+            try:
+                callback(snapshot)
+            except Exception:
+                continue
 
-    def list_tasks(self) -> Dict[str, Any]:
+    # ============================
+    # 🗃️ CACHÉ DE RESULTADOS
+    # ============================
+    def cached_output(
+        self,
+        input_path: Path,
+        formato: str,
+        perfil: Optional[str] = None,
+        preset: Optional[str] = None,
+    ) -> Optional[Path]:
+        """Resultado ya generado para esta entrada, sin crear ninguna tarea."""
+        output_path = self.output_path_for(input_path, formato, perfil, preset)
+        return output_path if output_path.exists() else None
+
+    def last_task_for(
+        self,
+        input_path: Path,
+        formato: str,
+        perfil: Optional[str] = None,
+        preset: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Tarea más reciente que generó (o está generando) este resultado para
+        la versión actual de la entrada; None si nunca se pidió.
+        """
+        key = self.output_path_for(input_path, formato, perfil, preset).stem
         with self.lock:
-            return self.tasks.copy()
+            task_id = self._inflight.get(key)
+            if task_id in self.tasks:
+                return dict(self.tasks[task_id])
+        with Session(self.engine) as session:
+            row = session.exec(
+                select(ConversionTask)
+                .where(ConversionTask.cache_key == key)
+                .order_by(ConversionTask.creado.desc())
+                .limit(1)
+            ).first()
+            return row.model_dump() if row else None
+
+    def output_path_for(
+        self,
+        input_path: Path,
+        formato: str,
+        perfil: Optional[str] = None,
+        preset: Optional[str] = None,
+    ) -> Path:
+        """Ruta en caché del resultado (exista o no todavía)."""
+        if perfil is None:
+            preset = preset or DEFAULT_PRESET
+        key = self._cache_key(input_path, formato, _key_options(perfil, preset))
+        return self.cache_dir / f"{key}.{formato}"
+
+    def _cache_key(
+        self, input_path: Path, formato: str, options=(), hash_content: bool = False
+    ) -> str:
+        """
+        Clave del resultado. En modo "content" usa el sha256 de la entrada,
+        pero solo lo calcula con `hash_content` (en los workers): en los
+        pedidos, si todavía no se conoce, se usa la identidad rápida y el
+        worker cambia la clave antes de convertir (ver `_settle_keys`).
+        """
+        st = input_path.stat()
+        source = None
+        if CACHE_KEY_MODE == "content":
+            source = self._content_hash(input_path, st, compute=hash_content)
+        if source is None:
+            source = f"{st.st_size}:{st.st_mtime_ns}:{st.st_ino}"
+        raw = "|".join([source, formato, *options])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _content_hash(
+        self, input_path: Path, st: os.stat_result, compute: bool = True
+    ) -> Optional[str]:
+        path = str(input_path)
+        with self.lock:
+            cached = self._content_hashes.get(path)
+            if cached and cached[:2] == (st.st_size, st.st_mtime_ns):
+                self._content_hashes.move_to_end(path)
+                return cached[2]
+        if not compute:
+            return None
+        digest = hashlib.sha256()
+        with input_path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        with self.lock:
+            # Una versión nueva reemplaza a la anterior de la misma ruta
+            self._content_hashes[path] = (
+                st.st_size,
+                st.st_mtime_ns,
+                digest.hexdigest(),
+            )
+            self._content_hashes.move_to_end(path)
+            while len(self._content_hashes) > CONTENT_HASH_ENTRIES:
+                self._content_hashes.popitem(last=False)
+        return digest.hexdigest()
+
+    def _settle_keys(
+        self, jobs: List[Tuple[str, Path, Path]]
+    ) -> List[Tuple[str, Path, Path]]:
+        """
+        Modo "content": pasa a la clave por contenido las tareas que se
+        encolaron con la identidad rápida porque el sha256 no se conocía. Las
+        que ya tienen su resultado en caché terminan sin correr ffmpeg.
+        Devuelve los trabajos que quedan por convertir.
+        """
+        if CACHE_KEY_MODE != "content":
+            return jobs
+        pending = []
+        for task_id, input_path, output_path in jobs:
+            with self.lock:
+                task = dict(self.tasks.get(task_id) or {})
+            if not task or task["estado"] == "cancelado":
+                pending.append((task_id, input_path, output_path))
+                continue
+            try:
+                options = _key_options(task.get("perfil"), task.get("preset"))
+                key = self._cache_key(
+                    input_path, task["formato"], options, hash_content=True
+                )
+            except OSError:
+                # _convert informa el error de la entrada
+                pending.append((task_id, input_path, output_path))
+                continue
+            if key == task["cache_key"]:
+                pending.append((task_id, input_path, output_path))
+                continue
+
+            output_path = self.cache_dir / f"{key}.{task['formato']}"
+            hit = output_path.exists()
+            with self.lock:
+                task = self.tasks[task_id]
+                if self._inflight.get(task["cache_key"]) == task_id:
+                    del self._inflight[task["cache_key"]]
+                task.update(cache_key=key, output_path=str(output_path))
+                if hit:
+                    task.update(
+                        estado="listo",
+                        output=str(output_path),
+                        cache="hit",
+                        finalizado=time.time(),
+                    )
+                else:
+                    self._inflight.setdefault(key, task_id)
+            if hit:
+                # Marcar la entrada como usada recientemente (LRU)
+                os.utime(output_path)
+                self._finish(task_id)
+            else:
+                pending.append((task_id, input_path, output_path))
+        return pending
+
+    def enforce_cache_budget(self) -> int:
+        """Borra los resultados menos usados hasta quedar bajo el presupuesto."""
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                st = entry.stat()
+                size = _tree_size(entry.path) if entry.is_dir() else st.st_size
+                entries.append((st.st_mtime, size, entry.path))
+                total += size
+
+        removed = 0
+        with self.lock:
+            busy = {t.get("output") for t in self.tasks.values()}
+        for _, size, path in sorted(entries):
+            if total <= self.cache_budget:
+                break
+            if path in busy:
+                continue
+            _remove_path(Path(path))
+            total -= size
+            removed += 1
+        return removed
+
+    # ============================
+    # 💾 PERSISTENCIA
+    # ============================
+    def _persist(self, task_id: str):
+        # La copia se toma dentro de _db_lock: la última escritura siempre
+        # refleja el estado más reciente aunque dos hilos persistan a la vez
+        with self._db_lock:
+            with self.lock:
+                task = self.tasks.get(task_id)
+                data = {k: v for k, v in (task or {}).items() if k in _TASK_COLUMNS}
+            if not data:
+                return
+            with Session(self.engine) as session:
+                session.merge(ConversionTask(**data))
+                session.commit()
+
+    def recover(self):
+        """
+        Retoma las tareas que quedaron en cola o a medio convertir cuando el
+        proceso se detuvo: se vuelven a encolar si el archivo de entrada sigue
+        existiendo y se marcan con error si no.
+        """
+        with Session(self.engine) as session:
+            rows = session.exec(
+                select(ConversionTask)
+                .where(ConversionTask.estado.in_(ESTADOS_ACTIVOS))
+                .order_by(ConversionTask.creado)
+            ).all()
+            interrupted = [r.model_dump() for r in rows]
+
+        # Temporales de conversiones (y de conversiones en vivo) que quedaron
+        # a medias
+        for pattern in (".*.part.*", ".*.live.*"):
+            for part in self.cache_dir.glob(pattern):
+                _remove_path(part)
+
+        # Las salidas de un mismo archivo en un lote se vuelven a agendar juntas
+        groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for task in interrupted:
+            if Path(task["input_path"]).exists():
+                task["estado"] = "en_cola"
+                with self.lock:
+                    self.tasks[task["id"]] = task
+                self._persist(task["id"])
+                group = (task.get("lote") or task["id"], task["input_path"])
+                groups.setdefault(group, []).append(task)
+            else:
+                task["estado"] = "error"
+                task["error"] = "Tarea interrumpida y archivo de entrada no disponible"
+                task["finalizado"] = time.time()
+                with Session(self.engine) as session:
+                    session.merge(ConversionTask(**task))
+                    session.commit()
+        for tasks in groups.values():
+            self._submit_group(tasks)
+
+    def evict_expired(self) -> int:
+        """
+        Elimina las filas de las tareas terminadas hace más de `task_ttl`.
+        Sus archivos quedan en la caché: otras tareas, listas HLS ya
+        entregadas o clientes con URLs inmutables pueden seguir usándolos, y
+        `enforce_cache_budget` se encarga de recortarla.
+        """
+        cutoff = time.time() - self.task_ttl
+        with Session(self.engine) as session:
+            expired = session.exec(
+                select(ConversionTask)
+                .where(ConversionTask.estado.in_(ESTADOS_FINALES))
+                .where(ConversionTask.finalizado < cutoff)
+            ).all()
+            for task in expired:
+                session.delete(task)
+            session.commit()
+        return len(expired)
+
+    def start(self, interval: float = 300.0):
+        """Recupera tareas interrumpidas e inicia la limpieza periódica por TTL."""
+        self.recover()
+        if self._janitor is not None:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.evict_expired()
+                except Exception:
+                    continue
+
+        self._janitor = threading.Thread(target=loop, daemon=True)
+        self._janitor.start()
+
+    def stop(self):
+        self._stop.set()
+        self._janitor = None
+
+
+_TASK_COLUMNS = set(ConversionTask.model_fields)
+
+
+def _check_preset(preset: Optional[str]) -> str:
+    preset = preset or DEFAULT_PRESET
+    if preset not in PRESETS:
+        raise ValueError(f"Preset inválido. Usa uno de: {', '.join(PRESETS)}")
+    return preset
+
+
+def _key_options(perfil: Optional[str], preset: Optional[str]) -> Tuple[str, ...]:
+    """Opciones que distinguen resultados de una misma entrada y formato."""
+    options = (f"preset={preset}",) if preset else ()
+    return (perfil, *options) if perfil else options
+
+
+def _remove_path(path: Path):
+    """Borra un resultado, sea un archivo o una carpeta (paquetes HLS)."""
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
@@ -0,0 +1,216 @@
+"""
+Base de las cachés de archivos derivados de un video o audio: clips, vistas
+previas y picos de forma de onda.
+
+Cada resultado se guarda en `cache_dir` con el nombre
+`{archivo}-{versión}-{variante}...`, donde `archivo` sale de la ruta del
+original y `versión` de su tamaño y mtime. Un archivo nuevo con el mismo
+nombre genera resultados nuevos, y al terminar se borran los de las
+versiones anteriores. Los pedidos simultáneos del mismo resultado esperan a
+una sola generación. Si la generación falla, el error se recuerda para esa
+versión y no se vuelve a lanzar ffmpeg hasta que el original cambie. Con
+`budget`, la carpeta se recorta por LRU cuando supera esa cantidad de bytes.
+"""
+
+import hashlib
+import os
+import stat
+import subprocess
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from services.conversion_manager import FFMPEG_CMD
+
+FFMPEG_TIMEOUT = 600
+# Errores recordados como máximo (los más viejos se olvidan primero)
+ERROR_ENTRIES = 1024
+
+
+class DerivedCache:
+    # Excepción que lanza ffmpeg al fallar; es la que se recuerda por versión
+    error_class: Type[Exception] = RuntimeError
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        workers: int,
+        thread_name_prefix: str,
+        budget: Optional[int] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.budget = budget
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix=thread_name_prefix
+        )
+        # "archivo-versión-variante" -> generación en curso
+        self._inflight: Dict[str, Future] = {}
+        # (archivo, variante) -> (prefijo de la versión, error)
+        self._errors: "OrderedDict[Tuple[str, str], Tuple[str, str]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    # ============================
+    # 🔑 CLAVES DE CACHÉ
+    # ============================
+    def _stat(self, path: Path) -> os.stat_result:
+        try:
+            st = os.stat(path)
+        except OSError:
+            raise FileNotFoundError(path)
+        if not stat.S_ISREG(st.st_mode):
+            raise FileNotFoundError(path)
+        return st
+
+    def _prefix(self, path: Path, st: os.stat_result) -> str:
+        """ "archivo-versión": prefijo de los resultados de la versión `st`."""
+        name = hashlib.blake2s(str(path.resolve()).encode("utf-8"), digest_size=8)
+        version = hashlib.blake2s(
+            f"{st.st_size}-{st.st_mtime_ns}".encode("ascii"), digest_size=8
+        )
+        return f"{name.hexdigest()}-{version.hexdigest()}"
+
+    # ============================
+    # 🧵 GENERACIÓN COMPARTIDA
+    # ============================
+    def _schedule(
+        self,
+        path: Path,
+        prefix: str,
+        variant: str,
+        ready: Callable[[], bool],
+        build: Callable[[], None],
+        result: Any,
+    ) -> Future:
+        """
+        Future con `result` una vez que `ready()` se cumple: ya resuelto si
+        los archivos existen, con el error recordado si esta versión ya
+        falló, o la generación (compartida) que corre `build`.
+        """
+        done: Future = Future()
+        if ready():
+            done.set_result(result)
+            return done
+        name = prefix.split("-")[0]
+        key = f"{prefix}-{variant}"
+        with self.lock:
+            failed = self._errors.get((name, variant))
+            if failed is not None and failed[0] == prefix:
+                done.set_exception(self.error_class(failed[1]))
+                return done
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._pool.submit(
+                    self._run_build, path, prefix, variant, ready, build, result
+                )
+                self._inflight[key] = future
+        return future
+
+    def _run_build(
+        self,
+        path: Path,
+        prefix: str,
+        variant: str,
+        ready: Callable[[], bool],
+        build: Callable[[], None],
+        result: Any,
+    ):
+        name = prefix.split("-")[0]
+        try:
+            if not ready():
+                build()
+                # Solo si sigue siendo la versión actual: si no, la generación
+                # de la versión nueva es la que borra las anteriores
+                try:
+                    current = self._prefix(path, os.stat(path))
+                except OSError:
+                    current = None
+                if current == prefix:
+                    self._drop_old_versions(prefix)
+                if self.budget is not None:
+                    self.enforce_budget()
+            with self.lock:
+                self._errors.pop((name, variant), None)
+            return result
+        except self.error_class as e:
+            with self.lock:
+                self._errors[(name, variant)] = (prefix, str(e))
+                self._errors.move_to_end((name, variant))
+                while len(self._errors) > ERROR_ENTRIES:
+                    self._errors.popitem(last=False)
+            raise
+        finally:
+            with self.lock:
+                self._inflight.pop(f"{prefix}-{variant}", None)
+
+    def _drop_old_versions(self, prefix: str):
+        """Borra los resultados de versiones anteriores del mismo archivo."""
+        name = prefix.split("-")[0]
+        for old in self.cache_dir.glob(f"{name}-*"):
+            if not old.name.startswith(f"{prefix}-"):
+                old.unlink(missing_ok=True)
+        with self.lock:
+            stale = [
+                k for k, (p, _) in self._errors.items() if k[0] == name and p != prefix
+            ]
+            for k in stale:
+                del self._errors[k]
+
+    # ============================
+    # 🎞️ FFMPEG
+    # ============================
+    def _run_ffmpeg(
+        self,
+        input_args: List[str],
+        output_args: List[str],
+        dest: Path,
+        timeout: float = FFMPEG_TIMEOUT,
+    ):
+        # Temporal + rename: nunca se sirve un archivo a medio escribir
+        tmp = self._temp_path(dest)
+        cmd = FFMPEG_CMD + ["-y", "-v", "error"] + input_args + output_args + [str(tmp)]
+        try:
+            result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+            if result.returncode != 0 or not tmp.exists():
+                stderr = result.stderr.decode("utf-8", "replace").strip()
+                raise self.error_class(stderr[-500:] or "ffmpeg falló")
+            os.replace(tmp, dest)
+        except (OSError, subprocess.SubprocessError) as e:
+            raise self.error_class(str(e))
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def _temp_path(self, dest: Path) -> Path:
+        """Temporal oculto junto a `dest` (no cuenta para el presupuesto)."""
+        return dest.with_name(f".{uuid.uuid4().hex}{dest.suffix}")
+
+    # ============================
+    # 🧹 PRESUPUESTO
+    # ============================
+    def enforce_budget(self) -> int:
+        """Borra los resultados menos usados hasta quedar bajo el presupuesto."""
+        if self.budget is None:
+            return 0
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.budget:
+                break
+            Path(path).unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
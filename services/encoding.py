@@ -0,0 +1,157 @@
+"""
+Elección de cómo convertir: copiar los streams (remux) o recodificar.
+
+Cambiar de contenedor (mp4 → mov, mkv → mp4) no requiere recodificar si el
+destino admite los códecs del original: con `-c copy` ffmpeg solo reescribe
+el contenedor, lo que tarda lo mismo que leer el archivo. Solo cuando algún
+códec no es compatible se recodifica con uno de los presets con nombre.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+MODO_COPIA = "copia"
+MODO_RECODIFICACION = "recodificacion"
+
+# Códecs que cada contenedor de salida admite sin recodificar
+# (video, audio). Los formatos de solo audio no llevan video.
+CONTAINER_CODECS: Dict[str, Tuple[frozenset, frozenset]] = {
+    "mp4": (
+        frozenset({"h264", "hevc", "mpeg4", "av1"}),
+        frozenset({"aac", "mp3", "ac3", "eac3", "alac", "opus"}),
+    ),
+    "mov": (
+        frozenset({"h264", "hevc", "mpeg4", "prores", "mjpeg"}),
+        frozenset({"aac", "mp3", "alac", "ac3", "pcm_s16le", "pcm_s24le"}),
+    ),
+    "mkv": (
+        frozenset({"h264", "hevc", "mpeg4", "vp8", "vp9", "av1"}),
+        frozenset({"aac", "mp3", "ac3", "eac3", "opus", "vorbis", "flac"}),
+    ),
+    "webm": (frozenset({"vp8", "vp9", "av1"}), frozenset({"opus", "vorbis"})),
+    "mp3": (frozenset(), frozenset({"mp3"})),
+    "m4a": (frozenset(), frozenset({"aac", "alac"})),
+    "ogg": (frozenset(), frozenset({"vorbis", "opus", "flac"})),
+    "flac": (frozenset(), frozenset({"flac"})),
+    "wav": (frozenset(), frozenset({"pcm_s16le", "pcm_s24le", "pcm_f32le"})),
+}
+
+AUDIO_ONLY_FORMATS = ("mp3", "m4a", "ogg", "flac", "wav")
+
+# Códecs usados al recodificar hacia cada contenedor (video, audio)
+ENCODERS: Dict[str, Tuple[Optional[str], str]] = {
+    "mp4": ("libx264", "aac"),
+    "mov": ("libx264", "aac"),
+    "mkv": ("libx264", "aac"),
+    "webm": ("libvpx-vp9", "libopus"),
+    "mp3": (None, "libmp3lame"),
+    "m4a": (None, "aac"),
+    "ogg": (None, "libvorbis"),
+    "flac": (None, "flac"),
+    "wav": (None, "pcm_s16le"),
+}
+
+# Presets de recodificación: preset de x264, calidad (CRF), bitrate de audio
+# e hilos por proceso (0 = los que elija ffmpeg)
+PRESETS: Dict[str, Dict[str, Any]] = {
+    "rapido": {"preset": "veryfast", "crf": 26, "audio": "128k", "threads": 0},
+    "equilibrado": {"preset": "medium", "crf": 23, "audio": "160k", "threads": 0},
+    "calidad": {"preset": "slow", "crf": 19, "audio": "192k", "threads": 0},
+}
+DEFAULT_PRESET = os.getenv("CONVERSION_PRESET", "equilibrado")
+
+
+def can_copy(formato: str, media: Dict[str, Any]) -> bool:
+    """True si todos los streams que se conservan caben tal cual en `formato`."""
+    if formato not in CONTAINER_CODECS or not media:
+        return False
+    video_ok, audio_ok = CONTAINER_CODECS[formato]
+    video = media.get("codec_video")
+    audio = media.get("codec_audio")
+    if formato in AUDIO_ONLY_FORMATS:
+        return audio is not None and audio in audio_ok
+    if video is None and audio is None:
+        return False
+    return (video is None or video in video_ok) and (audio is None or audio in audio_ok)
+
+
+def copy_args(formato: str) -> List[str]:
+    args = ["-c", "copy", "-sn", "-dn"]
+    if formato in AUDIO_ONLY_FORMATS:
+        args.insert(0, "-vn")
+    if formato in ("mp4", "mov", "m4a"):
+        args += ["-movflags", "+faststart"]
+    return args
+
+
+def encode_args(formato: str, preset: str) -> List[str]:
+    options = PRESETS.get(preset, PRESETS[DEFAULT_PRESET])
+    video_codec, audio_codec = ENCODERS.get(formato, ("libx264", "aac"))
+    args: List[str] = []
+    if video_codec is None:
+        args += ["-vn"]
+    elif video_codec == "libx264":
+        args += ["-c:v", video_codec, "-preset", options["preset"]]
+        args += ["-crf", str(options["crf"])]
+    else:
+        # libvpx-vp9 en modo calidad constante
+        args += ["-c:v", video_codec, "-b:v", "0", "-crf", str(options["crf"] + 8)]
+    args += ["-c:a", audio_codec]
+    if not audio_codec.startswith(("pcm_", "flac")):
+        args += ["-b:a", options["audio"]]
+    args += ["-sn", "-dn", "-threads", str(options["threads"])]
+    if formato in ("mp4", "mov", "m4a"):
+        args += ["-movflags", "+faststart"]
+    return args
+
+
+def plan_encoding(
+    formato: str, media: Dict[str, Any], preset: Optional[str] = None
+) -> List[Tuple[str, List[str]]]:
+    """
+    Intentos en orden: (modo, argumentos de salida sin la ruta). Si se puede
+    copiar, la recodificación queda como respaldo por si el remux falla
+    (p. ej. marcas de tiempo que el contenedor destino no acepta).
+    """
+    plans = []
+    if can_copy(formato, media):
+        plans.append((MODO_COPIA, copy_args(formato)))
+    plans.append((MODO_RECODIFICACION, encode_args(formato, preset or DEFAULT_PRESET)))
+    return plans
+
+
+# Muxer y opciones para escribir cada formato en una tubería, donde no se
+# puede volver atrás a completar el índice: MP4/MOV/M4A van fragmentados y con
+# el moov (vacío) al inicio, así el reproductor arranca con el primer fragmento
+_FRAGMENTED = ["-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+STREAM_MUXERS: Dict[str, Tuple[str, List[str]]] = {
+    "mp4": ("mp4", _FRAGMENTED),
+    "mov": ("mov", _FRAGMENTED),
+    "m4a": ("ipod", _FRAGMENTED),
+    "mkv": ("matroska", []),
+    "webm": ("webm", []),
+    "mp3": ("mp3", []),
+    "ogg": ("ogg", []),
+    "flac": ("flac", []),
+}
+
+
+def streaming_plan(
+    formato: str, media: Dict[str, Any], preset: Optional[str] = None
+) -> Tuple[str, List[str]]:
+    """
+    (modo, argumentos de salida) para escribir `formato` progresivamente en
+    stdout. Es un solo intento: una vez enviados los primeros bytes no se
+    puede cambiar de plan. Lanza ValueError si el formato no es transmisible.
+    """
+    if formato not in STREAM_MUXERS:
+        raise ValueError(
+            f"Formato no transmisible en vivo. Usa uno de: {', '.join(STREAM_MUXERS)}"
+        )
+    modo, args = plan_encoding(formato, media, preset)[0]
+    # +faststart reescribe el archivo al final: imposible sobre una tubería
+    if "+faststart" in args:
+        i = args.index("+faststart")
+        args = args[: i - 1] + args[i + 1 :]
+    muxer, flags = STREAM_MUXERS[formato]
+    return modo, args + flags + ["-f", muxer]
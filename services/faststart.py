@@ -0,0 +1,195 @@
+"""
+Reordenamiento "faststart" de los MP4/MOV/M4A subidos.
+
+Muchos programas escriben el índice (moov) al final del archivo. Así, un
+reproductor que lo recibe de forma progresiva tiene que pedir el final del
+archivo antes de poder mostrar el primer cuadro. Después de cada subida se
+revisan los encabezados de las cajas. Si moov está después de mdat, ffmpeg
+reescribe el archivo con `-c copy -movflags +faststart` (sin recodificar) en
+un temporal, que luego reemplaza al original con `os.replace`. Los streams en
+curso conservan abierto el archivo anterior y terminan de leerlo sin cortes.
+Cada revisión corresponde a una versión del archivo: si llega otra subida
+con el mismo nombre, la nueva versión tiene su propia revisión y el remux de
+la anterior se descarta.
+
+El cambio produce una versión nueva del archivo: se descartan sus bloques en
+caché, se actualiza el catálogo y se vuelve a analizar, así que
+`media_metadata.disposicion` pasa de "moov_al_final" a "faststart".
+"""
+
+import os
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from services.conversion_manager import FFMPEG_CMD
+from services.http_cache import version_token
+from services.media_catalog import AUDIO_EXTS, VIDEO_EXTS, MediaCatalog, catalog
+from services.media_metadata import MediaMetadataService, metadata
+from services.media_probe import MP4_EXTS, mp4_layout
+from services.paths import BASE_DIR, replace_lock
+from services.segment_cache import segment_cache
+
+FASTSTART_ENABLED = os.getenv("FASTSTART_ENABLED", "1") == "1"
+# Un remux copia el archivo entero: pocos a la vez para no saturar el disco
+FASTSTART_WORKERS = int(os.getenv("FASTSTART_WORKERS", "1"))
+FASTSTART_TIMEOUT = 1800
+# Al arrancar solo se borran los temporales más viejos que esto: los recientes
+# pueden ser subidas o remux en curso de otro worker
+STALE_TMP_SECONDS = 3600
+
+# El temporal termina en .part (como las subidas), así que el muxer va explícito
+MUXERS = {".mp4": "mp4", ".m4v": "mp4", ".mov": "mov", ".m4a": "ipod"}
+
+
+class FaststartService:
+    def __init__(
+        self,
+        base_dir: Path,
+        catalog: Optional[MediaCatalog] = None,
+        metadata: Optional[MediaMetadataService] = None,
+        workers: int = FASTSTART_WORKERS,
+        enabled: bool = FASTSTART_ENABLED,
+    ):
+        self.dirs = {
+            "video": base_dir / "content" / "videos",
+            "audio": base_dir / "content" / "audios",
+        }
+        self.exts = {"video": VIDEO_EXTS, "audio": AUDIO_EXTS}
+        self.catalog = catalog
+        self.metadata = metadata
+        self.enabled = enabled
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="faststart"
+        )
+        # (tipo, nombre, versión) -> revisión en curso
+        self._inflight: Dict[Tuple[str, str, str], Future] = {}
+        self.counters = {
+            "reordenados": 0,
+            "sin_cambios": 0,
+            "descartados": 0,
+            "errores": 0,
+            "bytes": 0,
+            "segundos": 0.0,
+        }
+        self.lock = threading.Lock()
+
+    # ============================
+    # 🚀 API PÚBLICA
+    # ============================
+    def start(self):
+        """Borra los temporales que dejó un remux (o una subida) interrumpido."""
+        cutoff = time.time() - STALE_TMP_SECONDS
+        for directory in self.dirs.values():
+            for tmp in directory.glob(".*.part"):
+                try:
+                    if tmp.stat().st_mtime < cutoff:
+                        tmp.unlink(missing_ok=True)
+                except OSError:
+                    continue
+
+    def schedule(self, kind: str, name: str) -> Optional[Future]:
+        """
+        Encola la revisión de la versión actual de `name`. El Future devuelve
+        la disposición final del archivo (ver `mp4_layout`). None si el
+        servicio está apagado, el archivo no existe o no es MP4/MOV/M4A.
+        """
+        if not self.enabled or kind not in self.dirs:
+            return None
+        if os.path.basename(name) != name:
+            return None
+        lower = name.lower()
+        if not lower.endswith(self.exts[kind]) or not lower.endswith(MP4_EXTS):
+            return None
+
+        try:
+            token = version_token(os.stat(self.dirs[kind] / name))
+        except OSError:
+            return None
+        key = (kind, name, token)
+        with self.lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._pool.submit(self._run, key)
+                self._inflight[key] = future
+        return future
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            return dict(self.counters, en_curso=len(self._inflight))
+
+    def stop(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # ============================
+    # 🎞️ REMUX
+    # ============================
+    def _run(self, key: Tuple[str, str, str]) -> Optional[str]:
+        try:
+            return self._optimize(*key)
+        finally:
+            with self.lock:
+                self._inflight.pop(key, None)
+
+    def _optimize(self, kind: str, name: str, token: str) -> Optional[str]:
+        path = self.dirs[kind] / name
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if version_token(st) != token:
+            # Ya hay otra versión, que tiene su propia revisión
+            self._count(descartados=1)
+            return None
+        layout = mp4_layout(path)
+        if layout != "moov_al_final":
+            self._count(sin_cambios=1)
+            return layout
+
+        started = time.perf_counter()
+        tmp = path.with_name(f".{name}.{uuid.uuid4().hex}.part")
+        cmd = FFMPEG_CMD + ["-y", "-v", "error", "-i", str(path)]
+        cmd += ["-map", "0", "-c", "copy", "-movflags", "+faststart"]
+        cmd += ["-f", MUXERS[path.suffix.lower()], str(tmp)]
+        try:
+            result = subprocess.run(cmd, capture_output=True, timeout=FASTSTART_TIMEOUT)
+            if result.returncode != 0 or mp4_layout(tmp) != "faststart":
+                self._count(errores=1)
+                return layout
+            # Si mientras tanto llegó otra subida, esa tiene su propia revisión.
+            # La comprobación y el rename van bajo el mismo lock que usan las
+            # subidas para publicar: ninguna puede colarse entre los dos
+            with replace_lock(path):
+                if version_token(os.stat(path)) != token:
+                    self._count(descartados=1)
+                    return None
+                os.replace(tmp, path)
+        except (OSError, subprocess.SubprocessError):
+            self._count(errores=1)
+            return layout
+        finally:
+            tmp.unlink(missing_ok=True)
+
+        self._count(
+            reordenados=1,
+            bytes=st.st_size,
+            segundos=time.perf_counter() - started,
+        )
+        segment_cache.invalidate(str(path))
+        if self.catalog is not None:
+            self.catalog.upsert(kind, name)
+        if self.metadata is not None:
+            self.metadata.schedule(kind, name)
+        return "faststart"
+
+    def _count(self, **deltas):
+        with self.lock:
+            for field, delta in deltas.items():
+                self.counters[field] += delta
+
+
+faststart = FaststartService(BASE_DIR, catalog=catalog, metadata=metadata)
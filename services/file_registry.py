@@ -1,48 +1,128 @@
 import json
+import os
+import time
 from pathlib import Path
-from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from services.paths import BASE_DIR
+from services.storage.db import engine as default_engine
+from services.storage.model import MediaFile
 
 
 class FileRegistry:
     """
-    Registro simple en JSON que almacena el propietario de cada archivo subido.
-    Estructura:
-    {
-        "intro.mp4": {"owner": "advillalobos"},
-        "theme.mp3": {"owner": "izack"}
-    }
+    Registro del propietario de cada archivo subido, guardado en la tabla
+    `media_file` (clave primaria = nombre del archivo).
+
+    Cada alta es un upsert de una fila en su propia transacción: no se
+    reescribe nada más, las búsquedas van por la clave primaria y la base de
+    datos serializa a los escritores aunque uvicorn corra con varios procesos.
+
+    Reemplaza al antiguo content/file_metadata.json; `migrate_json` importa ese
+    archivo una sola vez y lo renombra a `.migrated`.
     """
 
-    def __init__(self, base_dir: Path):
+    def __init__(self, base_dir: Path, engine=None):
         self.file = base_dir / "content" / "file_metadata.json"
-        self.lock = Lock()
-        self.file.parent.mkdir(parents=True, exist_ok=True)
-        if not self.file.exists():
-            self.file.write_text("{}", encoding="utf-8")
-
-    def _read(self):
-        try:
-            with self.file.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return {}
+        self.engine = engine or default_engine
 
-    def _write(self, data):
-        with self.file.open("w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
+    def _upsert(self, session: Session, rows: List[Dict]):
+        dialect = self.engine.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite_insert if dialect == "sqlite" else pg_insert
+            stmt = insert(MediaFile)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["filename"],
+                set_={
+                    "owner": stmt.excluded.owner,
+                    "actualizado": stmt.excluded.actualizado,
+                },
+            )
+            # executemany: una sentencia preparada para todo el lote
+            session.execute(stmt, rows)
+        else:
+            for row in rows:
+                session.merge(MediaFile(**row))
 
     def register(self, filename: str, owner: str):
         """Registra o actualiza el propietario de un archivo."""
-        with self.lock:
-            data = self._read()
-            data[filename] = {"owner": owner}
-            self._write(data)
+        self.register_many([(filename, owner)])
+
+    def register_many(self, items: Iterable[Tuple[str, str]]) -> int:
+        """Registra varios (archivo, propietario) en una sola transacción."""
+        now = time.time()
+        rows = {
+            name: {"filename": name, "owner": owner, "actualizado": now}
+            for name, owner in items
+        }
+        rows = list(rows.values())
+        if not rows:
+            return 0
+        with Session(self.engine) as session:
+            self._upsert(session, rows)
+            session.commit()
+        return len(rows)
+
+    def unregister(self, filename: str):
+        with Session(self.engine) as session:
+            row = session.get(MediaFile, filename)
+            if row is not None:
+                session.delete(row)
+                session.commit()
 
     def get_owner(self, filename: str) -> str:
         """Devuelve el propietario de un archivo o 'unknown' si no está registrado."""
-        data = self._read()
-        return data.get(filename, {}).get("owner", "unknown")
+        with Session(self.engine) as session:
+            row = session.get(MediaFile, filename)
+            return row.owner if row else "unknown"
+
+    def files_by_owner(
+        self, owner: str, limit: Optional[int] = None, offset: int = 0
+    ) -> List[str]:
+        """Archivos de un propietario, en orden alfabético."""
+        query = (
+            select(MediaFile.filename)
+            .where(MediaFile.owner == owner)
+            .order_by(MediaFile.filename)
+            .offset(offset)
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        with Session(self.engine) as session:
+            return list(session.exec(query).all())
+
+    def all(self) -> Dict[str, Dict[str, str]]:
+        """Devuelve todos los registros con la forma del antiguo JSON."""
+        with Session(self.engine) as session:
+            rows = session.exec(select(MediaFile.filename, MediaFile.owner)).all()
+        return {filename: {"owner": owner} for filename, owner in rows}
+
+    def migrate_json(self) -> int:
+        """
+        Importa content/file_metadata.json si todavía existe. Es idempotente:
+        si varios procesos arrancan a la vez, los upserts repiten los mismos
+        datos y solo uno logra renombrar el archivo.
+        """
+        try:
+            with self.file.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except json.JSONDecodeError:
+            data = {}
+
+        count = self.register_many(
+            (name, (meta or {}).get("owner", "unknown")) for name, meta in data.items()
+        )
+        try:
+            os.replace(self.file, self.file.with_name(self.file.name + ".migrated"))
+        except FileNotFoundError:
+            pass
+        return count
+
 
-    def all(self):
-        """Devuelve todos los registros."""
-        return self._read()
+registry = FileRegistry(BASE_DIR)
@@ -0,0 +1,94 @@
+"""
+Validadores HTTP (ETag / Last-Modified) y solicitudes condicionales (RFC 9110,
+sección 13): If-None-Match / If-Modified-Since devuelven 304 sin cuerpo.
+
+Las URLs versionadas (`?v=<token>`) se sirven con `immutable`: el token cambia
+cuando cambia el archivo, así que un CDN o el navegador pueden guardarlas un
+año sin revalidar.
+"""
+
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+from starlette.responses import Response
+
+CACHE_CONTROL = "public, max-age=3600"
+CACHE_CONTROL_IMMUTABLE = "public, max-age=31536000, immutable"
+# Los listados cambian en cualquier momento: siempre revalidar (barato con 304)
+CACHE_CONTROL_LISTING = "public, no-cache"
+
+
+def file_etag(st: os.stat_result) -> str:
+    """ETag fuerte derivado de inodo, tamaño y mtime (sin leer el archivo)."""
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def version_token(st: os.stat_result) -> str:
+    """Token corto para URLs versionadas por contenido (`?v=`)."""
+    raw = f"{st.st_ino}-{st.st_size}-{st.st_mtime_ns}".encode("ascii")
+    return hashlib.blake2s(raw, digest_size=6).hexdigest()
+
+
+def listing_etag(kind: str, version: int, query: str) -> str:
+    """ETag débil para un listado: versión del catálogo + parámetros."""
+    digest = hashlib.blake2s(query.encode("utf-8"), digest_size=6).hexdigest()
+    return f'W/"{kind}-{version:x}-{digest}"'
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def validator_headers(
+    etag: str, last_modified: Optional[float] = None, immutable: bool = False
+) -> Dict[str, str]:
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL_IMMUTABLE if immutable else CACHE_CONTROL,
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def _strip_weak(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(
+    request_headers: Mapping[str, str],
+    etag: str,
+    last_modified: Optional[float] = None,
+) -> bool:
+    """
+    True si la copia del cliente sigue siendo válida. If-None-Match (comparación
+    débil) tiene prioridad; If-Modified-Since solo se evalúa si no viene.
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        current = _strip_weak(etag)
+        return any(
+            _strip_weak(tag.strip()) == current for tag in if_none_match.split(",")
+        )
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since.timestamp()
+    return False
+
+
+def not_modified(headers: Mapping[str, str]) -> Response:
+    """Respuesta 304 que repite los validadores y la política de caché."""
+    keep = ("etag", "last-modified", "cache-control", "vary")
+    return Response(
+        status_code=304,
+        headers={k: v for k, v in headers.items() if k.lower() in keep},
+    )
@@ -0,0 +1,125 @@
+"""
+Parser de los encabezados Range / If-Range (RFC 9110, secciones 14.1 a 14.5).
+
+Soporta rangos `inicio-fin`, `inicio-` y sufijos `-N`, descarta los rangos no
+satisfacibles y fusiona los que se solapan o están a menos de
+`COALESCE_GAP` bytes, para que cada zona del archivo se lea y se envíe una
+sola vez.
+"""
+
+from email.utils import parsedate_to_datetime
+from typing import List, Optional, Tuple
+
+# Rangos separados por menos bytes que esto se envían como uno solo: es más
+# barato mandar el hueco que los encabezados de una parte multipart extra.
+COALESCE_GAP = 80
+
+# Límite de rangos por petición para evitar respuestas multipart abusivas
+MAX_RANGES = 64
+
+ByteRange = Tuple[int, int]
+
+
+class RangeNotSatisfiable(Exception):
+    """Ninguno de los rangos pedidos se solapa con el archivo (416)."""
+
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[List[ByteRange]]:
+    """
+    Devuelve la lista de rangos (inicio, fin) inclusivos, ordenados y fusionados.
+
+    Devuelve None si el encabezado no es válido o usa una unidad distinta de
+    `bytes`: según la RFC, en ese caso se ignora y se sirve el archivo completo.
+    Lanza RangeNotSatisfiable si ningún rango es satisfacible.
+    """
+    unit, _, range_set = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not range_set.strip():
+        return None
+
+    ranges: List[ByteRange] = []
+    for spec in range_set.split(","):
+        spec = spec.strip()
+        if not spec:
+            continue
+        first, sep, last = spec.partition("-")
+        if not sep:
+            return None
+        first, last = first.strip(), last.strip()
+
+        try:
+            if not first:
+                # Rango sufijo: los últimos N bytes
+                suffix = int(last)
+                if suffix < 0:
+                    return None
+                if suffix == 0:
+                    continue
+                ranges.append((max(file_size - suffix, 0), file_size - 1))
+                continue
+
+            start = int(first)
+            end = int(last) if last else None
+        except ValueError:
+            return None
+
+        # Un fin explícito menor que el inicio es un encabezado inválido (se
+        # ignora); un inicio después del final del archivo no es satisfacible
+        if start < 0 or (end is not None and end < start):
+            return None
+        if start >= file_size:
+            continue
+        end = file_size - 1 if end is None else min(end, file_size - 1)
+        ranges.append((start, end))
+
+    if not ranges or file_size == 0:
+        raise RangeNotSatisfiable()
+
+    ranges = coalesce_ranges(ranges)
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def coalesce_ranges(
+    ranges: List[ByteRange], gap: int = COALESCE_GAP
+) -> List[ByteRange]:
+    """Ordena y fusiona los rangos solapados, adyacentes o separados por < gap."""
+    merged: List[ByteRange] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1 + gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(
+    if_range: Optional[str],
+    etag: Optional[str] = None,
+    last_modified: Optional[float] = None,
+) -> bool:
+    """
+    Evalúa If-Range: True si el rango debe respetarse.
+
+    Un entity-tag requiere comparación fuerte (los ETag débiles nunca coinciden)
+    y una fecha debe ser exactamente igual a Last-Modified.
+    """
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return (
+            etag is not None
+            and not etag.startswith("W/")
+            and not if_range.startswith("W/")
+            and if_range == etag
+        )
+
+    if last_modified is None:
+        return False
+    try:
+        date = parsedate_to_datetime(if_range)
+    except (TypeError, ValueError):
+        return False
+    return int(date.timestamp()) == int(last_modified)
@@ -0,0 +1,285 @@
+"""
+Conversión en vivo: se transmite la salida de ffmpeg mientras se genera.
+
+ffmpeg escribe en stdout un contenedor transmisible (MP4 fragmentado,
+Matroska, MP3...) y un hilo copia cada bloque a un archivo oculto en
+content/converted/cache. Los clientes leen ese archivo a medida que crece,
+así que el primero recibe bytes a los pocos segundos en lugar de esperar la
+conversión completa, y los siguientes que pidan lo mismo se unen al trabajo
+en curso desde el byte 0. Al terminar bien, el archivo se renombra a su
+clave de caché y los pedidos posteriores se sirven del disco.
+
+Cada ffmpeg en vivo ocupa un lugar del límite de conversiones simultáneas
+del gestor (`CONVERSION_WORKERS`), compartido con las de la cola.
+
+Si todos los clientes se van, ffmpeg sigue `idle_grace` segundos por si
+alguien vuelve; pasado ese tiempo se detiene y se descarta lo generado.
+"""
+
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from services.conversion_manager import FFMPEG_CMD, ConversionManager
+from services.encoding import DEFAULT_PRESET, streaming_plan
+
+PERFIL_VIVO = "live"
+LIVE_IDLE_SECONDS = float(os.getenv("LIVE_IDLE_SECONDS", "30"))
+LIVE_CHUNK_SIZE = 256 * 1024
+
+
+class LiveCapacityError(Exception):
+    """Todos los lugares de ffmpeg del gestor están ocupados."""
+
+
+class LiveJob:
+    """Una ejecución de ffmpeg y el archivo que va creciendo con su salida."""
+
+    def __init__(self, key: str, formato: str, tee_path: Path, output_path: Path):
+        self.key = key
+        self.formato = formato
+        self.tee_path = tee_path
+        self.output_path = output_path
+        self.modo: Optional[str] = None
+        self.size = 0
+        self.done = False
+        self.error: Optional[str] = None
+        self.readers = 0
+        self.started = time.time()
+        self.first_byte: Optional[float] = None
+        self.proc: Optional[subprocess.Popen] = None
+        self.abandoned = False
+        self._listeners: Set[Callable[[], None]] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        `callback` se invoca (desde el hilo de ffmpeg) cada vez que llegan
+        bytes nuevos y al terminar. Devuelve la función para desuscribirse.
+        """
+        with self._lock:
+            self._listeners.add(callback)
+
+        def unsubscribe():
+            with self._lock:
+                self._listeners.discard(callback)
+
+        return unsubscribe
+
+    def snapshot(self) -> Tuple[int, bool, Optional[str]]:
+        """(bytes disponibles, terminado, error)."""
+        with self._lock:
+            return self.size, self.done, self.error
+
+    def _advance(self, size: int = 0, done: bool = False, error: str = None):
+        with self._lock:
+            self.size += size
+            if size and self.first_byte is None:
+                self.first_byte = time.time()
+            if done:
+                self.done = True
+                self.error = error
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback()
+            except Exception:
+                continue
+
+
+class LiveStream:
+    """Lectura de un cliente sobre un `LiveJob`."""
+
+    def __init__(self, transcoder: "LiveTranscoder", job: LiveJob, joined: bool):
+        self.transcoder = transcoder
+        self.job = job
+        self.joined = joined
+        self.file = job.tee_path.open("rb")
+        self._closed = False
+
+    def read(self, size: int) -> bytes:
+        return self.file.read(size)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.file.close()
+        self.transcoder._release(self.job)
+
+
+class LiveTranscoder:
+    def __init__(
+        self,
+        manager: ConversionManager,
+        idle_grace: float = LIVE_IDLE_SECONDS,
+    ):
+        self.manager = manager
+        self.idle_grace = idle_grace
+        # clave de caché -> trabajo en curso
+        self.jobs: Dict[str, LiveJob] = {}
+        self.lock = threading.Lock()
+
+    # ============================
+    # 🚀 API PÚBLICA
+    # ============================
+    def open(
+        self, input_path: Path, formato: str, preset: Optional[str] = None
+    ) -> Tuple[Optional[Path], Optional[LiveStream]]:
+        """
+        (archivo en caché, None) si la conversión ya existe completa; si no,
+        (None, lectura) sobre el trabajo en curso o uno nuevo. Lanza
+        ValueError con un formato no transmisible o un preset desconocido y
+        LiveCapacityError si no se puede lanzar otro ffmpeg.
+        """
+        preset = preset or DEFAULT_PRESET
+        output_path = self.manager.output_path_for(
+            input_path, formato, PERFIL_VIVO, preset
+        )
+        key = output_path.stem
+        if output_path.exists():
+            # Marcar la entrada como usada recientemente (LRU)
+            os.utime(output_path)
+            return output_path, None
+
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None:
+                return None, self._attach(job, joined=True)
+
+        # ffprobe fuera del lock (suele salir de la caché de metadatos)
+        modo, args = streaming_plan(formato, self.manager.prober(input_path), preset)
+
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None:
+                return None, self._attach(job, joined=True)
+            if output_path.exists():
+                os.utime(output_path)
+                return output_path, None
+            if not self.manager.acquire_slot():
+                raise LiveCapacityError(
+                    "Demasiadas conversiones en curso; intenta de nuevo más tarde"
+                )
+
+            tee_path = output_path.with_name(f".{uuid.uuid4().hex}.live.{formato}")
+            job = LiveJob(key, formato, tee_path, output_path)
+            job.modo = modo
+            try:
+                sink = tee_path.open("wb")
+            except OSError:
+                self.manager.release_slot()
+                raise
+            self.jobs[key] = job
+            stream = self._attach(job, joined=False)
+
+        cmd = FFMPEG_CMD + ["-nostats", "-loglevel", "error", "-i", str(input_path)]
+        cmd += args + ["pipe:1"]
+        threading.Thread(target=self._pump, args=(job, cmd, sink), daemon=True).start()
+        return None, stream
+
+    def active_jobs(self) -> List[Dict]:
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [
+            {
+                "formato": job.formato,
+                "modo": job.modo,
+                "bytes": job.size,
+                "clientes": job.readers,
+                "segundos": round(time.time() - job.started, 1),
+            }
+            for job in jobs
+        ]
+
+    def stop(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.abandoned = True
+            if job.proc is not None:
+                job.proc.terminate()
+
+    # ============================
+    # 👥 CLIENTES
+    # ============================
+    def _attach(self, job: LiveJob, joined: bool) -> LiveStream:
+        # Llamar con self.lock tomado: mientras el trabajo sigue en
+        # self.jobs, el archivo temporal existe con su nombre
+        job.readers += 1
+        return LiveStream(self, job, joined)
+
+    def _release(self, job: LiveJob):
+        with self.lock:
+            job.readers -= 1
+            idle = job.readers == 0 and not job.done
+        if idle:
+            timer = threading.Timer(self.idle_grace, self._abandon_if_idle, (job,))
+            timer.daemon = True
+            timer.start()
+
+    def _abandon_if_idle(self, job: LiveJob):
+        with self.lock:
+            if job.readers or job.done:
+                return
+            job.abandoned = True
+            proc = job.proc
+        if proc is not None:
+            proc.terminate()
+
+    # ============================
+    # 🎞️ FFMPEG
+    # ============================
+    def _pump(self, job: LiveJob, cmd: List[str], sink):
+        """Copia stdout de ffmpeg al archivo temporal, avisando a los lectores."""
+        error = None
+        with tempfile.TemporaryFile() as stderr_file, sink:
+            try:
+                with self.lock:
+                    if job.abandoned:
+                        raise OSError("Conversión en vivo cancelada")
+                    job.proc = proc = subprocess.Popen(
+                        cmd, stdout=subprocess.PIPE, stderr=stderr_file
+                    )
+                # read1 devuelve lo que haya disponible: los bytes salen hacia
+                # los clientes apenas ffmpeg los produce
+                while chunk := proc.stdout.read1(LIVE_CHUNK_SIZE):
+                    sink.write(chunk)
+                    sink.flush()
+                    job._advance(len(chunk))
+                proc.wait()
+                if job.abandoned:
+                    error = "Conversión en vivo cancelada"
+                elif proc.returncode != 0:
+                    stderr_file.seek(0)
+                    stderr = stderr_file.read()[-500:].decode("utf-8", "replace")
+                    error = (
+                        stderr.strip() or f"ffmpeg terminó con código {proc.returncode}"
+                    )
+            except OSError as e:
+                error = str(e)
+                if job.proc is not None:
+                    job.proc.kill()
+
+        try:
+            with self.lock:
+                # Renombrar y quitar el trabajo juntos: quien llegue después
+                # encuentra el archivo en caché o el trabajo, nunca ninguno
+                try:
+                    if error is None:
+                        os.replace(job.tee_path, job.output_path)
+                    else:
+                        job.tee_path.unlink(missing_ok=True)
+                except OSError as e:
+                    error = str(e)
+                self.jobs.pop(job.key, None)
+        finally:
+            self.manager.release_slot()
+        job._advance(done=True, error=error)
+        if error is None:
+            self.manager.enforce_cache_budget()
@@ -0,0 +1,327 @@
+import base64
+import bisect
+import json
+import mimetypes
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.file_registry import FileRegistry
+from services.http_cache import version_token
+from services.paths import BASE_DIR
+
+VIDEO_EXTS = (".mp4", ".mkv", ".mov", ".avi")
+AUDIO_EXTS = (".mp3", ".wav", ".flac", ".ogg", ".m4a")
+
+SORT_FIELDS = ("nombre", "tamaño", "fecha")
+
+
+@dataclass
+class MediaEntry:
+    nombre: str
+    tipo: Optional[str]
+    size: int
+    mtime: float
+    owner: str = "unknown"
+    token: str = ""
+    # Datos de ffprobe (services.media_metadata) del archivo con este token
+    meta: Optional[Dict[str, Any]] = None
+
+    def sort_value(self, field: str):
+        if field == "tamaño":
+            return self.size
+        if field == "fecha":
+            return self.mtime
+        return self.nombre
+
+
+class MediaCatalog:
+    """
+    Índice en memoria de los archivos de content/videos y content/audios.
+
+    Se construye una vez al arrancar y se mantiene al día de forma incremental:
+    las subidas llaman a `upsert`, y un hilo revisa el mtime de cada carpeta
+    cada `poll_interval` segundos, reescaneándola solo cuando cambió (y por
+    completo cada `full_rescan_every` revisiones, para detectar archivos
+    modificados en el lugar). Los listados se responden desde el índice, con
+    una lista ordenada por cada criterio de orden, sin tocar el disco.
+    """
+
+    def __init__(
+        self,
+        base_dir: Path,
+        poll_interval: float = 5.0,
+        full_rescan_every: int = 60,
+    ):
+        self.base_dir = base_dir
+        self.dirs = {
+            "video": base_dir / "content" / "videos",
+            "audio": base_dir / "content" / "audios",
+        }
+        self.exts = {"video": VIDEO_EXTS, "audio": AUDIO_EXTS}
+        self.poll_interval = poll_interval
+        self.full_rescan_every = full_rescan_every
+
+        self._entries: Dict[str, Dict[str, MediaEntry]] = {k: {} for k in self.dirs}
+        self._sorted: Dict[str, Dict[str, List[Tuple[Any, str]]]] = {
+            k: {field: [] for field in SORT_FIELDS} for k in self.dirs
+        }
+        self._total_size: Dict[str, int] = {k: 0 for k in self.dirs}
+        self._dir_mtime: Dict[str, Optional[int]] = {k: None for k in self.dirs}
+        self.version = 0
+        self.updated_at = time.time()
+
+        self.lock = threading.RLock()
+        self._stop = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+
+    # ============================
+    # 🔄 CONSTRUCCIÓN Y REFRESCO
+    # ============================
+    def start(self):
+        """Construye el índice e inicia el hilo de sondeo."""
+        self.build()
+        if self._poller is not None:
+            return
+        self._stop.clear()
+        self._poller = threading.Thread(target=self._poll_loop, daemon=True)
+        self._poller.start()
+
+    def stop(self):
+        self._stop.set()
+        self._poller = None
+
+    def build(self):
+        owners = FileRegistry(self.base_dir).all()
+        for kind in self.dirs:
+            self.refresh(kind, full=True, owners=owners)
+
+    def _poll_loop(self):
+        polls = 0
+        while not self._stop.wait(self.poll_interval):
+            polls += 1
+            full = polls % self.full_rescan_every == 0
+            for kind in self.dirs:
+                try:
+                    self.refresh(kind, full=full)
+                except OSError:
+                    continue
+
+    def refresh(self, kind: str, full: bool = False, owners: Optional[dict] = None):
+        """
+        Sincroniza el índice de `kind` con su carpeta. Sin `full`, no hace nada
+        si el mtime de la carpeta no cambió desde la última revisión.
+        """
+        directory = self.dirs[kind]
+        try:
+            dir_mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime = None
+        if not full and dir_mtime == self._dir_mtime[kind]:
+            return
+
+        found = {}
+        if dir_mtime is not None:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.name.lower().endswith(self.exts[kind]):
+                        found[entry.name] = entry
+
+        with self.lock:
+            current = self._entries[kind]
+            for name in [n for n in current if n not in found]:
+                self._remove(kind, name)
+
+            for name, dir_entry in found.items():
+                try:
+                    st = dir_entry.stat()
+                except OSError:
+                    continue
+                old = current.get(name)
+                if old and (old.size, old.mtime) == (st.st_size, st.st_mtime):
+                    continue
+                if owners is not None:
+                    owner = owners.get(name, {}).get("owner", "unknown")
+                else:
+                    owner = old.owner if old else "unknown"
+                self._insert(kind, name, st, owner)
+
+            self._dir_mtime[kind] = dir_mtime
+
+    def upsert(self, kind: str, name: str, owner: Optional[str] = None):
+        """Actualiza la entrada de un archivo recién subido o modificado."""
+        path = self.dirs[kind] / name
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.remove(kind, name)
+            return
+        with self.lock:
+            old = self._entries[kind].get(name)
+            if owner is None:
+                owner = old.owner if old else "unknown"
+            self._insert(kind, name, st, owner)
+
+    def remove(self, kind: str, name: str):
+        with self.lock:
+            self._remove(kind, name)
+
+    def _insert(self, kind: str, name: str, st: os.stat_result, owner: str):
+        old = self._entries[kind].get(name)
+        self._remove(kind, name)
+        entry = MediaEntry(
+            nombre=name,
+            tipo=mimetypes.guess_type(name)[0],
+            size=st.st_size,
+            mtime=st.st_mtime,
+            owner=owner,
+            token=version_token(st),
+        )
+        if old is not None and old.token == entry.token:
+            entry.meta = old.meta
+        self._entries[kind][name] = entry
+        for field, keys in self._sorted[kind].items():
+            bisect.insort(keys, (entry.sort_value(field), name))
+        self._total_size[kind] += entry.size
+        self._touch()
+
+    def _remove(self, kind: str, name: str):
+        entry = self._entries[kind].pop(name, None)
+        if entry is None:
+            return
+        for field, keys in self._sorted[kind].items():
+            key = (entry.sort_value(field), name)
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+        self._total_size[kind] -= entry.size
+        self._touch()
+
+    def set_meta(self, kind: str, metas: Dict[str, Tuple[str, Dict[str, Any]]]) -> int:
+        """
+        Asocia metadatos {nombre: (token, datos)} a las entradas de `kind`.
+        Solo se aplican si el token coincide (el archivo no cambió desde que
+        se analizó). Devuelve cuántas entradas se actualizaron.
+        """
+        applied = 0
+        with self.lock:
+            for name, (token, meta) in metas.items():
+                entry = self._entries[kind].get(name)
+                if entry is not None and entry.token == token:
+                    entry.meta = meta
+                    applied += 1
+            if applied:
+                self._touch()
+        return applied
+
+    def _touch(self):
+        self.version += 1
+        self.updated_at = time.time()
+
+    # ============================
+    # 🔍 CONSULTAS
+    # ============================
+    def get(self, kind: str, name: str) -> Optional[MediaEntry]:
+        with self.lock:
+            return self._entries[kind].get(name)
+
+    def query(
+        self,
+        kind: str,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        ext: Optional[str] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        owner: Optional[str] = None,
+        sort: str = "nombre",
+        order: str = "asc",
+    ) -> Tuple[List[MediaEntry], Optional[str]]:
+        """
+        Devuelve hasta `limit` entradas filtradas y el cursor de la página
+        siguiente (None si no hay más). Lanza ValueError con parámetros
+        inválidos.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Orden inválido. Usa uno de: {', '.join(SORT_FIELDS)}")
+        if order not in ("asc", "desc"):
+            raise ValueError("Dirección inválida. Usa 'asc' o 'desc'")
+        if ext:
+            ext = ext.lower() if ext.startswith(".") else f".{ext.lower()}"
+
+        with self.lock:
+            keys = self._sorted[kind][sort]
+            entries = self._entries[kind]
+            descending = order == "desc"
+
+            if cursor:
+                after = _decode_cursor(cursor)
+                try:
+                    if descending:
+                        position = bisect.bisect_left(keys, after) - 1
+                    else:
+                        position = bisect.bisect_right(keys, after)
+                except TypeError:
+                    raise ValueError("Cursor inválido")
+            else:
+                position = len(keys) - 1 if descending else 0
+            step = -1 if descending else 1
+
+            # Se busca una coincidencia más que `limit`: solo si existe hay
+            # página siguiente
+            items: List[MediaEntry] = []
+            item_keys = []
+            while 0 <= position < len(keys):
+                key = keys[position]
+                position += step
+                entry = entries[key[1]]
+                if ext and not entry.nombre.lower().endswith(ext):
+                    continue
+                if min_size is not None and entry.size < min_size:
+                    continue
+                if max_size is not None and entry.size > max_size:
+                    continue
+                if owner is not None and entry.owner != owner:
+                    continue
+                items.append(entry)
+                item_keys.append(key)
+                if len(items) > limit:
+                    break
+
+            next_cursor = None
+            if len(items) > limit:
+                items = items[:limit]
+                next_cursor = _encode_cursor(item_keys[limit - 1])
+            return items, next_cursor
+
+    def stats(self, kind: str, top: int = 5) -> Dict[str, Any]:
+        """Cantidad, peso total y los `top` archivos más recientes de `kind`."""
+        with self.lock:
+            entries = self._entries[kind]
+            recent = [
+                entries[name] for _, name in self._sorted[kind]["fecha"][-top:][::-1]
+            ]
+            return {
+                "count": len(entries),
+                "total_size_mb": round(self._total_size[kind] / (1024 * 1024), 2),
+                "files": recent,
+            }
+
+
+def _encode_cursor(key: Tuple[Any, str]) -> str:
+    raw = json.dumps(list(key)).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        value, name = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (value, name)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+
+
+catalog = MediaCatalog(BASE_DIR)
@@ -0,0 +1,295 @@
+"""
+Metadatos técnicos (duración, bitrate, resolución, códecs) de los archivos de
+content/videos y content/audios.
+
+ffprobe corre una sola vez por versión de cada archivo: el resultado se guarda
+en la tabla `media_metadata` junto con el `version_token` (inodo, tamaño y
+mtime) y solo se vuelve a analizar si el archivo cambia. Los análisis corren
+en un pool acotado de hilos, y los pedidos repetidos de un archivo que ya se
+está analizando esperan ese mismo análisis.
+
+Para el contenido que ya existía antes de este servicio:
+
+    python -m services.media_metadata backfill [--force]
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlmodel import Session, select
+
+from services.http_cache import version_token
+from services.media_catalog import AUDIO_EXTS, VIDEO_EXTS, MediaCatalog, catalog
+from services.media_probe import MP4_EXTS, mp4_layout, probe_media
+from services.paths import BASE_DIR
+from services.storage.db import engine as default_engine
+from services.storage.model import MediaMetadata
+
+# ffprobe lee poco, pero un backfill masivo no debe acaparar el disco
+METADATA_WORKERS = int(os.getenv("METADATA_WORKERS", "2"))
+# Espera máxima de un análisis pedido por un cliente
+METADATA_TIMEOUT = 60
+
+PROBE_FIELDS = (
+    "duracion",
+    "bitrate",
+    "formato",
+    "ancho",
+    "alto",
+    "fps",
+    "codec_video",
+    "codec_audio",
+    "canales",
+    "sample_rate",
+)
+
+
+class MediaInfoResponse(BaseModel):
+    """Respuesta de /videos/{nombre}/info y /audios/{nombre}/info."""
+
+    nombre: str
+    tamaño_bytes: int
+    duracion: Optional[float] = None
+    bitrate: Optional[int] = None
+    formato: Optional[str] = None
+    ancho: Optional[int] = None
+    alto: Optional[int] = None
+    fps: Optional[float] = None
+    codec_video: Optional[str] = None
+    codec_audio: Optional[str] = None
+    canales: Optional[int] = None
+    sample_rate: Optional[int] = None
+    disposicion: Optional[str] = None
+    analizado: Optional[str] = None
+    error: Optional[str] = None
+
+
+class MediaMetadataService:
+    def __init__(
+        self,
+        base_dir: Path,
+        catalog: Optional[MediaCatalog] = None,
+        engine=None,
+        workers: int = METADATA_WORKERS,
+    ):
+        self.dirs = {
+            "video": base_dir / "content" / "videos",
+            "audio": base_dir / "content" / "audios",
+        }
+        self.exts = {"video": VIDEO_EXTS, "audio": AUDIO_EXTS}
+        self.catalog = catalog
+        self.engine = engine or default_engine
+        self.workers = workers
+
+        # (tipo, nombre) -> último análisis guardado
+        self._cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # (tipo, nombre, token) -> análisis en curso
+        self._inflight: Dict[Tuple[str, str, str], Future] = {}
+        self.lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    # ============================
+    # 🔄 CICLO DE VIDA
+    # ============================
+    def start(self):
+        """Carga los análisis guardados y los asocia a las entradas del catálogo."""
+        with Session(self.engine) as session:
+            rows = session.exec(select(MediaMetadata)).all()
+        by_kind: Dict[str, Dict[str, Tuple[str, Dict[str, Any]]]] = {}
+        with self.lock:
+            for row in rows:
+                data = row.model_dump()
+                self._cache[(row.tipo, row.nombre)] = data
+                by_kind.setdefault(row.tipo, {})[row.nombre] = (row.token, data)
+        if self.catalog is not None:
+            for kind, metas in by_kind.items():
+                if kind in self.dirs:
+                    self.catalog.set_meta(kind, metas)
+
+    def stop(self):
+        with self.lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self.lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="ffprobe"
+                )
+            return self._pool
+
+    # ============================
+    # 🔍 CONSULTAS
+    # ============================
+    def _stat(self, kind: str, name: str) -> Optional[Tuple[Path, os.stat_result]]:
+        if kind not in self.dirs or os.path.basename(name) != name:
+            return None
+        if not name.lower().endswith(self.exts[kind]):
+            return None
+        path = self.dirs[kind] / name
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return path, st
+
+    def lookup(self, kind: str, name: str, token: str) -> Optional[Dict[str, Any]]:
+        """Análisis guardado de `name` si corresponde a la versión `token`."""
+        with self.lock:
+            data = self._cache.get((kind, name))
+        if data is not None and data["token"] == token:
+            return data
+        return None
+
+    def schedule(self, kind: str, name: str, force: bool = False) -> Optional[Future]:
+        """
+        Encola el análisis de `name` si su versión actual no está analizada.
+        Devuelve el Future del análisis (ya resuelto si estaba en caché) o
+        None si el archivo no existe.
+        """
+        found = self._stat(kind, name)
+        if found is None:
+            return None
+        path, st = found
+        token = version_token(st)
+        if not force:
+            data = self.lookup(kind, name, token)
+            if data is not None:
+                done: Future = Future()
+                done.set_result(data)
+                return done
+
+        key = (kind, name, token)
+        with self.lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+        pool = self._executor()
+        with self.lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = pool.submit(self._probe, kind, name, path, st, token)
+            self._inflight[key] = future
+        # Fuera del lock: si ya terminó, el callback corre en este hilo
+        future.add_done_callback(lambda _: self._forget(key))
+        return future
+
+    def get(
+        self, kind: str, name: str, timeout: float = METADATA_TIMEOUT
+    ) -> Optional[Dict[str, Any]]:
+        """Metadatos de la versión actual, analizándola si hace falta (bloquea)."""
+        future = self.schedule(kind, name)
+        if future is None:
+            return None
+        return future.result(timeout=timeout)
+
+    def probe_path(self, path: Path) -> Dict[str, Any]:
+        """
+        Igual que `probe_media`, pero usa la caché cuando `path` es un archivo
+        de content/videos o content/audios.
+        """
+        path = Path(path)
+        for kind, directory in self.dirs.items():
+            if path.parent.resolve() == directory.resolve():
+                data = self.get(kind, path.name)
+                if data is not None and not data["error"]:
+                    media = {field: data[field] for field in PROBE_FIELDS}
+                    media["audio"] = data["codec_audio"] is not None
+                    return media
+                break
+        return probe_media(path)
+
+    def _forget(self, key: Tuple[str, str, str]):
+        with self.lock:
+            self._inflight.pop(key, None)
+
+    # ============================
+    # 🔬 ANÁLISIS
+    # ============================
+    def _probe(
+        self, kind: str, name: str, path: Path, st: os.stat_result, token: str
+    ) -> Dict[str, Any]:
+        media = probe_media(path)
+        layout = mp4_layout(path) if name.lower().endswith(MP4_EXTS) else None
+        row = MediaMetadata(
+            tipo=kind,
+            nombre=name,
+            token=token,
+            size=st.st_size,
+            disposicion=layout,
+            error=None if media else "ffprobe no pudo analizar el archivo",
+            analizado=time.time(),
+            **{field: media.get(field) for field in PROBE_FIELDS},
+        )
+        data = row.model_dump()
+        with Session(self.engine) as session:
+            session.merge(row)
+            session.commit()
+        with self.lock:
+            self._cache[(kind, name)] = data
+        if self.catalog is not None:
+            self.catalog.set_meta(kind, {name: (token, data)})
+        return data
+
+    def backfill(self, force: bool = False) -> Dict[str, int]:
+        """Analiza todo el contenido existente que no tenga metadatos al día."""
+        report = {"archivos": 0, "al_dia": 0, "analizados": 0, "errores": 0}
+        futures = []
+        for kind, directory in self.dirs.items():
+            try:
+                names = sorted(os.listdir(directory))
+            except FileNotFoundError:
+                continue
+            for name in names:
+                future = self.schedule(kind, name, force=force)
+                if future is None:
+                    continue
+                report["archivos"] += 1
+                if future.done() and not force:
+                    report["al_dia"] += 1
+                else:
+                    futures.append(future)
+
+        for future in futures:
+            data = future.result()
+            report["analizados"] += 1
+            report["errores"] += bool(data["error"])
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metadatos de ffprobe del contenido")
+    parser.add_argument("comando", choices=["backfill"])
+    parser.add_argument(
+        "--force", action="store_true", help="Reanaliza aunque ya haya metadatos"
+    )
+    parser.add_argument("--workers", type=int, default=METADATA_WORKERS)
+    args = parser.parse_args()
+
+    from services.storage.db import init_db
+
+    init_db()
+    service = MediaMetadataService(BASE_DIR, workers=args.workers)
+    service.start()
+    started = time.perf_counter()
+    report = service.backfill(force=args.force)
+    report["segundos"] = round(time.perf_counter() - started, 3)
+    service.stop()
+    print(json.dumps(report, indent=2))
+
+
+metadata = MediaMetadataService(BASE_DIR, catalog=catalog)
+
+
+if __name__ == "__main__":
+    main()
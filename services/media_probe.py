@@ -0,0 +1,178 @@
+"""
+Lectura de datos técnicos con ffprobe (duración, bitrate, resolución,
+códecs). Lo usan el gestor de conversiones, la conversión en streaming y el
+servicio de metadatos.
+
+`mp4_layout` no usa ffprobe: recorre los encabezados de las cajas de primer
+nivel de un MP4/MOV para saber si el índice (moov) va antes o después de los
+datos (mdat).
+"""
+
+import json
+import os
+import shlex
+import struct
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Comando de ffprobe (se puede reemplazar por un doble de pruebas, p. ej.
+# FFPROBE_BIN="python benchmarks/fake_ffprobe.py")
+FFPROBE_CMD = shlex.split(os.getenv("FFPROBE_BIN", "ffprobe"))
+PROBE_TIMEOUT = 30
+
+# Contenedores ISO BMFF (cajas ftyp/moov/mdat...)
+MP4_EXTS = (".mp4", ".m4v", ".mov", ".m4a")
+# Cajas de primer nivel que se revisan como máximo (free, wide, uuid...)
+MP4_MAX_BOXES = 64
+
+
+def parse_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_int(value: Optional[str]) -> Optional[int]:
+    number = parse_float(value)
+    return int(number) if number is not None else None
+
+
+def parse_rate(value: Optional[str]) -> Optional[float]:
+    """Cuadros por segundo desde una fracción de ffprobe ("30000/1001")."""
+    if not value:
+        return None
+    num, _, den = value.partition("/")
+    num, den = parse_float(num), parse_float(den or "1")
+    if not num or not den:
+        return None
+    return round(num / den, 3)
+
+
+def probe_cmd(source: str) -> List[str]:
+    """Comando de ffprobe para `probe_media` (`source` puede ser pipe:0)."""
+    return FFPROBE_CMD + [
+        "-v",
+        "error",
+        "-show_entries",
+        "format=duration,bit_rate,format_name"
+        ":stream=codec_type,codec_name,width,height,avg_frame_rate,"
+        "channels,sample_rate",
+        "-of",
+        "json",
+        source,
+    ]
+
+
+def parse_probe(output: str) -> Dict[str, Any]:
+    """Resume la salida JSON de `probe_cmd`; {} si no se puede interpretar."""
+    try:
+        data = json.loads(output)
+    except ValueError:
+        return {}
+    fmt = data.get("format") or {}
+    streams = data.get("streams") or []
+    video = next((st for st in streams if st.get("codec_type") == "video"), {})
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), {})
+    return {
+        "duracion": parse_float(fmt.get("duration")),
+        "bitrate": parse_int(fmt.get("bit_rate")),
+        "formato": fmt.get("format_name"),
+        "ancho": video.get("width"),
+        "alto": video.get("height"),
+        "fps": parse_rate(video.get("avg_frame_rate")),
+        "audio": bool(audio),
+        "codec_video": video.get("codec_name"),
+        "codec_audio": audio.get("codec_name"),
+        "canales": audio.get("channels"),
+        "sample_rate": parse_int(audio.get("sample_rate")),
+    }
+
+
+def probe_media(path: Path) -> Dict[str, Any]:
+    """
+    Datos básicos de ffprobe: duración (s), bitrate, contenedor, ancho, alto,
+    fps y códec del primer video, y si hay audio, con qué códec, canales y
+    frecuencia de muestreo. Devuelve {} si no se pueden obtener.
+    """
+    try:
+        result = subprocess.run(
+            probe_cmd(str(path)),
+            capture_output=True,
+            text=True,
+            timeout=PROBE_TIMEOUT,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return {}
+    return parse_probe(result.stdout)
+
+
+# ============================
+# 📦 DISPOSICIÓN DE MP4/MOV
+# ============================
+def box_header(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    (tipo, tamaño, largo del encabezado) de la caja ISO BMFF al inicio de
+    `data` (al menos 16 bytes si el tamaño es de 64 bits). Tamaño 0 = la caja
+    llega hasta el final del archivo. None si no parece una caja.
+    """
+    if len(data) < 8:
+        return None
+    size, kind = struct.unpack(">I4s", data[:8])
+    header = 8
+    if size == 1:
+        if len(data) < 16:
+            return None
+        size = struct.unpack(">Q", data[8:16])[0]
+        header = 16
+    if size != 0 and size < header:
+        return None
+    try:
+        kind = kind.decode("ascii")
+    except UnicodeDecodeError:
+        return None
+    if not kind.isprintable():
+        return None
+    return kind, size, header
+
+
+def mp4_layout(path: Path) -> Optional[str]:
+    """
+    Dónde está el índice (moov) de un MP4/MOV/M4A respecto de los datos:
+      - "faststart": moov antes de mdat; la reproducción progresiva arranca
+        con los primeros bytes.
+      - "moov_al_final": moov después de mdat; el reproductor tiene que pedir
+        el final del archivo antes de mostrar el primer cuadro.
+      - "fragmentado": MP4 fragmentado (moof), ya transmisible.
+    None si el archivo no es ISO BMFF o está incompleto. Solo lee los
+    encabezados de las cajas de primer nivel.
+    """
+    seen: List[str] = []
+    try:
+        with open(path, "rb") as f:
+            total = os.fstat(f.fileno()).st_size
+            offset = 0
+            while offset < total and len(seen) < MP4_MAX_BOXES:
+                f.seek(offset)
+                header = box_header(f.read(16))
+                if header is None:
+                    return None
+                kind, size, _ = header
+                seen.append(kind)
+                if kind == "moof" or ("moov" in seen and "mdat" in seen):
+                    break
+                if size == 0:
+                    break
+                offset += size
+    except OSError:
+        return None
+
+    if "moof" in seen:
+        return "fragmentado"
+    if "moov" not in seen:
+        return None
+    if "mdat" in seen and seen.index("mdat") < seen.index("moov"):
+        return "moov_al_final"
+    return "faststart"
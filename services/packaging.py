@@ -0,0 +1,120 @@
+"""
+Empaquetado HLS de videos en una escalera de calidades (adaptive bitrate).
+
+Una sola ejecución de ffmpeg decodifica el original una vez y genera todas
+las variantes: cada video escalado con su propia lista de reproducción, una
+pista solo de audio compartida (grupo `aud`) y la lista maestra. Los
+keyframes se fuerzan cada `HLS_SEGMENT_SECONDS` en todas las variantes, así
+que los segmentos quedan alineados y el reproductor puede cambiar de calidad
+en cualquier corte.
+"""
+
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "6"))
+HLS_AUDIO_BITRATE = "128k"
+
+# (nombre, alto en píxeles, bitrate de video)
+HLS_LADDER: List[Tuple[str, int, str]] = [
+    ("1080p", 1080, "5000k"),
+    ("720p", 720, "2800k"),
+    ("480p", 480, "1400k"),
+]
+
+HLS_MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+}
+# mimetypes asocia .ts a traducciones de Qt; stream_file usa guess_type
+for _ext, _media_type in HLS_MEDIA_TYPES.items():
+    mimetypes.add_type(_media_type, _ext)
+
+_URI_ATTR_RE = re.compile(r'URI="([^"]+)"')
+
+
+def select_renditions(height: Optional[int]) -> List[Tuple[str, int, str]]:
+    """Variantes que no superan el alto del original (al menos la menor)."""
+    if not height:
+        return list(HLS_LADDER)
+    renditions = [r for r in HLS_LADDER if r[1] <= height]
+    return renditions or [HLS_LADDER[-1]]
+
+
+def hls_args(out_dir: Path, media: Dict[str, Any]) -> List[str]:
+    """Argumentos de salida de ffmpeg para empaquetar en `out_dir`."""
+    renditions = select_renditions(media.get("alto"))
+    # Sin datos de ffprobe no se asume audio: mapear una pista inexistente
+    # haría fallar todas las variantes
+    has_audio = media.get("audio", False)
+
+    split = "".join(f"[v{i}]" for i in range(len(renditions)))
+    scales = ";".join(
+        f"[v{i}]scale=-2:{height}[v{i}o]" for i, (_, height, _) in enumerate(renditions)
+    )
+    args = ["-filter_complex", f"[0:v]split={len(renditions)}{split};{scales}"]
+
+    stream_map = []
+    for i, (name, _, bitrate) in enumerate(renditions):
+        bufsize = f"{int(bitrate[:-1]) * 2}k"
+        args += [
+            "-map",
+            f"[v{i}o]",
+            f"-c:v:{i}",
+            "libx264",
+            f"-b:v:{i}",
+            bitrate,
+            f"-maxrate:v:{i}",
+            bitrate,
+            f"-bufsize:v:{i}",
+            bufsize,
+        ]
+        group = ",agroup:aud" if has_audio else ""
+        stream_map.append(f"v:{i}{group},name:{name}")
+    if has_audio:
+        args += ["-map", "0:a:0", "-c:a", "aac", "-b:a", HLS_AUDIO_BITRATE, "-ac", "2"]
+        stream_map.append("a:0,agroup:aud,name:audio,default:yes")
+
+    args += [
+        "-preset",
+        "veryfast",
+        "-sc_threshold",
+        "0",
+        "-force_key_frames",
+        f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+        "-f",
+        "hls",
+        "-hls_time",
+        str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type",
+        "vod",
+        "-hls_flags",
+        "independent_segments",
+        "-hls_segment_filename",
+        str(out_dir / "%v" / "seg_%05d.ts"),
+        "-master_pl_name",
+        "master.m3u8",
+        "-var_stream_map",
+        " ".join(stream_map),
+        str(out_dir / "%v" / "index.m3u8"),
+    ]
+    return args
+
+
+def rewrite_master(text: str, prefix: str) -> str:
+    """
+    Antepone `prefix` a las URIs relativas de la lista maestra, para que las
+    variantes y segmentos se pidan bajo una ruta versionada (cacheable como
+    inmutable) aunque la maestra se sirva en una URL fija.
+    """
+    lines = []
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            line = prefix + line
+        elif line.startswith("#EXT-X-MEDIA"):
+            line = _URI_ATTR_RE.sub(lambda m: f'URI="{prefix}{m.group(1)}"', line)
+        lines.append(line)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,25 @@
+import fcntl
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+# Carpeta que contiene content/ (por defecto, la raíz del proyecto). Se puede
+# apuntar a otro árbol de medios, p. ej. el sintético de benchmarks/suite.py
+BASE_DIR = Path(
+    os.getenv("MEDIA_BASE_DIR") or Path(__file__).resolve().parent.parent
+).resolve()
+
+
+@contextmanager
+def replace_lock(path: Path):
+    """
+    Exclusión mutua, entre hilos y entre procesos (workers de uvicorn), para
+    reemplazar `path` con `os.replace`: flock sobre su carpeta. Se toma solo
+    alrededor del rename y de las comprobaciones que lo deciden.
+    """
+    fd = os.open(Path(path).parent, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
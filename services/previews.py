@@ -0,0 +1,181 @@
+"""
+Póster y vista previa para la barra de búsqueda (sprite + WebVTT) de videos.
+
+Se generan la primera vez que se piden y se guardan en
+content/converted/previews con una clave derivada de (archivo, tamaño,
+mtime): mientras el video no cambie, cada pedido es un JPEG del disco. ffmpeg
+decodifica solo keyframes (`-skip_frame nokey`), así que generar una hoja de
+cien miniaturas cuesta una fracción de decodificar el video completo. Los
+pedidos simultáneos de la misma vista previa esperan a una sola ejecución.
+"""
+
+import math
+import mimetypes
+import os
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from services.derived_cache import DerivedCache
+from services.http_cache import version_token
+from services.media_metadata import metadata
+from services.media_probe import probe_media
+from services.paths import BASE_DIR
+
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+POSTER_WIDTH = 640
+# Una miniatura cada SPRITE_INTERVAL segundos, como máximo SPRITE_MAX_TILES
+# (en videos largos el intervalo crece) en una sola hoja de SPRITE_COLUMNS
+SPRITE_INTERVAL = float(os.getenv("SPRITE_INTERVAL", "10"))
+SPRITE_MAX_TILES = 100
+SPRITE_COLUMNS = 10
+SPRITE_TILE_WIDTH = 160
+# Solo keyframes: mucho más barato que decodificar el video completo
+SKIP_NON_KEY = ["-skip_frame", "nokey"]
+
+mimetypes.add_type("text/vtt", ".vtt")
+
+
+class PreviewError(Exception):
+    """ffmpeg no pudo generar la vista previa."""
+
+
+class PreviewGenerator(DerivedCache):
+    error_class = PreviewError
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        workers: int = PREVIEW_WORKERS,
+        prober: Callable[[Path], Dict[str, Any]] = probe_media,
+    ):
+        super().__init__(cache_dir, workers, "preview")
+        self.prober = prober
+
+    # ============================
+    # 🖼️ RESULTADOS
+    # ============================
+    def poster(self, path: Path) -> Path:
+        """JPEG del póster del video (lo genera si hace falta)."""
+        return self.schedule_poster(path).result()
+
+    def seek_preview(self, path: Path) -> Tuple[Path, Path]:
+        """(WebVTT, hoja de miniaturas) de la barra de búsqueda."""
+        return self.schedule_seek_preview(path).result()
+
+    def schedule_poster(self, path: Path) -> Future:
+        """Como `poster`, pero devuelve un Future sin esperar a ffmpeg."""
+        st = self._stat(path)
+        prefix = self._prefix(path, st)
+        target = self.cache_dir / f"{prefix}-poster.jpg"
+        return self._schedule(
+            path,
+            prefix,
+            "poster",
+            target.exists,
+            lambda: self._build_poster(path, target),
+            target,
+        )
+
+    def schedule_seek_preview(self, path: Path) -> Future:
+        """Como `seek_preview`, pero devuelve un Future sin esperar a ffmpeg."""
+        st = self._stat(path)
+        prefix = self._prefix(path, st)
+        vtt = self.cache_dir / f"{prefix}-preview.vtt"
+        sprite = self.cache_dir / f"{prefix}-sprite.jpg"
+        # El WebVTT se escribe después de la hoja: si existe, están los dos
+        return self._schedule(
+            path,
+            prefix,
+            "preview",
+            vtt.exists,
+            lambda: self._build_sprite(path, version_token(st), sprite, vtt),
+            (vtt, sprite),
+        )
+
+    # ============================
+    # 🎞️ GENERACIÓN CON FFMPEG
+    # ============================
+    def _build_poster(self, path: Path, target: Path):
+        duration = self.prober(path).get("duracion") or 0
+        # Cerca del inicio pero pasando intros y fundidos a negro; -ss antes
+        # de -i salta al keyframe previo sin decodificar lo anterior
+        seek = min(duration * 0.1, 30)
+        self._run_ffmpeg(
+            SKIP_NON_KEY + ["-ss", f"{seek:.3f}", "-i", str(path)],
+            ["-frames:v", "1", "-vf", f"scale={POSTER_WIDTH}:-2", "-q:v", "3"],
+            target,
+        )
+
+    def _build_sprite(self, path: Path, token: str, sprite: Path, vtt: Path):
+        media = self.prober(path)
+        duration = media.get("duracion") or SPRITE_INTERVAL
+        interval = max(SPRITE_INTERVAL, duration / SPRITE_MAX_TILES)
+        tiles = max(1, math.ceil(duration / interval))
+        rows = math.ceil(tiles / SPRITE_COLUMNS)
+        width = SPRITE_TILE_WIDTH
+        height = _tile_height(media.get("ancho"), media.get("alto"), width)
+
+        # fps=1/intervalo sobre solo keyframes: cada miniatura es el keyframe
+        # más cercano anterior a su instante
+        vf = (
+            f"fps=1/{interval:.3f},scale={width}:{height},"
+            f"tile={SPRITE_COLUMNS}x{rows}"
+        )
+        self._run_ffmpeg(
+            SKIP_NON_KEY + ["-i", str(path)],
+            ["-an", "-sn", "-vf", vf, "-frames:v", "1", "-q:v", "5"],
+            sprite,
+        )
+
+        tmp = self._temp_path(vtt)
+        tmp.write_text(
+            sprite_vtt(
+                f"sprite.jpg?v={token}", duration, interval, tiles, width, height
+            ),
+            encoding="utf-8",
+        )
+        os.replace(tmp, vtt)
+
+
+def _tile_height(ancho: Optional[int], alto: Optional[int], width: int) -> int:
+    if not ancho or not alto:
+        return width * 9 // 16 // 2 * 2
+    return max(2, round(width * alto / ancho / 2) * 2)
+
+
+def _vtt_time(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def sprite_vtt(
+    sprite_url: str,
+    duration: float,
+    interval: float,
+    tiles: int,
+    width: int,
+    height: int,
+) -> str:
+    """WebVTT con un cue por miniatura que apunta a su recuadro (#xywh)."""
+    lines = ["WEBVTT", ""]
+    for i in range(tiles):
+        start = i * interval
+        end = min((i + 1) * interval, duration)
+        x = (i % SPRITE_COLUMNS) * width
+        y = (i // SPRITE_COLUMNS) * height
+        lines += [
+            f"{_vtt_time(start)} --> {_vtt_time(end)}",
+            f"{sprite_url}#xywh={x},{y},{width},{height}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+previews = PreviewGenerator(
+    BASE_DIR / "content" / "converted" / "previews",
+    prober=metadata.probe_path,
+)
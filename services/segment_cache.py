@@ -0,0 +1,206 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+BLOCK_SIZE = 1024 * 256  # 256KB - mismo tamaño que las ventanas de streaming
+HEADER_BYTES = 1024 * 1024 * 2  # ftyp/moov suelen estar en los primeros MB
+
+# (ruta, mtime_ns, tamaño, índice de bloque)
+BlockKey = Tuple[str, int, int, int]
+
+
+class SegmentCache:
+    """
+    Caché en memoria de bloques calientes de archivos multimedia.
+
+    Los bloques se indexan por (ruta, mtime, tamaño, bloque), así que una
+    versión nueva de un archivo nunca devuelve datos viejos. La expulsión es
+    LRU con admisión por frecuencia (LFU): un bloque solo entra si es parte del
+    encabezado del archivo o si se pidió al menos `admit_after` veces, y nunca
+    desplaza a un bloque que se pide más seguido que él.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        block_size: int = BLOCK_SIZE,
+        header_bytes: int = HEADER_BYTES,
+        admit_after: int = 2,
+        max_tracked: int = 65536,
+    ):
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.header_bytes = header_bytes
+        self.admit_after = admit_after
+        self.max_tracked = max_tracked
+
+        self._blocks: "OrderedDict[BlockKey, bytes]" = OrderedDict()
+        self._by_path: Dict[str, Set[BlockKey]] = {}
+        self._popularity: "OrderedDict[BlockKey, int]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.warmed = 0
+
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._warmer: Optional[threading.Thread] = None
+
+    # ============================
+    # 🔍 LECTURA / ESCRITURA
+    # ============================
+    def get(self, key: BlockKey) -> Optional[bytes]:
+        """Devuelve el bloque si está en caché y registra su popularidad."""
+        with self.lock:
+            self._touch_popularity(key)
+            block = self._blocks.get(key)
+            if block is None:
+                self.misses += 1
+                return None
+            self._blocks.move_to_end(key)
+            self.hits += 1
+            return block
+
+    def should_admit(self, key: BlockKey) -> bool:
+        """Indica si vale la pena copiar el bloque completo para guardarlo."""
+        if self.max_bytes <= 0:
+            return False
+        if key[3] * self.block_size < self.header_bytes:
+            return True
+        with self.lock:
+            return self._popularity.get(key, 0) >= self.admit_after
+
+    def put(self, key: BlockKey, block: bytes) -> bool:
+        """Guarda un bloque, expulsando los menos recientes si hace falta."""
+        size = len(block)
+        if size > self.max_bytes:
+            return False
+
+        with self.lock:
+            if key in self._blocks:
+                self._blocks.move_to_end(key)
+                return True
+
+            frequency = self._popularity.get(key, 0)
+            is_header = key[3] * self.block_size < self.header_bytes
+            # Primero se eligen todas las víctimas (en orden LRU) y solo se
+            # expulsan si el bloque entra: un rechazo no vacía la caché
+            victims = []
+            freed = 0
+            for victim, data in self._blocks.items():
+                if self._size - freed + size <= self.max_bytes:
+                    break
+                if not is_header and self._popularity.get(victim, 0) > frequency:
+                    return False
+                victims.append(victim)
+                freed += len(data)
+            for victim in victims:
+                self._remove(victim)
+            self.evictions += len(victims)
+
+            self._blocks[key] = block
+            self._by_path.setdefault(key[0], set()).add(key)
+            self._size += size
+            return True
+
+    def invalidate(self, path: str):
+        """Descarta todos los bloques y la popularidad de un archivo."""
+        path = os.path.abspath(path)
+        with self.lock:
+            for key in list(self._by_path.get(path, ())):
+                self._remove(key)
+            for key in [k for k in self._popularity if k[0] == path]:
+                del self._popularity[key]
+
+    def _remove(self, key: BlockKey):
+        block = self._blocks.pop(key)
+        self._size -= len(block)
+        keys = self._by_path.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_path[key[0]]
+
+    def _touch_popularity(self, key: BlockKey):
+        self._popularity[key] = self._popularity.pop(key, 0) + 1
+        if len(self._popularity) > self.max_tracked:
+            self._popularity.popitem(last=False)
+
+    # ============================
+    # 🔥 PRECALENTAMIENTO
+    # ============================
+    def warm(self, limit: int = 64) -> int:
+        """
+        Carga desde disco los bloques más pedidos que no están en caché
+        (por ejemplo, tras haber sido expulsados). Devuelve cuántos cargó.
+        """
+        with self.lock:
+            candidates = sorted(
+                (
+                    (count, key)
+                    for key, count in self._popularity.items()
+                    if count >= self.admit_after and key not in self._blocks
+                ),
+                reverse=True,
+            )[:limit]
+
+        loaded = 0
+        for _, key in candidates:
+            path, mtime_ns, size, index = key
+            try:
+                with open(path, "rb") as f:
+                    st = os.fstat(f.fileno())
+                    if (st.st_mtime_ns, st.st_size) != (mtime_ns, size):
+                        continue
+                    block = os.pread(
+                        f.fileno(), self.block_size, index * self.block_size
+                    )
+            except OSError:
+                continue
+            if block and self.put(key, block):
+                loaded += 1
+
+        with self.lock:
+            self.warmed += loaded
+        return loaded
+
+    def start(self, interval: float = 30.0):
+        """Inicia un hilo que precalienta la caché cada `interval` segundos."""
+        if self._warmer is not None or self.max_bytes <= 0:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.warm()
+
+        self._warmer = threading.Thread(target=loop, daemon=True)
+        self._warmer.start()
+
+    def stop(self):
+        self._stop.set()
+        self._warmer = None
+
+    # ============================
+    # 📊 ESTADÍSTICAS
+    # ============================
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "warmed": self.warmed,
+                "blocks": len(self._blocks),
+                "used_MB": round(self._size / (1024 * 1024), 2),
+                "budget_MB": round(self.max_bytes / (1024 * 1024), 2),
+            }
+
+
+segment_cache = SegmentCache(
+    max_bytes=int(os.getenv("SEGMENT_CACHE_MB", "256")) * 1024 * 1024
+)
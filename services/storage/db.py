@@ -1,14 +1,144 @@
-from sqlmodel import SQLModel, create_engine, Session
+"""
+Motores y sesiones de la base de datos.
+
+`make_engine` arma el motor según la URL:
+  - SQLite: modo WAL (los lectores no esperan a los escritores y los commits
+    no reescriben el archivo principal), `synchronous=NORMAL` (seguro con WAL),
+    caché de páginas más grande y `busy_timeout`, para que dos escritores
+    simultáneos esperen su turno en vez de fallar con "database is locked".
+  - Postgres y el resto: un pool de conexiones de verdad, con tamaño,
+    desborde, verificación previa y reciclaje configurables por entorno.
+
+`get_session` sigue siendo la dependencia síncrona de siempre.
+`get_async_session` ofrece lo mismo para endpoints `async def`; necesita el
+driver asíncrono del motor (aiosqlite o asyncpg), que solo se importa cuando
+se usa.
+"""
+
 import os
 
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlmodel import SQLModel, Session, create_engine
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}
-    if DATABASE_URL.startswith("sqlite")
-    else {},
-)
+# SQLite
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))
+# Pool (Postgres, MySQL...)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Driver asíncrono por dialecto
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def _is_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite"
+
+
+def _is_memory(url) -> bool:
+    return url.database in (None, "", ":memory:")
+
+
+def _sqlite_pragmas(dbapi_connection, memory: bool):
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL no aplica a bases en memoria
+        if not memory:
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        # Negativo = tamaño en KiB en vez de páginas
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA foreign_keys=ON")
+    finally:
+        cursor.close()
+
+
+def _engine_options(url) -> dict:
+    pool = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    if _is_sqlite(url):
+        connect_args = {
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }
+        # En memoria cada conexión sería otra base: ahí queda el pool de
+        # SQLAlchemy por defecto
+        if _is_memory(url):
+            return {"connect_args": connect_args}
+        return {"connect_args": connect_args, **pool}
+    return {
+        **pool,
+        "pool_recycle": DB_POOL_RECYCLE,
+        # Descarta conexiones que el servidor cerró (reinicios, timeouts)
+        "pool_pre_ping": True,
+    }
+
+
+def make_engine(database_url: str = DATABASE_URL, **overrides) -> Engine:
+    """Motor síncrono con los pragmas o el pool que corresponden a la URL."""
+    url = make_url(database_url)
+    engine = create_engine(url, **{**_engine_options(url), **overrides})
+    if _is_sqlite(url):
+        memory = _is_memory(url)
+
+        @event.listens_for(engine, "connect")
+        def _on_connect(dbapi_connection, _record):
+            _sqlite_pragmas(dbapi_connection, memory)
+
+    return engine
+
+
+def make_async_engine(database_url: str = DATABASE_URL, **overrides):
+    """
+    Motor asíncrono para la misma URL, cambiando el driver por el asíncrono
+    (sqlite -> sqlite+aiosqlite, postgresql -> postgresql+asyncpg).
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if url.get_driver_name() != ASYNC_DRIVERS.get(backend):
+        if backend not in ASYNC_DRIVERS:
+            raise ValueError(f"No hay driver asíncrono configurado para {backend}")
+        url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+    options = _engine_options(url)
+    if _is_sqlite(url):
+        # aiosqlite corre cada conexión en su propio hilo
+        options["connect_args"].pop("check_same_thread")
+    engine = create_async_engine(url, **{**options, **overrides})
+    if _is_sqlite(url):
+        memory = _is_memory(url)
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def _on_connect(dbapi_connection, _record):
+            _sqlite_pragmas(dbapi_connection, memory)
+
+    return engine
+
+
+engine = make_engine()
+_async_engine = None
+
+
+def get_async_engine():
+    """Motor asíncrono compartido, creado en el primer uso."""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = make_async_engine()
+    return _async_engine
 
 
 def init_db():
@@ -18,3 +148,19 @@ def init_db():
 def get_session():
     with Session(engine) as session:
         yield session
+
+
+async def get_async_session():
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    # expire_on_commit=False: los objetos siguen legibles después del commit
+    # sin otra ida a la base (en async no hay carga perezosa implícita)
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+
+async def dispose_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
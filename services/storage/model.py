@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from typing import Optional
 from pydantic import BaseModel, EmailStr
 
@@ -13,3 +14,61 @@ class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     email: str = Field(index=True, unique=True)
     password: str
+
+
+class ConversionTask(SQLModel, table=True):
+    __tablename__ = "conversion_task"
+    __table_args__ = (Index("ix_conversion_task_estado_creado", "estado", "creado"),)
+    id: str = Field(primary_key=True)
+    tipo: str
+    archivo: str
+    formato: str
+    estado: str = Field(index=True)
+    output: Optional[str] = None
+    error: Optional[str] = None
+    propietario: str = Field(default="unknown", index=True)
+    prioridad: int = 1
+    creado: float = Field(index=True)
+    finalizado: Optional[float] = None
+    input_path: str
+    output_path: str
+    cache_key: Optional[str] = Field(default=None, index=True)
+    cache: Optional[str] = None
+    duracion: Optional[float] = None
+    progreso: Optional[float] = None
+    entrada_temporal: bool = False
+    perfil: Optional[str] = None
+    preset: Optional[str] = None
+    modo: Optional[str] = None
+    # Lote de conversiones por el que se creó (POST /convert/batch)
+    lote: Optional[str] = Field(default=None, index=True)
+
+
+class MediaFile(SQLModel, table=True):
+    __tablename__ = "media_file"
+    filename: str = Field(primary_key=True)
+    owner: str = Field(default="unknown", index=True)
+    actualizado: float
+
+
+class MediaMetadata(SQLModel, table=True):
+    __tablename__ = "media_metadata"
+    tipo: str = Field(primary_key=True)
+    nombre: str = Field(primary_key=True)
+    # version_token del archivo analizado (inodo, tamaño y mtime)
+    token: str
+    size: int
+    duracion: Optional[float] = None
+    bitrate: Optional[int] = None
+    formato: Optional[str] = None
+    ancho: Optional[int] = None
+    alto: Optional[int] = None
+    fps: Optional[float] = None
+    codec_video: Optional[str] = None
+    codec_audio: Optional[str] = None
+    canales: Optional[int] = None
+    sample_rate: Optional[int] = None
+    # MP4/MOV: "faststart", "moov_al_final" o "fragmentado" (ver mp4_layout)
+    disposicion: Optional[str] = None
+    error: Optional[str] = None
+    analizado: float
@@ -0,0 +1,348 @@
+import mimetypes
+import os
+import secrets
+import stat
+from functools import partial
+from typing import BinaryIO, List, Mapping, Optional
+
+import anyio
+from fastapi import HTTPException, Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from services.http_range import (
+    ByteRange,
+    RangeNotSatisfiable,
+    if_range_matches,
+    parse_range_header,
+)
+from services.http_cache import (
+    file_etag,
+    is_not_modified,
+    not_modified,
+    validator_headers,
+    version_token,
+)
+from services.segment_cache import BLOCK_SIZE, segment_cache
+
+CHUNK_SIZE = BLOCK_SIZE  # 256KB - Óptimo para streaming progresivo
+
+# Extensión ASGI para que el servidor envíe el archivo con os.sendfile.
+# uvicorn (el servidor con el que se despliega) no la implementa: bajo
+# uvicorn este camino nunca se usa y no hay envío sin copia
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class RangeFileResponse(Response):
+    """
+    Respuesta que envía uno o varios rangos de bytes de un archivo.
+
+    Los bloques de `CHUNK_SIZE` bytes se leen con `os.pread` en un hilo, para
+    que un fallo de página o un disco lento no detenga el event loop y al resto
+    de las conexiones; los bloques calientes (encabezados y zonas de seek
+    populares) se sirven desde `segment_cache` sin salir del event loop. Cada
+    bloque pasa por memoria del proceso: con uvicorn no hay envío sin copia.
+
+    Solo si el servidor ASGI anuncia la extensión `http.response.zerocopysend`
+    (uvicorn no lo hace) se le entrega el descriptor del archivo para que haga
+    `os.sendfile` directamente al socket.
+
+    `file` es el archivo ya abierto sobre el que se calcularon los encabezados
+    (ver `stream_file`): aunque el archivo se reemplace, se envían exactamente
+    los bytes anunciados en Content-Length. La respuesta lo cierra al
+    terminar. Sin `file`, se abre `path` al enviar.
+
+    Con más de un rango el cuerpo es `multipart/byteranges`: `parts` contiene,
+    para cada rango, los bytes de delimitador y encabezados que lo preceden, y
+    `epilogue` el delimitador final.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ranges: List[ByteRange],
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        parts: Optional[List[bytes]] = None,
+        epilogue: bytes = b"",
+        file: Optional[BinaryIO] = None,
+    ):
+        self.path = path
+        self.file = file
+        self.ranges = ranges
+        self.parts = parts or [b""] * len(ranges)
+        self.epilogue = epilogue
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        f = self.file or open(self.path, "rb")
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+
+            if scope.get("method") == "HEAD" or not self.ranges:
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            async with anyio.create_task_group() as task_group:
+
+                async def wrap(func):
+                    await func()
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(wrap, partial(self._stream, f, scope, send))
+                await wrap(partial(self._listen_for_disconnect, receive))
+        finally:
+            f.close()
+
+    async def _listen_for_disconnect(self, receive: Receive) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+
+    async def _stream(self, f: BinaryIO, scope: Scope, send: Send) -> None:
+        if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            await self._send_all(send, partial(self._send_zerocopy, f))
+            return
+        # La versión se toma del descriptor abierto: si el archivo se
+        # reemplazó después del stat, la caché no mezcla versiones
+        fd = f.fileno()
+        st = os.fstat(fd)
+        version = (os.path.abspath(self.path), st.st_mtime_ns, st.st_size)
+        if hasattr(os, "posix_fadvise"):
+            # Lectura anticipada más agresiva del kernel
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        await self._send_all(send, partial(self._send_blocks, fd, version))
+
+    async def _send_all(self, send: Send, send_range) -> None:
+        last = len(self.ranges) - 1
+        for i, ((start, end), part) in enumerate(zip(self.ranges, self.parts)):
+            if part:
+                await send(
+                    {"type": "http.response.body", "body": part, "more_body": True}
+                )
+            await send_range(send, start, end, i < last or bool(self.epilogue))
+        if self.epilogue:
+            await send({"type": "http.response.body", "body": self.epilogue})
+
+    async def _send_zerocopy(self, f, send: Send, start: int, end: int, more: bool):
+        await send(
+            {
+                "type": ZEROCOPY_EXTENSION,
+                "file": f,
+                "offset": start,
+                "count": end - start + 1,
+                "more_body": more,
+            }
+        )
+
+    async def _send_blocks(
+        self, fd: int, version, send: Send, start: int, end: int, more: bool
+    ):
+        stop = end + 1
+        position = start
+        while position < stop:
+            # Ventanas alineadas a bloques para poder reutilizar la caché
+            block_start = position - position % BLOCK_SIZE
+            chunk_end = min(block_start + BLOCK_SIZE, stop)
+            body = _cached_block(version, block_start, position, chunk_end)
+            if body is None:
+                body = await anyio.to_thread.run_sync(
+                    _read_block, fd, version, block_start, position, chunk_end
+                )
+            if not body:
+                # El descriptor no puede achicarse salvo que alguien trunque
+                # el archivo en el lugar; no hay forma de completar el cuerpo
+                raise OSError(f"{self.path} terminó antes de lo anunciado")
+
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": body,
+                    "more_body": more or position + len(body) < stop,
+                }
+            )
+            position += len(body)
+
+
+def _cached_block(version, block_start: int, start: int, end: int) -> Optional[bytes]:
+    """[start, end) de un bloque si está en la caché de segmentos."""
+    block = segment_cache.get(version + (block_start // BLOCK_SIZE,))
+    if block is None:
+        return None
+    if start == block_start and end == block_start + len(block):
+        return block
+    return block[start - block_start : end - block_start]
+
+
+def _read_block(fd: int, version, block_start: int, start: int, end: int) -> bytes:
+    """Lee [start, end) del archivo (en un hilo), guardando el bloque en caché."""
+    key = version + (block_start // BLOCK_SIZE,)
+    if not segment_cache.should_admit(key):
+        return os.pread(fd, end - start, start)
+    block = os.pread(fd, BLOCK_SIZE, block_start)
+    segment_cache.put(key, block)
+    return block[start - block_start : end - block_start]
+
+
+def stream_file(
+    request: Request,
+    file_path: str,
+    default_media_type: str,
+    extra_headers: Optional[Mapping[str, str]] = None,
+) -> Response:
+    """
+    Construye la respuesta 200/206/304 para un archivo multimedia según los
+    encabezados Range, If-Range e If-None-Match/If-Modified-Since de la
+    petición. Lanza 404 si el archivo no existe y 416 si ningún rango es
+    satisfacible.
+    """
+    # Abrir una sola vez y tomar los datos del descriptor: los encabezados
+    # (Content-Length, ETag) y el cuerpo salen de la misma versión del archivo
+    # aunque otra subida lo reemplace en el medio
+    try:
+        f = open(file_path, "rb")
+    except OSError:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    try:
+        response = _file_response(
+            request, f, file_path, default_media_type, extra_headers
+        )
+    except BaseException:
+        f.close()
+        raise
+    if not isinstance(response, RangeFileResponse):
+        f.close()
+    return response
+
+
+def _file_response(
+    request: Request,
+    f: BinaryIO,
+    file_path: str,
+    default_media_type: str,
+    extra_headers: Optional[Mapping[str, str]],
+) -> Response:
+    st = os.fstat(f.fileno())
+    if not stat.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    file_size = st.st_size
+    media_type, _ = mimetypes.guess_type(file_path)
+    media_type = media_type or default_media_type
+    headers = request.headers if request else {}
+    range_header = headers.get("range")
+
+    # Validadores: la URL versionada (?v=) que coincide con el archivo actual
+    # se puede cachear como inmutable
+    etag = file_etag(st)
+    immutable = request is not None and request.query_params.get("v") == (
+        version_token(st)
+    )
+    base_headers = validator_headers(etag, st.st_mtime, immutable)
+    base_headers["Accept-Ranges"] = "bytes"
+    if extra_headers:
+        base_headers.update(extra_headers)
+
+    if is_not_modified(headers, etag, st.st_mtime):
+        return not_modified(base_headers)
+
+    ranges = None
+    if range_header and if_range_matches(
+        headers.get("if-range"), etag=etag, last_modified=st.st_mtime
+    ):
+        try:
+            ranges = parse_range_header(range_header, file_size)
+        except RangeNotSatisfiable:
+            raise HTTPException(
+                status_code=416,
+                detail="Rango solicitado fuera de límites",
+                headers={"Content-Range": f"bytes */{file_size}"},
+            )
+
+    if ranges and len(ranges) == 1:
+        start, end = ranges[0]
+        headers = {
+            **base_headers,
+            "Content-Range": f"bytes {start}-{end}/{file_size}",
+            "Content-Length": str(end - start + 1),
+            "Connection": "keep-alive",
+        }
+        return RangeFileResponse(
+            file_path,
+            ranges,
+            status_code=206,
+            headers=headers,
+            media_type=media_type,
+            file=f,
+        )
+
+    if ranges:
+        return _multipart_response(
+            f, file_path, ranges, file_size, media_type, base_headers
+        )
+
+    # Respuesta completa (sin Range) - Primera solicitud
+    headers = {**base_headers, "Content-Length": str(file_size)}
+    return RangeFileResponse(
+        file_path,
+        [(0, file_size - 1)] if file_size else [],
+        status_code=200,
+        headers=headers,
+        media_type=media_type,
+        file=f,
+    )
+
+
+def _multipart_response(
+    f: BinaryIO,
+    file_path: str,
+    ranges: List[ByteRange],
+    file_size: int,
+    media_type: str,
+    base_headers: Mapping[str, str],
+) -> RangeFileResponse:
+    boundary = secrets.token_hex(16)
+    parts = []
+    for i, (start, end) in enumerate(ranges):
+        # Cada parte va precedida por CRLF + delimitador, salvo la primera
+        delimiter = f"--{boundary}" if i == 0 else f"\r\n--{boundary}"
+        parts.append(
+            (
+                f"{delimiter}\r\n"
+                f"Content-Type: {media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+            ).encode("latin-1")
+        )
+    epilogue = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    content_length = (
+        sum(len(p) for p in parts)
+        + sum(end - start + 1 for start, end in ranges)
+        + len(epilogue)
+    )
+
+    headers = {
+        **base_headers,
+        "Content-Length": str(content_length),
+        "Connection": "keep-alive",
+    }
+    return RangeFileResponse(
+        file_path,
+        ranges,
+        status_code=206,
+        headers=headers,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        parts=parts,
+        epilogue=epilogue,
+        file=f,
+    )
@@ -0,0 +1,170 @@
+"""
+Muestreo periódico de métricas del sistema para el dashboard.
+
+Un hilo toma cada `interval` segundos una muestra de CPU, memoria, disco, red
+y del propio proceso, y la guarda en un buffer circular de tamaño fijo (las
+más viejas se descartan solas). Las peticiones solo leen la última muestra o
+un tramo del buffer: ninguna bloquea esperando a psutil.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import psutil
+
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "5"))
+# Con el intervalo por defecto, 720 muestras = la última hora
+METRICS_CAPACITY = int(os.getenv("METRICS_CAPACITY", "720"))
+
+
+class MetricsSampler:
+    def __init__(
+        self,
+        interval: float = METRICS_INTERVAL,
+        capacity: int = METRICS_CAPACITY,
+        disk_path: str = "/",
+    ):
+        self.interval = interval
+        self.disk_path = disk_path
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._process = psutil.Process()
+        self._last_io: Optional[tuple] = None
+
+    # ============================
+    # 🔄 CICLO DE VIDA
+    # ============================
+    def start(self):
+        if self._thread is not None:
+            return
+        # cpu_percent(interval=None) mide desde la llamada anterior: la
+        # primera solo fija el punto de partida
+        psutil.cpu_percent(interval=None)
+        self._process.cpu_percent(interval=None)
+        self.sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except (OSError, psutil.Error):
+                continue
+
+    # ============================
+    # 📏 MUESTRAS
+    # ============================
+    def sample(self) -> Dict[str, Any]:
+        """Toma una muestra (no bloquea) y la agrega al buffer."""
+        now = time.time()
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage(self.disk_path)
+        disk_io = psutil.disk_io_counters()
+        net_io = psutil.net_io_counters()
+
+        counters = (
+            now,
+            disk_io.read_bytes if disk_io else 0,
+            disk_io.write_bytes if disk_io else 0,
+            net_io.bytes_sent if net_io else 0,
+            net_io.bytes_recv if net_io else 0,
+        )
+        rates = [0.0, 0.0, 0.0, 0.0]
+        if self._last_io is not None:
+            elapsed = now - self._last_io[0]
+            if elapsed > 0:
+                rates = [
+                    max(0, (current - previous)) / elapsed
+                    for current, previous in zip(counters[1:], self._last_io[1:])
+                ]
+        self._last_io = counters
+
+        with self._process.oneshot():
+            process = {
+                "cpu_porcentaje": self._process.cpu_percent(interval=None),
+                "memoria_MB": round(self._process.memory_info().rss / (1024**2), 2),
+                "hilos": self._process.num_threads(),
+                "archivos_abiertos": _num_fds(self._process),
+            }
+
+        sample = {
+            "timestamp": now,
+            "cpu_porcentaje": psutil.cpu_percent(interval=None),
+            "memoria_porcentaje": memory.percent,
+            "memoria_usada_MB": round(memory.used / (1024**2), 2),
+            "disco_porcentaje": disk.percent,
+            "disco_usado_GB": round(disk.used / (1024**3), 2),
+            "disco_total_GB": round(disk.total / (1024**3), 2),
+            "disco_lectura_KBps": round(rates[0] / 1024, 2),
+            "disco_escritura_KBps": round(rates[1] / 1024, 2),
+            "red_envio_KBps": round(rates[2] / 1024, 2),
+            "red_recepcion_KBps": round(rates[3] / 1024, 2),
+            "proceso": process,
+        }
+        with self.lock:
+            self.samples.append(sample)
+        return sample
+
+    def latest(self) -> Dict[str, Any]:
+        """Última muestra; si todavía no hay ninguna, la toma en el momento."""
+        with self.lock:
+            if self.samples:
+                return self.samples[-1]
+        return self.sample()
+
+    def series(self, seconds: float, points: int) -> List[Dict[str, Any]]:
+        """
+        Muestras de los últimos `seconds` segundos reducidas a `points` como
+        máximo: cada punto promedia las muestras de su tramo de tiempo.
+        """
+        cutoff = time.time() - seconds
+        with self.lock:
+            window = [s for s in reversed(self.samples) if s["timestamp"] >= cutoff]
+        window.reverse()
+        if len(window) <= points:
+            return [_flatten(s) for s in window]
+
+        start = window[0]["timestamp"]
+        span = (window[-1]["timestamp"] - start) or 1
+        buckets: List[List[Dict[str, Any]]] = [[] for _ in range(points)]
+        for s in window:
+            i = min(points - 1, int((s["timestamp"] - start) / span * points))
+            buckets[i].append(_flatten(s))
+        return [_average(bucket) for bucket in buckets if bucket]
+
+
+def _num_fds(process: psutil.Process) -> Optional[int]:
+    try:
+        return process.num_fds()
+    except (AttributeError, psutil.Error):
+        # Windows no tiene num_fds
+        return None
+
+
+def _flatten(sample: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplana `proceso` en columnas `proceso_*` para la serie de tiempo."""
+    flat = {k: v for k, v in sample.items() if k != "proceso"}
+    flat.update({f"proceso_{k}": v for k, v in sample["proceso"].items()})
+    return flat
+
+
+def _average(bucket: List[Dict[str, Any]]) -> Dict[str, Any]:
+    point = {}
+    for field in bucket[0]:
+        values = [s[field] for s in bucket if s[field] is not None]
+        point[field] = round(sum(values) / len(values), 2) if values else None
+    return point
+
+
+metrics_sampler = MetricsSampler()
@@ -0,0 +1,399 @@
+"""
+Métricas internas en formato de texto de Prometheus (sin dependencias).
+
+Contadores, gauges e histogramas con etiquetas, guardados como diccionarios
+por tupla de etiquetas: registrar un valor es una búsqueda en un dict bajo un
+lock sin contención. El formato de texto solo se arma cuando se pide
+`/metrics`.
+
+`MetricsMiddleware` mide cada petición HTTP usando la plantilla de la ruta
+(`/videos/{filename}`, no el nombre de cada archivo) para que la cantidad de
+series no crezca con el contenido.
+"""
+
+import bisect
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# Esperas y duraciones de conversiones: de segundos a horas
+CONVERSION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = sorted(self.values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}"
+            for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, value: float, labels: Labels = ()):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [conteos por bucket (no acumulados) + el de +Inf, suma]
+        self.values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self.values.items())
+        lines = self.header()
+        bounds = self.buckets + (math.inf,)
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, labels, le)} "
+                    f"{cumulative}"
+                )
+            suffix = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(total)}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+# Un colector devuelve (nombre, tipo, ayuda, [(etiquetas, valor)]) al momento
+# de exportar, para valores que ya viven en otro lado (colas, cachés)
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for collector in self.collectors:
+            for name, kind, help, samples in collector():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    names, values = zip(*labels.items()) if labels else ((), ())
+                    lines.append(
+                        f"{name}{_format_labels(names, values)} {_format_value(value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ============================
+# 🎞️ CONVERSIONES
+# ============================
+conversion_wait = registry.histogram(
+    "conversion_queue_wait_seconds",
+    "Tiempo en cola hasta que un worker toma la conversión",
+    ("formato",),
+    CONVERSION_BUCKETS,
+)
+conversion_run = registry.histogram(
+    "conversion_run_seconds",
+    "Duración de la ejecución de una conversión",
+    ("formato", "estado"),
+    CONVERSION_BUCKETS,
+)
+
+UNMATCHED_ROUTE = "<sin_ruta>"
+ZEROCOPY_SEND = "http.response.zerocopysend"
+
+
+# ============================
+# 🌐 HTTP
+# ============================
+class _HttpRow:
+    __slots__ = ("count", "bytes", "latency", "latency_sum", "ttfb", "ttfb_sum")
+
+    def __init__(self, buckets: int):
+        self.count = 0
+        self.bytes = 0
+        self.latency = [0] * (buckets + 1)
+        self.latency_sum = 0.0
+        self.ttfb = [0] * (buckets + 1)
+        self.ttfb_sum = 0.0
+
+
+class HttpStats:
+    """
+    Contadores de las peticiones HTTP, una fila por (método, ruta, estado).
+
+    Solo los actualiza el middleware desde el event loop, así que no usan
+    locks: registrar una petición es una búsqueda en un dict y unos pocos
+    incrementos. Las familias `http_*` de Prometheus se derivan al exportar.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.rows: Dict[Tuple[str, str, int], _HttpRow] = {}
+        self.in_progress = 0
+        self.range_streams: Dict[str, int] = {}
+
+    def record(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        latency: float,
+        ttfb: Optional[float],
+        sent: int,
+    ):
+        key = (method, route, status)
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = _HttpRow(len(self.buckets))
+        row.count += 1
+        row.bytes += sent
+        row.latency[bisect.bisect_left(self.buckets, latency)] += 1
+        row.latency_sum += latency
+        if ttfb is not None:
+            row.ttfb[bisect.bisect_left(self.buckets, ttfb)] += 1
+            row.ttfb_sum += ttfb
+
+    def render(self) -> List[str]:
+        rows = sorted(self.rows.items())
+        requests = Counter(
+            "http_requests_total",
+            "Peticiones HTTP atendidas",
+            ("method", "route", "status"),
+        )
+        sent = Counter(
+            "http_response_bytes_total", "Bytes de cuerpo enviados", ("route",)
+        )
+        latency = Histogram(
+            "http_request_duration_seconds",
+            "Duración de las peticiones HTTP hasta el último byte",
+            ("method", "route"),
+            self.buckets,
+        )
+        ttfb = Histogram(
+            "http_time_to_first_byte_seconds",
+            "Tiempo hasta el primer byte del cuerpo de la respuesta",
+            ("method", "route"),
+            self.buckets,
+        )
+        for (method, route, status), row in rows:
+            requests.values[(method, route, str(status))] = row.count
+            sent.values[(route,)] = sent.values.get((route,), 0) + row.bytes
+            _merge(latency, (method, route), row.latency, row.latency_sum)
+            if any(row.ttfb):
+                _merge(ttfb, (method, route), row.ttfb, row.ttfb_sum)
+
+        in_progress = Gauge("http_requests_in_progress", "Peticiones en curso")
+        in_progress.values[()] = self.in_progress
+        streams = Gauge(
+            "http_range_streams_active",
+            "Respuestas 206 (rangos) enviándose",
+            ("route",),
+        )
+        streams.values.update({(r,): n for r, n in self.range_streams.items()})
+
+        lines: List[str] = []
+        for metric in (requests, latency, ttfb, sent, in_progress, streams):
+            lines += metric.render()
+        return lines
+
+
+def _merge(histogram: Histogram, labels: Labels, counts: List[int], total: float):
+    series = histogram.values.setdefault(labels, [[0] * len(counts), 0.0])
+    series[0] = [a + b for a, b in zip(series[0], counts)]
+    series[1] += total
+
+
+http_stats = registry.register(HttpStats())
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que alimenta `http_stats`."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        stats: HttpStats = http_stats,
+        exclude: Sequence[str] = ("/metrics",),
+    ):
+        self.app = app
+        self.stats = stats
+        self.exclude = frozenset(exclude)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        stats = self.stats
+        started = time.perf_counter()
+        status = 500
+        first_byte = 0.0
+        sent = 0
+        range_route = None
+
+        async def send_wrapper(message: Message):
+            nonlocal status, first_byte, sent, range_route
+            kind = message["type"]
+            if kind == "http.response.body":
+                sent += len(message.get("body", b""))
+                if not first_byte:
+                    first_byte = time.perf_counter()
+            elif kind == "http.response.start":
+                status = message["status"]
+                if status == 206:
+                    range_route = _route(scope)
+                    streams = stats.range_streams
+                    streams[range_route] = streams.get(range_route, 0) + 1
+            elif kind == ZEROCOPY_SEND:
+                count = message.get("count")
+                sent += _remaining(message["file"]) if count is None else count
+                if not first_byte:
+                    first_byte = time.perf_counter()
+            await send(message)
+
+        stats.in_progress += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finished = time.perf_counter()
+            stats.in_progress -= 1
+            if range_route is not None:
+                stats.range_streams[range_route] -= 1
+            # La plantilla de la ruta se conoce recién después del enrutamiento
+            stats.record(
+                scope["method"],
+                _route(scope),
+                status,
+                finished - started,
+                first_byte - started if first_byte else None,
+                sent,
+            )
+
+
+def _route(scope: Scope) -> str:
+    # Las versiones nuevas de FastAPI guardan en `route` la ruta del router
+    # incluido sin su prefijo; la completa queda en el contexto efectivo
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    route = context or scope.get("route")
+    return getattr(route, "path_format", None) or UNMATCHED_ROUTE
+
+
+def _remaining(f) -> int:
+    try:
+        return max(0, os.fstat(f.fileno()).st_size - f.tell())
+    except (OSError, ValueError):
+        return 0
@@ -0,0 +1,311 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from services.paths import replace_lock
+
+# Tamaño máximo de un fragmento y presupuesto de bytes en vuelo (entre todas
+# las subidas) para acotar la memoria y las escrituras simultáneas
+MAX_CHUNK_BYTES = int(os.getenv("UPLOAD_MAX_CHUNK_MB", "64")) * 1024 * 1024
+INFLIGHT_BYTES = int(os.getenv("UPLOAD_INFLIGHT_MB", "256")) * 1024 * 1024
+SESSION_TTL_SECONDS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24")) * 3600
+# Las sesiones vencidas se buscan como mucho una vez por intervalo
+PURGE_INTERVAL_SECONDS = 300
+
+
+class UploadError(Exception):
+    """Error de protocolo de una subida reanudable (se traduce a 4xx)."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class UploadSession:
+    id: str
+    filename: str
+    tipo: str
+    owner: str
+    length: int
+    # Intervalos [inicio, fin) ya escritos, ordenados y sin solaparse
+    ranges: List[List[int]] = field(default_factory=list)
+    created: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+
+    @property
+    def offset(self) -> int:
+        """Bytes contiguos confirmados desde el inicio (Upload-Offset)."""
+        if self.ranges and self.ranges[0][0] == 0:
+            return self.ranges[0][1]
+        return 0
+
+    @property
+    def received(self) -> int:
+        return sum(end - start for start, end in self.ranges)
+
+    @property
+    def complete(self) -> bool:
+        return self.offset == self.length
+
+    def add_range(self, start: int, end: int):
+        """Agrega [start, end) fusionándolo con los intervalos vecinos."""
+        i = bisect.bisect_left(self.ranges, [start, end])
+        if i > 0 and self.ranges[i - 1][1] >= start:
+            i -= 1
+        j = i
+        while j < len(self.ranges) and self.ranges[j][0] <= end:
+            start = min(start, self.ranges[j][0])
+            end = max(end, self.ranges[j][1])
+            j += 1
+        self.ranges[i:j] = [[start, end]]
+        self.updated = time.time()
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data.update(offset=self.offset, received=self.received, complete=self.complete)
+        return data
+
+
+class UploadSessionManager:
+    """
+    Subidas reanudables al estilo tus.
+
+    Cada sesión reserva un archivo `{id}.part` del tamaño final (disperso) y un
+    `{id}.json` con los intervalos ya recibidos. Los fragmentos se escriben con
+    `os.pwrite` en su posición, así que pueden llegar en paralelo y en
+    cualquier orden; un fragmento solo cuenta cuando se escribió completo, y
+    si la conexión se corta basta con reenviarlo. Las sesiones sobreviven a un
+    reinicio porque se recargan desde su `.json`.
+
+    Los métodos bloquean (disco): desde código async se llaman en el
+    threadpool.
+    """
+
+    def __init__(self, sessions_dir: Path, ttl: float = SESSION_TTL_SECONDS):
+        self.dir = sessions_dir
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._sessions: Dict[str, UploadSession] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        # Escrituras en curso por sesión, y sesiones que se están finalizando
+        # o cancelando (no aceptan escrituras nuevas)
+        self._writers: Dict[str, int] = {}
+        self._closing: Set[str] = set()
+        self._last_purge = 0.0
+        self.lock = threading.Lock()
+        self._idle = threading.Condition(self.lock)
+
+    def _part_path(self, upload_id: str) -> Path:
+        return self.dir / f"{upload_id}.part"
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.dir / f"{upload_id}.json"
+
+    def _save(self, session: UploadSession):
+        meta = self._meta_path(session.id)
+        tmp = meta.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(asdict(session)), encoding="utf-8")
+        os.replace(tmp, meta)
+
+    def _session_lock(self, upload_id: str) -> threading.Lock:
+        with self.lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    # ============================
+    # 🔄 CICLO DE VIDA
+    # ============================
+    def create(
+        self, filename: str, tipo: str, owner: str, length: int
+    ) -> UploadSession:
+        now = time.time()
+        with self.lock:
+            purge = now - self._last_purge >= PURGE_INTERVAL_SECONDS
+            if purge:
+                self._last_purge = now
+        if purge:
+            self.purge_expired()
+        session = UploadSession(
+            id=uuid.uuid4().hex,
+            filename=filename,
+            tipo=tipo,
+            owner=owner,
+            length=length,
+        )
+        with self._part_path(session.id).open("wb") as f:
+            f.truncate(length)
+        self._save(session)
+        with self.lock:
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        if not upload_id.isalnum():
+            return None
+        with self.lock:
+            session = self._sessions.get(upload_id)
+        if session is not None:
+            return session
+        # Sesión creada antes de un reinicio
+        try:
+            data = json.loads(self._meta_path(upload_id).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        session = UploadSession(**data)
+        with self.lock:
+            return self._sessions.setdefault(upload_id, session)
+
+    def write_chunk(self, upload_id: str, start: int, data: bytes) -> UploadSession:
+        """Escribe `data` en la posición `start` y lo marca como recibido."""
+        session = self.get(upload_id)
+        if session is None:
+            raise UploadError(404, "Sesión de subida no encontrada")
+        end = start + len(data)
+        if start < 0 or end > session.length:
+            raise UploadError(416, "El fragmento excede el tamaño declarado")
+
+        # Registrarse como escritor: finalize y abort esperan a que no quede
+        # ninguno antes de mover o borrar el .part, así que ningún fragmento
+        # se escribe en un archivo ya publicado
+        with self.lock:
+            closing = upload_id in self._closing
+            if closing or self._sessions.get(upload_id) is not session:
+                raise UploadError(404, "Sesión de subida no encontrada")
+            self._writers[upload_id] = self._writers.get(upload_id, 0) + 1
+        try:
+            try:
+                fd = os.open(self._part_path(upload_id), os.O_WRONLY)
+            except FileNotFoundError:
+                raise UploadError(404, "Sesión de subida no encontrada")
+            try:
+                view = memoryview(data)
+                written = 0
+                while written < len(view):
+                    written += os.pwrite(fd, view[written:], start + written)
+            finally:
+                os.close(fd)
+        finally:
+            self._release_writer(upload_id)
+
+        with self._session_lock(upload_id):
+            with self.lock:
+                if self._sessions.get(upload_id) is not session:
+                    raise UploadError(404, "Sesión de subida no encontrada")
+            session.add_range(start, end)
+            self._save(session)
+        return session
+
+    def finalize(self, upload_id: str, dest_path: Path) -> UploadSession:
+        """Mueve el archivo completo a `dest_path` con un rename atómico."""
+        session = self.get(upload_id)
+        if session is None:
+            raise UploadError(404, "Sesión de subida no encontrada")
+        with self._session_lock(upload_id):
+            if not session.complete:
+                raise UploadError(
+                    409,
+                    f"Subida incompleta: {session.received} de {session.length} bytes",
+                )
+            self._close_writers(upload_id)
+            try:
+                part = self._part_path(upload_id)
+                with part.open("rb+") as f:
+                    os.fsync(f.fileno())
+                with replace_lock(dest_path):
+                    os.replace(part, dest_path)
+                self._forget(upload_id)
+            finally:
+                with self.lock:
+                    self._closing.discard(upload_id)
+        return session
+
+    def abort(self, upload_id: str) -> bool:
+        if self.get(upload_id) is None:
+            return False
+        with self._session_lock(upload_id):
+            self._close_writers(upload_id)
+            try:
+                self._part_path(upload_id).unlink(missing_ok=True)
+                self._forget(upload_id)
+            finally:
+                with self.lock:
+                    self._closing.discard(upload_id)
+        return True
+
+    def _release_writer(self, upload_id: str):
+        with self.lock:
+            left = self._writers.get(upload_id, 1) - 1
+            if left:
+                self._writers[upload_id] = left
+            else:
+                self._writers.pop(upload_id, None)
+            self._idle.notify_all()
+
+    def _close_writers(self, upload_id: str):
+        """No acepta más escrituras en la sesión y espera a las que están en curso."""
+        with self.lock:
+            self._closing.add(upload_id)
+            self._idle.wait_for(lambda: not self._writers.get(upload_id))
+
+    def _forget(self, upload_id: str):
+        self._meta_path(upload_id).unlink(missing_ok=True)
+        with self.lock:
+            self._sessions.pop(upload_id, None)
+            self._locks.pop(upload_id, None)
+
+    def purge_expired(self) -> int:
+        """Borra las sesiones sin actividad durante más de `ttl` segundos."""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for meta in self.dir.glob("*.json"):
+            session = self.get(meta.stem)
+            if session is not None and session.updated < cutoff:
+                removed += self.abort(session.id)
+        return removed
+
+
+class ByteBudget:
+    """
+    Semáforo por bytes para el event loop: limita cuántos bytes de fragmentos
+    se están recibiendo y escribiendo a la vez. Un pedido mayor que el límite
+    igual pasa cuando no hay nada más en vuelo.
+    """
+
+    def __init__(self, limit: int = INFLIGHT_BYTES):
+        self.limit = limit
+        self.in_flight = 0
+        # La condición se crea dentro del event loop que la usa (el módulo se
+        # importa antes de que exista uno, y puede haber más de uno)
+        self._cond: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            # Los bytes en vuelo eran del loop anterior, que ya no atiende
+            self._cond = asyncio.Condition()
+            self._loop = loop
+            self.in_flight = 0
+        return self._cond
+
+    async def acquire(self, size: int):
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(
+                lambda: self.in_flight == 0 or self.in_flight + size <= self.limit
+            )
+            self.in_flight += size
+
+    async def release(self, size: int):
+        cond = self._condition()
+        async with cond:
+            self.in_flight = max(self.in_flight - size, 0)
+            cond.notify_all()
@@ -0,0 +1,184 @@
+"""
+Picos de forma de onda precalculados para los reproductores de audio.
+
+ffmpeg decodifica cada audio una sola vez a PCM mono de 16 bits
+(`WAVEFORM_SAMPLE_RATE` Hz) y NumPy calcula, bloque a bloque, el mínimo y el
+máximo de cada tramo de `LEVELS[0]` muestras. Los niveles más gruesos salen
+del anterior juntando picos de a dos, sin volver a leer el audio. Cada nivel
+se guarda en content/converted/peaks en un archivo binario propio:
+
+    encabezado (little-endian, 20 bytes)
+        4s  "WFPK"
+        H   versión del formato (1)
+        H   bits por valor (8)
+        I   frecuencia de muestreo
+        I   muestras por pico
+        I   cantidad de picos
+    datos: por cada pico, mínimo y máximo como int8
+
+La clave de los archivos sale de (archivo, tamaño, mtime), así que una
+versión nueva del audio genera picos nuevos y los de la anterior se borran.
+"""
+
+import os
+import struct
+import subprocess
+import tempfile
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from services.conversion_manager import FFMPEG_CMD
+from services.derived_cache import DerivedCache
+from services.paths import BASE_DIR
+
+WAVEFORM_WORKERS = int(os.getenv("WAVEFORM_WORKERS", "2"))
+# Para dibujar picos alcanza con poca resolución temporal
+WAVEFORM_SAMPLE_RATE = int(os.getenv("WAVEFORM_SAMPLE_RATE", "8000"))
+WAVEFORM_TIMEOUT = 600
+
+# Muestras por pico de cada nivel: 32 (250 picos/s a 8 kHz) ... 16384
+LEVELS = tuple(32 << i for i in range(10))
+PEAKS_HEADER = struct.Struct("<4sHHIII")
+PEAKS_MAGIC = b"WFPK"
+PEAKS_VERSION = 1
+# Bloques de PCM que se leen de ffmpeg por vez (múltiplo de LEVELS[0])
+READ_SAMPLES = LEVELS[0] * 8192
+
+
+class WaveformError(Exception):
+    """ffmpeg no pudo decodificar el audio."""
+
+
+def reduce_peaks(mins: np.ndarray, maxs: np.ndarray, factor: int = 2):
+    """Junta los picos de a `factor` (el último grupo puede quedar incompleto)."""
+    pad = -len(mins) % factor
+    if pad:
+        mins = np.concatenate([mins, np.repeat(mins[-1:], pad)])
+        maxs = np.concatenate([maxs, np.repeat(maxs[-1:], pad)])
+    return mins.reshape(-1, factor).min(axis=1), maxs.reshape(-1, factor).max(axis=1)
+
+
+def block_peaks(samples: np.ndarray, size: int):
+    """Mínimo y máximo de cada tramo de `size` muestras (len múltiplo de size)."""
+    blocks = samples.reshape(-1, size)
+    return blocks.min(axis=1), blocks.max(axis=1)
+
+
+def pick_level(levels: List[Path], resolution: int) -> Path:
+    """Del nivel más grueso al más fino, el primero con `resolution` picos."""
+    for level in reversed(levels):
+        count = (level.stat().st_size - PEAKS_HEADER.size) // 2
+        if count >= resolution:
+            return level
+    return levels[0]
+
+
+class WaveformService(DerivedCache):
+    error_class = WaveformError
+
+    def __init__(self, cache_dir: Path, workers: int = WAVEFORM_WORKERS):
+        super().__init__(cache_dir, workers, "peaks")
+
+    def peaks(self, path: Path, resolution: int) -> Path:
+        """
+        Archivo de picos de `path` con al menos `resolution` picos (o el más
+        detallado si el audio es corto), generándolos si hace falta. Lanza
+        FileNotFoundError si el audio no existe y WaveformError si ffmpeg
+        falla.
+        """
+        try:
+            return pick_level(self.schedule(path).result(), resolution)
+        except FileNotFoundError:
+            # Una versión nueva del audio borró los niveles: pedir los suyos
+            return pick_level(self.schedule(path).result(), resolution)
+
+    def schedule(self, path: Path) -> Future:
+        """
+        Future con los archivos de todos los niveles, del más fino al más
+        grueso (ya resuelto si estaban generados). FileNotFoundError se lanza
+        en el acto; WaveformError, desde el Future.
+        """
+        st = self._stat(path)
+        prefix = self._prefix(path, st)
+        levels = [self.cache_dir / f"{prefix}-{spp}.peaks" for spp in LEVELS]
+        return self._schedule(
+            path,
+            prefix,
+            "peaks",
+            lambda: all(level.exists() for level in levels),
+            lambda: self._write_levels(*self._decode(path), levels),
+            levels,
+        )
+
+    def _decode(self, path: Path):
+        """Picos del nivel más fino, leyendo el PCM de ffmpeg a medida que sale."""
+        cmd = FFMPEG_CMD + ["-nostdin", "-v", "error", "-i", str(path)]
+        cmd += ["-vn", "-ac", "1", "-ar", str(WAVEFORM_SAMPLE_RATE)]
+        cmd += ["-f", "s16le", "pipe:1"]
+        mins: List[np.ndarray] = []
+        maxs: List[np.ndarray] = []
+        rest = b""
+        with tempfile.TemporaryFile() as stderr_file:
+            try:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+            except OSError as e:
+                raise WaveformError(str(e))
+            try:
+                while chunk := proc.stdout.read(READ_SAMPLES * 2):
+                    data = rest + chunk
+                    # Solo tramos completos; el resto espera al próximo bloque
+                    usable = len(data) - len(data) % (LEVELS[0] * 2)
+                    rest = data[usable:]
+                    if usable:
+                        samples = np.frombuffer(data[:usable], dtype="<i2")
+                        lo, hi = block_peaks(samples, LEVELS[0])
+                        mins.append(lo)
+                        maxs.append(hi)
+                proc.wait(timeout=WAVEFORM_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                raise WaveformError("ffmpeg no terminó a tiempo")
+            finally:
+                proc.stdout.close()
+            if proc.returncode != 0:
+                stderr_file.seek(0)
+                stderr = stderr_file.read()[-500:].decode("utf-8", "replace").strip()
+                raise WaveformError(
+                    stderr or f"ffmpeg terminó con código {proc.returncode}"
+                )
+
+        # Último tramo incompleto (se descarta un byte suelto)
+        samples = np.frombuffer(rest[: len(rest) - len(rest) % 2], dtype="<i2")
+        if len(samples):
+            mins.append(np.array([samples.min()], dtype=samples.dtype))
+            maxs.append(np.array([samples.max()], dtype=samples.dtype))
+        if not mins:
+            raise WaveformError("El audio no tiene muestras")
+        return np.concatenate(mins), np.concatenate(maxs)
+
+    def _write_levels(self, mins: np.ndarray, maxs: np.ndarray, levels: List[Path]):
+        for i, (spp, target) in enumerate(zip(LEVELS, levels)):
+            if i:
+                mins, maxs = reduce_peaks(mins, maxs)
+            # int16 -> int8: alcanza para dibujar y ocupa la mitad
+            data = np.empty(len(mins) * 2, dtype=np.int8)
+            data[0::2] = mins >> 8
+            data[1::2] = maxs >> 8
+            header = PEAKS_HEADER.pack(
+                PEAKS_MAGIC, PEAKS_VERSION, 8, WAVEFORM_SAMPLE_RATE, spp, len(mins)
+            )
+            # Temporal + rename: nunca se sirve un archivo a medio escribir
+            tmp = self._temp_path(target)
+            try:
+                with tmp.open("wb") as f:
+                    f.write(header)
+                    f.write(data.tobytes())
+                os.replace(tmp, target)
+            finally:
+                tmp.unlink(missing_ok=True)
+
+
+waveforms = WaveformService(BASE_DIR / "content" / "converted" / "peaks")
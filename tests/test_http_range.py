@@ -0,0 +1,90 @@
+import unittest
+
+from services.http_range import (
+    COALESCE_GAP,
+    MAX_RANGES,
+    RangeNotSatisfiable,
+    parse_range_header,
+)
+
+SIZE = 3_000_000
+
+
+class ParseRangeHeaderTest(unittest.TestCase):
+    def test_rango_simple(self):
+        self.assertEqual(parse_range_header("bytes=0-99", SIZE), [(0, 99)])
+
+    def test_rango_abierto(self):
+        self.assertEqual(parse_range_header("bytes=1000-", SIZE), [(1000, SIZE - 1)])
+
+    def test_fin_recortado_al_tamano(self):
+        self.assertEqual(
+            parse_range_header("bytes=100-9999999", SIZE), [(100, SIZE - 1)]
+        )
+
+    def test_sufijo(self):
+        self.assertEqual(
+            parse_range_header("bytes=-500", SIZE), [(SIZE - 500, SIZE - 1)]
+        )
+
+    def test_sufijo_mayor_que_el_archivo(self):
+        self.assertEqual(parse_range_header("bytes=-9999999", SIZE), [(0, SIZE - 1)])
+
+    def test_sufijo_cero_no_es_satisfacible(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header("bytes=-0", SIZE)
+
+    def test_inicio_pasado_el_final_abierto(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header("bytes=5000000-", SIZE)
+
+    def test_inicio_pasado_el_final_cerrado(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header("bytes=5000000-6000000", SIZE)
+
+    def test_descarta_solo_los_rangos_no_satisfacibles(self):
+        self.assertEqual(parse_range_header("bytes=5000000-, 0-9", SIZE), [(0, 9)])
+
+    def test_archivo_vacio(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header("bytes=0-", 0)
+
+    def test_fusiona_solapados(self):
+        self.assertEqual(parse_range_header("bytes=0-99, 50-199", SIZE), [(0, 199)])
+
+    def test_fusiona_cercanos_y_ordena(self):
+        near = 200 + COALESCE_GAP
+        far = 300 + COALESCE_GAP + 100
+        header = f"bytes={far}-{far + 10}, {near}-300, 100-199, 0-99"
+        self.assertEqual(parse_range_header(header, SIZE), [(0, 300), (far, far + 10)])
+
+    def test_no_fusiona_separados(self):
+        gap = COALESCE_GAP + 1
+        self.assertEqual(
+            parse_range_header(f"bytes=0-9, {10 + gap}-{20 + gap}", SIZE),
+            [(0, 9), (10 + gap, 20 + gap)],
+        )
+
+    def test_invalidos_se_ignoran(self):
+        for header in (
+            "bytes=abc-10",
+            "bytes=10-abc",
+            "bytes=10",
+            "bytes=20-10",
+            "bytes=",
+            "items=0-10",
+            "0-10",
+        ):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range_header(header, SIZE))
+
+    def test_demasiados_rangos(self):
+        step = COALESCE_GAP * 2
+        header = "bytes=" + ",".join(
+            f"{i * step}-{i * step}" for i in range(MAX_RANGES + 1)
+        )
+        self.assertIsNone(parse_range_header(header, SIZE))
+
+
+if __name__ == "__main__":
+    unittest.main()